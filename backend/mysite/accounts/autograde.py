@@ -0,0 +1,271 @@
+"""Автоматическая проверка тестов.
+
+Ключ ответов задания загружается один раз (два запроса) и компилируется
+в плоские структуры: номер столбца для каждого вопроса, веса в array('d'),
+битовые маски правильных вариантов, эталонный порядок для «соответствия»
+и нормализованные допустимые текстовые ответы. Ответы всех студентов
+выбираются одним запросом в виде кортежей и оцениваются за один проход
+без обращений к моделям, после чего оценки записываются одним upsert-запросом.
+
+Формат ответов в TestSubmission:
+
+* ``single`` — выбранный вариант в поле answer;
+* ``multiple`` — id выбранных вариантов через запятую в answer_text;
+* ``matching`` — id вариантов через запятую в порядке, выбранном студентом;
+* ``text`` — свободный ответ в answer_text.
+
+Частичный балл: для multiple — (верно отмеченные − ошибочно отмеченные) /
+число правильных, не меньше нуля; для matching — доля позиций на своем месте.
+
+Скомпилированный ключ кэшируется в памяти процесса и в общем кэше Django.
+Версия ключа — хеш содержимого вопросов и вариантов; в общем кэше хранится
+указатель «задание -> версия», который сбрасывается сигналами при изменении
+вопросов и вариантов. При теплом кэше get_answer_key делает одно обращение
+к кэшу и ни одного запроса к таблицам тестов.
+"""
+import hashlib
+import re
+import threading
+from array import array
+from collections import OrderedDict, namedtuple
+
+from django.core.cache import cache
+from django.db import transaction
+from django.utils import timezone
+
+from .fragments import homework_tag, schedule_invalidation
+from .gradebook import calculate_final_grade, schedule_version_bump
+from .metrics import GRADING_ACTIONS
+from .models import CourseStats, Grade, Homework, StudentCourseProgress, TestAnswer, TestQuestion, TestSubmission
+from .search import reindex_grades
+
+SINGLE, MULTIPLE, MATCHING, TEXT = range(4)
+QUESTION_KINDS = {'single': SINGLE, 'multiple': MULTIPLE, 'matching': MATCHING, 'text': TEXT}
+
+AUTOGRADE_COMMENT = 'Проверено автоматически'
+
+# Проверяются только сданные и еще не проверенные работы; проверенные —
+# лишь по явному overwrite, работы на доработке не трогаются никогда
+PENDING_STATUSES = ('submitted', 'late')
+OVERWRITE_STATUSES = PENDING_STATUSES + ('graded',)
+
+AutogradeResult = namedtuple('AutogradeResult', ['graded', 'max_points', 'scores'])
+
+WHITESPACE_RE = re.compile(r'\s+')
+
+ANSWER_KEY_CACHE_TIMEOUT = 24 * 60 * 60
+LOCAL_KEYS_LIMIT = 256
+
+# Ключи, уже собранные этим процессом: {assignment_id: AnswerKey}
+local_keys = OrderedDict()
+local_keys_lock = threading.Lock()
+
+
+def normalize_text(value):
+    return WHITESPACE_RE.sub(' ', value or '').strip().casefold()
+
+
+def parse_ids(value):
+    ids = []
+    for part in (value or '').split(','):
+        part = part.strip()
+        if part.isdigit():
+            ids.append(int(part))
+    return ids
+
+
+def popcount(mask):
+    return bin(mask).count('1')
+
+
+class AnswerKey:
+    """Скомпилированный ключ ответов одного задания"""
+
+    def __init__(self, assignment_id, questions, answers):
+        self.assignment_id = assignment_id
+        self.version = hashlib.sha1(repr((questions, answers)).encode()).hexdigest()
+        self.question_ids = [question_id for question_id, text, kind, points in questions]
+        self.columns = {question_id: column for column, question_id in enumerate(self.question_ids)}
+        self.kinds = array('b', [QUESTION_KINDS.get(kind, SINGLE) for question_id, text, kind, points in questions])
+        self.weights = array('d', [points for question_id, text, kind, points in questions])
+        self.total_points = sum(self.weights)
+
+        width = len(self.question_ids)
+        # Вариант ответа -> бит внутри своего вопроса (по порядку вариантов)
+        self.option_bits = {}
+        self.correct_masks = [0] * width
+        self.matching_orders = [()] * width
+        self.accepted_texts = [frozenset()] * width
+        options = [[] for _ in range(width)]
+        for answer_id, question_id, text, is_correct in answers:
+            column = self.columns.get(question_id)
+            if column is None:
+                continue
+            bit = 1 << len(options[column])
+            options[column].append(answer_id)
+            self.option_bits[answer_id] = bit
+            if is_correct:
+                self.correct_masks[column] |= bit
+        for column, kind in enumerate(self.kinds):
+            if kind == MATCHING:
+                # Эталон — варианты в порядке поля order
+                self.matching_orders[column] = tuple(options[column])
+            elif kind == TEXT:
+                self.accepted_texts[column] = frozenset(
+                    normalize_text(text) for answer_id, question_id, text, is_correct in answers
+                    if is_correct and self.columns.get(question_id) == column
+                )
+        self.correct_counts = array('i', [popcount(mask) for mask in self.correct_masks])
+
+    @classmethod
+    def load(cls, assignment_id):
+        questions = list(
+            TestQuestion.objects.filter(assignment_id=assignment_id)
+            .order_by('order', 'id').values_list('id', 'question_text', 'question_type', 'points')
+        )
+        answers = list(
+            TestAnswer.objects.filter(question__assignment_id=assignment_id)
+            .order_by('question_id', 'order', 'id').values_list('id', 'question_id', 'answer_text', 'is_correct')
+        )
+        return cls(assignment_id, questions, answers)
+
+    def credit(self, column, answer_id, answer_text):
+        """Доля балла за ответ на вопрос (от 0 до 1)"""
+        kind = self.kinds[column]
+        if kind == SINGLE:
+            return 1.0 if self.option_bits.get(answer_id, 0) & self.correct_masks[column] else 0.0
+        if kind == MULTIPLE:
+            selected = 0
+            for option_id in parse_ids(answer_text) or [answer_id]:
+                selected |= self.option_bits.get(option_id, 0)
+            correct = self.correct_masks[column]
+            if not self.correct_counts[column]:
+                return 0.0
+            hits = popcount(selected & correct) - popcount(selected & ~correct)
+            return max(hits, 0) / self.correct_counts[column]
+        if kind == MATCHING:
+            expected = self.matching_orders[column]
+            if not expected:
+                return 0.0
+            given = parse_ids(answer_text)
+            return sum(1 for left, right in zip(given, expected) if left == right) / len(expected)
+        return 1.0 if normalize_text(answer_text) in self.accepted_texts[column] else 0.0
+
+    def score(self, rows):
+        """Баллы по работам за один проход: rows — (homework_id, question_id, answer_id, answer_text)"""
+        slots = {}
+        totals = array('d')
+        columns = self.columns
+        weights = self.weights
+        for homework_id, question_id, answer_id, answer_text in rows:
+            slot = slots.get(homework_id)
+            if slot is None:
+                slot = slots[homework_id] = len(totals)
+                totals.append(0.0)
+            column = columns.get(question_id)
+            if column is not None:
+                totals[slot] += weights[column] * self.credit(column, answer_id, answer_text)
+        return {homework_id: totals[slot] for homework_id, slot in slots.items()}
+
+
+def answer_key_pointer(assignment_id):
+    return f'accounts:answer_key:{assignment_id}'
+
+
+def answer_key_data(assignment_id, version):
+    return f'accounts:answer_key:{assignment_id}:{version}'
+
+
+def get_answer_key(assignment_id):
+    """Скомпилированный ключ задания из памяти процесса, общего кэша или базы"""
+    pointer = answer_key_pointer(assignment_id)
+    version = cache.get(pointer)
+    if version is not None:
+        with local_keys_lock:
+            key = local_keys.get(assignment_id)
+            if key is not None and key.version == version:
+                local_keys.move_to_end(assignment_id)
+                return key
+        key = cache.get(answer_key_data(assignment_id, version))
+    else:
+        key = None
+    if key is None:
+        key = AnswerKey.load(assignment_id)
+        # Одинаковое содержимое дает ту же версию, поэтому данные можно не перезаписывать
+        cache.add(answer_key_data(assignment_id, key.version), key, ANSWER_KEY_CACHE_TIMEOUT)
+        cache.set(pointer, key.version, ANSWER_KEY_CACHE_TIMEOUT)
+    with local_keys_lock:
+        local_keys[assignment_id] = key
+        local_keys.move_to_end(assignment_id)
+        while len(local_keys) > LOCAL_KEYS_LIMIT:
+            local_keys.popitem(last=False)
+    return key
+
+
+def invalidate_answer_key(assignment_id):
+    """Сбрасывает указатель версии: следующий запрос соберет ключ заново"""
+    cache.delete(answer_key_pointer(assignment_id))
+
+
+def submission_rows(assignment_id, statuses=PENDING_STATUSES):
+    return TestSubmission.objects.filter(
+        homework__assignment_id=assignment_id, homework__status__in=statuses,
+    ).values_list('homework_id', 'question_id', 'answer_id', 'answer_text').order_by().iterator(chunk_size=5000)
+
+
+def autograde_assignment(assignment, teacher=None, key=None, overwrite=False):
+    """Оценивает сданные работы теста и сохраняет баллы одним upsert-запросом.
+
+    Без overwrite оцениваются только работы в статусах PENDING_STATUSES; с
+    overwrite — и уже проверенные. Комментарий преподавателя к оценке
+    сохраняется, заменяется только пустой или автоматический.
+    """
+    statuses = OVERWRITE_STATUSES if overwrite else PENDING_STATUSES
+    key = key or get_answer_key(assignment.id)
+    raw_scores = key.score(submission_rows(assignment.id, statuses))
+    if not raw_scores or not key.total_points:
+        return AutogradeResult(0, assignment.max_points, {})
+
+    commented = set(
+        Grade.objects.filter(homework__assignment_id=assignment.id, homework__status__in=statuses)
+        .exclude(comment__in=['', AUTOGRADE_COMMENT]).values_list('homework_id', flat=True)
+    )
+    teacher_id = teacher.id if teacher is not None else assignment.course.teacher_id
+    now = timezone.now()
+    scores = {}
+    grades = []
+    for homework_id, raw in raw_scores.items():
+        # Баллы теста приводятся к шкале задания
+        points = round(raw * assignment.max_points / key.total_points)
+        scores[homework_id] = points
+        grades.append(Grade(
+            homework_id=homework_id, teacher_id=teacher_id, points=points, comment=AUTOGRADE_COMMENT,
+            grade_value=calculate_final_grade(points * 100 / assignment.max_points if assignment.max_points else 0),
+            graded_at=now,
+        ))
+
+    with transaction.atomic():
+        for update_fields, batch in (
+            (['grade_value', 'points', 'comment', 'teacher', 'graded_at'],
+             [grade for grade in grades if grade.homework_id not in commented]),
+            (['grade_value', 'points', 'teacher', 'graded_at'],
+             [grade for grade in grades if grade.homework_id in commented]),
+        ):
+            if batch:
+                Grade.objects.bulk_create(
+                    batch,
+                    update_conflicts=True,
+                    unique_fields=['homework'],
+                    update_fields=update_fields,
+                    batch_size=2000,
+                )
+        Homework.objects.filter(assignment_id=assignment.id, id__in=list(scores), status__in=statuses).update(
+            status='graded', updated_at=now
+        )
+        reindex_grades(scores)
+        CourseStats.schedule_refresh([assignment.course_id])
+        StudentCourseProgress.schedule_refresh(assignment.course_id)
+        schedule_version_bump([assignment.course_id])
+        schedule_invalidation(homework_tag(homework_id) for homework_id in scores)
+    GRADING_ACTIONS.inc(len(grades), action='autograde')
+    return AutogradeResult(len(grades), assignment.max_points, scores)
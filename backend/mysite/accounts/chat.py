@@ -0,0 +1,419 @@
+"""Чат курса в реальном времени: WebSocket и SSE поверх ASGI.
+
+Новое сообщение сериализуется в JSON один раз, после фиксации транзакции,
+и брокер раздает готовую строку всем подписчикам комнаты. Подписчики не
+обращаются к базе за новыми сообщениями; база читается только при
+подключении, чтобы догнать пропущенное (``?after=<id>`` или Last-Event-ID).
+
+Брокер выбирается настройкой CHAT_BROKER. LocalBroker работает внутри одного
+процесса. Для нескольких воркеров нужна реализация того же интерфейса поверх
+внешней шины (Redis pub/sub, PostgreSQL LISTEN/NOTIFY): publish отправляет
+строку в шину, а фоновый слушатель передает ее в локальные очереди через
+deliver.
+
+История комнаты читается страницами фиксированного размера по ключу
+(room_id, id): стоимость страницы не зависит от того, насколько далеко
+пользователь пролистал. Имена отправителей берутся из кэша комнаты, а не
+соединением с таблицей пользователей.
+
+Очередь подписчика ограничена CHAT_SUBSCRIBER_QUEUE_SIZE. Медленный клиент
+не тормозит раздачу: при переполнении подписка закрывается, клиент
+переподключается и дочитывает пропущенное из базы.
+"""
+import asyncio
+import json
+import re
+import threading
+from http.cookies import SimpleCookie
+from importlib import import_module
+from types import SimpleNamespace
+from urllib.parse import parse_qs, urlsplit
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth import get_user
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import close_old_connections
+from django.utils.functional import cached_property
+from django.utils.module_loading import import_string
+
+from .models import ChatMessage, ChatRoom
+
+WEBSOCKET_PATH_RE = re.compile(r'/ws/chat/(?P<room_id>\d+)/')
+
+HISTORY_LIMIT = 100
+SENDER_NAMES_TIMEOUT = 60 * 60
+MESSAGE_MAX_LENGTH = 4000
+
+# Коды закрытия WebSocket из диапазона приложений
+CLOSE_NOT_FOUND = 4404
+CLOSE_FORBIDDEN = 4403
+CLOSE_OVERFLOW = 4008
+
+
+class SubscriptionClosed(Exception):
+    """Подписка закрыта брокером (переполнение очереди)"""
+
+
+class Subscription:
+    """Очередь сообщений одной комнаты для одного подключения"""
+
+    def __init__(self, room_id, maxsize):
+        self.room_id = room_id
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue(maxsize)
+        self.overflowed = False
+
+    def deliver(self, message_id, payload):
+        """Вызывается в цикле событий подписчика"""
+        if self.overflowed:
+            return
+        try:
+            self.queue.put_nowait((message_id, payload))
+        except asyncio.QueueFull:
+            self.overflowed = True
+            # Очередь полна, значит никто не ждет в get: освобождаем ее под сигнал закрытия
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.queue.put_nowait(None)
+
+    async def get(self):
+        item = await self.queue.get()
+        if item is None:
+            raise SubscriptionClosed
+        return item
+
+
+class Broker:
+    """Интерфейс брокера сообщений чата"""
+
+    def subscribe(self, room_id):
+        raise NotImplementedError
+
+    def unsubscribe(self, subscription):
+        raise NotImplementedError
+
+    def publish(self, room_id, message_id, payload):
+        """Отправляет готовую JSON-строку всем подписчикам комнаты; можно вызывать из любого потока"""
+        raise NotImplementedError
+
+
+class LocalBroker(Broker):
+    """Брокер в памяти процесса"""
+
+    def __init__(self):
+        self.rooms = {}
+        self.lock = threading.Lock()
+
+    def queue_size(self):
+        return getattr(settings, 'CHAT_SUBSCRIBER_QUEUE_SIZE', 256)
+
+    def subscribe(self, room_id):
+        subscription = Subscription(room_id, self.queue_size())
+        with self.lock:
+            self.rooms.setdefault(room_id, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self.lock:
+            subscribers = self.rooms.get(subscription.room_id)
+            if subscribers is not None:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self.rooms[subscription.room_id]
+
+    def subscriber_count(self, room_id=None):
+        with self.lock:
+            if room_id is not None:
+                return len(self.rooms.get(room_id, ()))
+            return sum(len(subscribers) for subscribers in self.rooms.values())
+
+    def publish(self, room_id, message_id, payload):
+        with self.lock:
+            subscribers = list(self.rooms.get(room_id, ()))
+        # Один переход в каждый цикл событий, а не по одному на подписчика
+        by_loop = {}
+        for subscription in subscribers:
+            by_loop.setdefault(subscription.loop, []).append(subscription)
+        for loop, group in by_loop.items():
+            try:
+                loop.call_soon_threadsafe(deliver_all, group, message_id, payload)
+            except RuntimeError:
+                # Цикл уже остановлен: его подписчики отключатся сами
+                continue
+
+
+def deliver_all(subscriptions, message_id, payload):
+    for subscription in subscriptions:
+        subscription.deliver(message_id, payload)
+
+
+class BrokerHolder:
+    @cached_property
+    def broker(self):
+        return import_string(getattr(settings, 'CHAT_BROKER', 'accounts.chat.LocalBroker'))()
+
+
+holder = BrokerHolder()
+
+
+def get_broker():
+    return holder.broker
+
+
+def message_payload(message, sender_name):
+    return json.dumps({
+        'id': message.id,
+        'room': message.room_id,
+        'sender': message.sender_id,
+        'sender_name': sender_name,
+        'message': message.message,
+        'timestamp': message.timestamp.isoformat(),
+    }, ensure_ascii=False, separators=(',', ':'))
+
+
+def full_name(first_name, last_name, username):
+    # Как User.get_full_name() с запасным вариантом — логином
+    return f'{first_name} {last_name}'.strip() or username
+
+
+def sender_names_key(room_id):
+    return f'accounts:chat_senders:{room_id}'
+
+
+def sender_names(room_id, sender_ids):
+    """Имена отправителей {user_id: имя} из кэша комнаты; недостающие — одним запросом"""
+    key = sender_names_key(room_id)
+    names = cache.get(key) or {}
+    missing = set(sender_ids) - names.keys()
+    if missing:
+        users = User.objects.filter(id__in=missing).values_list('id', 'first_name', 'last_name', 'username')
+        names.update((user_id, full_name(*parts)) for user_id, *parts in users)
+        cache.set(key, names, SENDER_NAMES_TIMEOUT)
+    return {sender_id: names[sender_id] for sender_id in set(sender_ids) if sender_id in names}
+
+
+def invalidate_sender_names(room_ids):
+    cache.delete_many([sender_names_key(room_id) for room_id in room_ids])
+
+
+def publish_message(message):
+    """Раздает сохраненное сообщение подписчикам комнаты"""
+    names = sender_names(message.room_id, [message.sender_id])
+    get_broker().publish(message.room_id, message.id, message_payload(message, names.get(message.sender_id, '')))
+
+
+def accessible_room(user, room_id):
+    """Комната, если пользователь — преподаватель курса или записанный на курс студент"""
+    if not user.is_authenticated:
+        return None
+    room = ChatRoom.objects.select_related('course').filter(pk=room_id).first()
+    if room is None:
+        return None
+    if user.is_staff or room.course.teacher_id == user.id:
+        return room
+    # Приватная комната — только для преподавателя курса и создателя
+    if room.is_private:
+        return room if room.created_by_id == user.id else None
+    return room if room.course.has_member(user) else None
+
+
+def post_message(user, room, text):
+    """Сохраняет сообщение; раздачу выполняет сигнал после фиксации транзакции"""
+    message = ChatMessage(room=room, sender=user, message=text)
+    message.save()
+    return message
+
+
+def clean_message(text):
+    if not isinstance(text, str):
+        return ''
+    return text.strip()[:MESSAGE_MAX_LENGTH]
+
+
+def history_page(room_id, before=None, after=None, limit=HISTORY_LIMIT, fields=('id', 'sender_id', 'message')):
+    """Страница сообщений комнаты в порядке отправки и признак того, что дальше есть еще.
+
+    after — сообщения новее указанного id, before — старше; без обоих — последние.
+    """
+    messages = ChatMessage.objects.filter(room_id=room_id)
+    if after is not None:
+        messages = messages.filter(id__gt=after).order_by('id')
+    else:
+        if before is not None:
+            messages = messages.filter(id__lt=before)
+        messages = messages.order_by('-id')
+    rows = list(messages.values_list(*fields)[:limit + 1])
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    if after is None:
+        rows.reverse()
+    return rows, has_more
+
+
+def history(room_id, after_id, limit=HISTORY_LIMIT):
+    """Сообщения комнаты после after_id — (id, JSON) в порядке отправки.
+
+    Без after_id — последние limit сообщений комнаты.
+    """
+    rows, has_more = history_page(
+        room_id, after=after_id or None, limit=limit,
+        fields=('id', 'room_id', 'sender_id', 'message', 'timestamp'),
+    )
+    names = sender_names(room_id, [row[2] for row in rows])
+    payloads = []
+    for row in rows:
+        message = ChatMessage(id=row[0], room_id=row[1], sender_id=row[2], message=row[3], timestamp=row[4])
+        payloads.append((message.id, message_payload(message, names.get(message.sender_id, ''))))
+    return payloads
+
+
+def parse_after(value):
+    try:
+        return max(int(value), 0)
+    except (TypeError, ValueError):
+        return 0
+
+
+def database_sync_to_async(func):
+    """sync_to_async, закрывающий устаревшие соединения с базой, как обработчик HTTP-запроса"""
+    def wrapper(*args, **kwargs):
+        close_old_connections()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            close_old_connections()
+    return sync_to_async(wrapper, thread_sensitive=True)
+
+
+def scope_headers(scope):
+    return {name.decode('latin1').lower(): value.decode('latin1') for name, value in scope.get('headers', [])}
+
+
+def scope_user(headers):
+    """Пользователь по сессионной cookie из заголовков ASGI-подключения"""
+    cookie = SimpleCookie()
+    cookie.load(headers.get('cookie', ''))
+    morsel = cookie.get(settings.SESSION_COOKIE_NAME)
+    engine = import_module(settings.SESSION_ENGINE)
+    session = engine.SessionStore(morsel.value if morsel else None)
+    return get_user(SimpleNamespace(session=session))
+
+
+def same_origin(headers):
+    # Браузер отправляет Origin при открытии WebSocket; чужой сайт не должен
+    # подключаться с cookie пользователя
+    origin = headers.get('origin')
+    if not origin:
+        return True
+    return urlsplit(origin).netloc == headers.get('host')
+
+
+def connect(headers, room_id):
+    user = scope_user(headers)
+    return user, accessible_room(user, room_id)
+
+
+async def replay_and_stream(subscription, room_id, after_id):
+    """Пропущенные сообщения из базы, затем новые из брокера без повторов"""
+    last_id = after_id
+    while True:
+        page = await database_sync_to_async(history)(room_id, last_id)
+        for message_id, payload in page:
+            last_id = message_id
+            yield message_id, payload
+        if len(page) < HISTORY_LIMIT:
+            break
+    while True:
+        message_id, payload = await subscription.get()
+        # Подписка оформлена до чтения истории, поэтому часть сообщений пришла дважды
+        if message_id > last_id:
+            last_id = message_id
+            yield message_id, payload
+
+
+async def websocket_application(scope, receive, send):
+    """ASGI-приложение WebSocket: /ws/chat/<room_id>/?after=<id>"""
+    event = await receive()
+    if event['type'] != 'websocket.connect':
+        return
+    match = WEBSOCKET_PATH_RE.fullmatch(scope['path'])
+    if match is None:
+        await send({'type': 'websocket.close', 'code': CLOSE_NOT_FOUND})
+        return
+    headers = scope_headers(scope)
+    room_id = int(match['room_id'])
+    user, room = await database_sync_to_async(connect)(headers, room_id)
+    if room is None or not same_origin(headers):
+        await send({'type': 'websocket.close', 'code': CLOSE_FORBIDDEN})
+        return
+
+    broker = get_broker()
+    subscription = broker.subscribe(room_id)
+    after_id = parse_after(parse_qs(scope.get('query_string', b'').decode()).get('after', [None])[0])
+    await send({'type': 'websocket.accept'})
+
+    async def read():
+        while True:
+            event = await receive()
+            if event['type'] == 'websocket.disconnect':
+                return
+            try:
+                data = json.loads(event.get('text') or '')
+            except ValueError:
+                continue
+            text = clean_message(data.get('message') if isinstance(data, dict) else None)
+            if text:
+                await database_sync_to_async(post_message)(user, room, text)
+
+    async def write():
+        try:
+            async for message_id, payload in replay_and_stream(subscription, room_id, after_id):
+                await send({'type': 'websocket.send', 'text': payload})
+        except SubscriptionClosed:
+            await send({'type': 'websocket.close', 'code': CLOSE_OVERFLOW})
+
+    tasks = [asyncio.ensure_future(read()), asyncio.ensure_future(write())]
+    try:
+        await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        broker.unsubscribe(subscription)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+
+async def event_stream(room_id, after_id):
+    """Поток Server-Sent Events с периодическими комментариями против таймаутов прокси.
+
+    Подписка оформляется при первом чтении, в цикле событий, который отдает
+    поток клиенту. Бесконечный поток работает только под ASGI: WSGI-сервер
+    попытался бы прочитать его целиком.
+    """
+    broker = get_broker()
+    heartbeat = getattr(settings, 'CHAT_SSE_HEARTBEAT', 15)
+    subscription = broker.subscribe(room_id)
+    stream = replay_and_stream(subscription, room_id, after_id)
+    pending = None
+    try:
+        yield 'retry: 3000\n\n'
+        while True:
+            if pending is None:
+                pending = asyncio.ensure_future(stream.__anext__())
+            done, _ = await asyncio.wait([pending], timeout=heartbeat)
+            if not done:
+                yield ': ping\n\n'
+                continue
+            try:
+                message_id, payload = pending.result()
+            except SubscriptionClosed:
+                return
+            pending = None
+            yield f'id: {message_id}\ndata: {payload}\n\n'
+    finally:
+        if pending is not None:
+            pending.cancel()
+            await asyncio.gather(pending, return_exceptions=True)
+        broker.unsubscribe(subscription)
+        await stream.aclose()
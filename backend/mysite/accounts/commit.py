@@ -0,0 +1,50 @@
+"""Работа после фиксации транзакции, собранная по всей транзакции.
+
+Сигналы срабатывают на каждую запись, и каскадное удаление курса вызывает их
+сотни раз для одного и того же курса. CommitBatch копит ключи (id курсов,
+теги) в наборе текущей транзакции и регистрирует в on_commit один обработчик,
+который получает все ключи разом. Вне транзакции обработчик вызывается сразу,
+как и on_commit.
+
+Набор привязан к зарегистрированному обработчику: если он пропал из очереди
+on_commit (транзакция зафиксирована или откачена, откачена точка сохранения)
+или уже вызван, следующий ключ начинает новый набор. Ключ попадает только
+в набор, который Django снимет при откате любой из открытых сейчас точек
+сохранения: внутри новой точки начинается свой набор, и при ее откате ключи
+пропадают вместе с обработчиком.
+"""
+from functools import partial
+
+from django.db import transaction
+
+
+class CommitBatch:
+    """Ключи транзакции и обработчик, вызываемый с ними один раз после фиксации"""
+
+    def __init__(self, handler):
+        self.handler = handler
+
+    def add(self, keys):
+        keys = set(keys)
+        if not keys:
+            return
+        connection = transaction.get_connection()
+        if not connection.in_atomic_block:
+            self.handler(keys)
+            return
+        savepoints = set(connection.savepoint_ids)
+        batches = connection.__dict__.setdefault('accounts_commit_batches', {})
+        pending = batches.get(self)
+        if pending is None or not any(
+            entry[1] is pending[1] and savepoints <= entry[0] for entry in connection.run_on_commit
+        ):
+            callback = partial(self.run, batches, set())
+            pending = batches[self] = (callback.args[1], callback)
+            transaction.on_commit(callback)
+        pending[0].update(keys)
+
+    def run(self, batches, keys):
+        # Вызванный набор закрыт: captureOnCommitCallbacks в тестах вызывает обработчик, не снимая его с очереди
+        if batches.get(self, (None,))[0] is keys:
+            del batches[self]
+        self.handler(keys)
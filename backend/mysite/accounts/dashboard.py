@@ -0,0 +1,71 @@
+"""Данные панели преподавателя для кэшируемых фрагментов teacher_dashboard.html.
+
+Все запросы выполняются лениво, при первом обращении из шаблона: если
+фрагменты взяты из кэша, панель отрисовывается без запросов к курсам и работам.
+"""
+from django.utils.functional import cached_property
+
+from .fragments import course_homeworks_tag, course_stats_tag, course_tag, homework_tag, teacher_tag
+from .models import Course, CourseStats, Homework
+
+RECENT_HOMEWORKS = 20
+
+
+class TeacherDashboard:
+    def __init__(self, teacher):
+        self.teacher = teacher
+
+    @cached_property
+    def courses(self):
+        """Курсы преподавателя вместе с денормализованной статистикой"""
+        courses = list(Course.objects.filter(teacher=self.teacher).select_related('stats'))
+        missing = [course.id for course in courses if not hasattr(course, 'stats')]
+        if missing:
+            # Статистика еще не построена (например, до запуска rebuild_course_stats)
+            CourseStats.refresh(missing)
+            courses = list(Course.objects.filter(teacher=self.teacher).select_related('stats'))
+        return courses
+
+    @cached_property
+    def course_ids(self):
+        if 'courses' in self.__dict__:
+            return [course.id for course in self.courses]
+        return list(Course.objects.filter(teacher=self.teacher).values_list('id', flat=True))
+
+    @cached_property
+    def pending_count(self):
+        return sum(course.stats.submitted for course in self.courses)
+
+    @cached_property
+    def graded_count(self):
+        return sum(course.stats.graded for course in self.courses)
+
+    def recent_homeworks(self):
+        return Homework.objects.filter(assignment__course__teacher=self.teacher).order_by('-submitted_at', '-id')
+
+    @cached_property
+    def homework_ids(self):
+        return list(self.recent_homeworks().values_list('id', flat=True)[:RECENT_HOMEWORKS])
+
+    @cached_property
+    def homeworks(self):
+        """Последние сданные работы для таблицы"""
+        return list(
+            self.recent_homeworks().select_related('student__user', 'assignment__course', 'grade')[:RECENT_HOMEWORKS]
+        )
+
+    @cached_property
+    def course_tags(self):
+        """Карточки курсов и сводные счетчики: набор курсов, курсы и их статистика"""
+        return [teacher_tag(self.teacher.id)] + [
+            tag for course_id in self.course_ids for tag in (course_tag(course_id), course_stats_tag(course_id))
+        ]
+
+    @cached_property
+    def homework_tags(self):
+        """Таблица работ: состав работ курсов, названия курсов и заданий, показанные работы"""
+        return (
+            [teacher_tag(self.teacher.id)]
+            + [tag for course_id in self.course_ids for tag in (course_tag(course_id), course_homeworks_tag(course_id))]
+            + [homework_tag(homework_id) for homework_id in self.homework_ids]
+        )
@@ -0,0 +1,355 @@
+"""Генератор синтетических данных для замеров производительности.
+
+В отличие от create_test_data.py, который создает несколько строк по одной,
+генератор строит базу заданного размера: преподаватели, группы, студенты,
+курсы, задания, работы с оценками, тесты с ответами, чат и вложения.
+Строки пишутся через bulk_create пачками, работы создаются потоком по курсам,
+поэтому память не растет с размером базы. При одном и том же seed и base_date
+содержимое базы (имена, статусы, баллы, ответы, даты, файлы) совпадает: имена
+и номера билетов берутся из счетчиков генератора, а не из id строк.
+
+Сигналы post_save при bulk_create не отправляются, поэтому статистика курсов,
+прогресс студентов, сигнатуры похожести и полнотекстовый индекс строятся
+самим генератором: сигнатуры — по каждой пачке работ, остальное — в конце.
+"""
+import random
+import time
+from collections import namedtuple
+from datetime import timedelta
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import Group, User
+from django.core.files.base import ContentFile
+from django.db import transaction
+from django.utils import timezone
+
+from .gradebook import calculate_final_grade
+from . import search
+from .models import (
+    Assignment, Attachment, ChatMessage, ChatRoom, Course, CourseEnrollment, CourseStats, Grade,
+    Homework, StudentCourseProgress, StudentGroup, StudentProfile, TeacherProfile, TestAnswer, TestQuestion,
+    TestSubmission,
+)
+from .roles import STUDENT, TEACHER, invalidate_teacher_ids
+from .similarity import update_signatures
+from .storage import acquire_blob
+
+GeneratedDataset = namedtuple('GeneratedDataset', ['course_ids', 'teacher_ids', 'counts', 'elapsed'])
+
+FIRST_NAMES = ['Алексей', 'Мария', 'Иван', 'Анна', 'Дмитрий', 'Елена', 'Сергей', 'Ольга', 'Павел', 'Наталья']
+LAST_NAMES = ['Иванов', 'Петрова', 'Сидоров', 'Кузнецова', 'Смирнов', 'Попова', 'Васильев', 'Новикова']
+SUBJECTS = ['Математика', 'Физика', 'Информатика', 'Химия', 'История', 'Английский язык']
+
+# Распределение статусов непроверенных работ
+PENDING_STATUSES = ['submitted'] * 6 + ['late'] * 2 + ['revision'] * 2
+QUESTION_TYPES = ['single', 'multiple', 'matching']
+ANSWERS_PER_QUESTION = 4
+
+
+class DatasetGenerator:
+    """Параметризованный генератор; generate() создает все данные в одной транзакции.
+
+    fill_rate — доля пар (студент, задание), для которых создана работа;
+    graded_ratio — доля проверенных среди созданных работ;
+    attachments_per_homework — среднее число вложений (может быть дробным);
+    write_files — записывать ли содержимое вложений в хранилище;
+    unsubmitted_rows — создавать для несданных пар работы в статусе «Назначено» без даты сдачи;
+    base_date — момент, от которого отсчитываются сроки и даты сдачи (по умолчанию — текущий).
+    """
+
+    def __init__(self, teachers=2, groups=4, students_per_group=25, courses=4, groups_per_course=2,
+                 assignments_per_course=10, fill_rate=0.9, graded_ratio=0.6, test_ratio=0.0,
+                 questions_per_test=5, chat_messages_per_course=0, attachments_per_homework=0.0,
+                 attachment_size=(16 * 1024, 256 * 1024), write_files=False, seed=0, prefix='gen',
+                 unsubmitted_rows=False, batch_size=5000, password='password123', base_date=None,
+                 progress=None):
+        if len(prefix) > 8:
+            raise ValueError('Префикс длиннее 8 символов не помещается в код группы и номер билета')
+        if min(teachers, groups, courses) < 1:
+            raise ValueError('Нужны хотя бы один преподаватель, одна группа и один курс')
+        self.teachers = teachers
+        self.groups = groups
+        self.students_per_group = students_per_group
+        self.courses = courses
+        self.groups_per_course = min(groups_per_course, groups)
+        self.assignments_per_course = assignments_per_course
+        self.fill_rate = fill_rate
+        self.graded_ratio = graded_ratio
+        self.test_ratio = test_ratio
+        self.questions_per_test = questions_per_test
+        self.chat_messages_per_course = chat_messages_per_course
+        self.attachments_per_homework = attachments_per_homework
+        self.attachment_size = attachment_size
+        self.write_files = write_files
+        self.unsubmitted_rows = unsubmitted_rows
+        self.seed = seed
+        self.prefix = prefix
+        self.batch_size = batch_size
+        self.password = password
+        self.base_date = base_date
+        self.progress = progress or (lambda message: None)
+
+    def generate(self):
+        started = time.perf_counter()
+        self.random = random.Random(self.seed)
+        self.now = (self.base_date or timezone.now()).replace(microsecond=0)
+        self.counts = dict.fromkeys(
+            ['teachers', 'students', 'courses', 'assignments', 'questions', 'homeworks', 'grades',
+             'test_submissions', 'attachments', 'chat_messages'], 0,
+        )
+        with transaction.atomic():
+            teacher_ids = self.create_teachers()
+            groups = self.create_students()
+            courses = self.create_courses(teacher_ids, groups)
+            for course, student_ids in courses:
+                self.create_course_work(course, student_ids)
+                self.create_chat(course, student_ids)
+            course_ids = [course.id for course, student_ids in courses]
+            CourseStats.refresh(course_ids)
+            StudentCourseProgress.refresh(course_ids)
+            if search.enabled():
+                search.rebuild()
+                self.progress('Полнотекстовый индекс перестроен')
+        invalidate_teacher_ids()
+        return GeneratedDataset(course_ids, teacher_ids, self.counts, time.perf_counter() - started)
+
+    def batches(self, rows):
+        batch = []
+        for row in rows:
+            batch.append(row)
+            if len(batch) >= self.batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+    def bulk_create(self, model, rows):
+        created = []
+        for batch in self.batches(rows):
+            created.extend(model.objects.bulk_create(batch))
+        return created
+
+    def person_name(self):
+        return self.random.choice(FIRST_NAMES), self.random.choice(LAST_NAMES)
+
+    def create_users(self, usernames, role):
+        password = make_password(self.password)
+        users = []
+        for username in usernames:
+            first_name, last_name = self.person_name()
+            users.append(User(username=username, password=password, first_name=first_name, last_name=last_name))
+        users = self.bulk_create(User, users)
+        group = Group.objects.get_or_create(name=role)[0]
+        self.bulk_create(User.groups.through, (
+            User.groups.through(user_id=user.id, group_id=group.id) for user in users
+        ))
+        return users
+
+    def create_teachers(self):
+        users = self.create_users((f'{self.prefix}_t{number}' for number in range(self.teachers)), TEACHER)
+        self.bulk_create(TeacherProfile, (
+            TeacherProfile(user=user, phone=f'+7 (900) 000-{number:04d}') for number, user in enumerate(users)
+        ))
+        self.counts['teachers'] = len(users)
+        self.progress(f'Преподаватели: {len(users)}')
+        return [user.id for user in users]
+
+    def create_students(self):
+        """Группы со студентами; возвращает список id профилей для каждой группы"""
+        groups = self.bulk_create(StudentGroup, (
+            StudentGroup(name=f'{self.prefix.upper()}-{number + 1}', code=f'{self.prefix}-{number}')
+            for number in range(self.groups)
+        ))
+        members = []
+        # Номер студента в генераторе: из него, а не из id строк, строятся логин, билет и текст ответа
+        self.student_numbers = {}
+        for group_number, group in enumerate(groups):
+            first = group_number * self.students_per_group
+            numbers = range(first, first + self.students_per_group)
+            users = self.create_users((f'{self.prefix}_s{number}' for number in numbers), STUDENT)
+            profiles = self.bulk_create(StudentProfile, (
+                StudentProfile(user=user, group=group, student_id=f'{self.prefix}-{number:06d}')
+                for number, user in zip(numbers, users)
+            ))
+            self.student_numbers.update((profile.id, number) for number, profile in zip(numbers, profiles))
+            members.append([profile.id for profile in profiles])
+            self.counts['students'] += len(profiles)
+        self.progress(f'Студенты: {self.counts["students"]}')
+        return members
+
+    def create_courses(self, teacher_ids, groups):
+        """Курсы, зачисления и задания; возвращает пары (курс, id студентов курса)"""
+        courses = self.bulk_create(Course, (
+            Course(
+                title=f'{SUBJECTS[number % len(SUBJECTS)]} {number + 1}', description='Синтетический курс',
+                teacher_id=teacher_ids[number % len(teacher_ids)],
+            )
+            for number in range(self.courses)
+        ))
+        result = []
+        for number, course in enumerate(courses):
+            first = number * self.groups_per_course
+            student_ids = [
+                student_id
+                for offset in range(self.groups_per_course)
+                for student_id in groups[(first + offset) % len(groups)]
+            ]
+            self.bulk_create(CourseEnrollment, (
+                CourseEnrollment(course=course, student_id=student_id) for student_id in student_ids
+            ))
+            result.append((course, student_ids))
+        self.counts['courses'] = len(courses)
+        return result
+
+    def create_assignments(self, course):
+        assignments = []
+        for number in range(self.assignments_per_course):
+            is_test = self.questions_per_test and self.random.random() < self.test_ratio
+            # Большая часть сроков уже прошла, последние задания еще открыты
+            due_date = self.now + timedelta(days=7 * (number - self.assignments_per_course + 2))
+            assignments.append(Assignment(
+                course=course, title=f'{"Тест" if is_test else "Задание"} {number + 1}', description='',
+                assignment_type='test' if is_test else 'homework', due_date=due_date,
+                max_points=self.questions_per_test * 10 if is_test else 100,
+            ))
+        assignments = self.bulk_create(Assignment, assignments)
+        self.counts['assignments'] += len(assignments)
+
+        answer_keys = {}
+        for assignment in assignments:
+            if assignment.assignment_type == 'test':
+                answer_keys[assignment.id] = self.create_questions(assignment)
+        return assignments, answer_keys
+
+    def create_questions(self, assignment):
+        """Вопросы теста с вариантами; возвращает [(вопрос, [варианты])]"""
+        questions = self.bulk_create(TestQuestion, (
+            TestQuestion(
+                assignment=assignment, question_text=f'Вопрос {number + 1}', points=10, order=number,
+                question_type=QUESTION_TYPES[number % len(QUESTION_TYPES)],
+            )
+            for number in range(self.questions_per_test)
+        ))
+        answers = []
+        for question in questions:
+            correct = self.random.randrange(ANSWERS_PER_QUESTION)
+            for number in range(ANSWERS_PER_QUESTION):
+                is_correct = number == correct or (question.question_type == 'multiple' and number % 2 == 1)
+                answers.append(TestAnswer(
+                    question=question, answer_text=f'Вариант {number + 1}', is_correct=is_correct, order=number,
+                ))
+        answers = self.bulk_create(TestAnswer, answers)
+        self.counts['questions'] += len(questions)
+        return [
+            (question, answers[index * ANSWERS_PER_QUESTION:(index + 1) * ANSWERS_PER_QUESTION])
+            for index, question in enumerate(questions)
+        ]
+
+    def homework_rows(self, assignments, student_ids):
+        for assignment in assignments:
+            for student_id in student_ids:
+                if self.random.random() >= self.fill_rate:
+                    if self.unsubmitted_rows:
+                        yield Homework(assignment=assignment, student_id=student_id, status='assigned')
+                    continue
+                if self.random.random() < self.graded_ratio:
+                    status = 'graded'
+                else:
+                    status = self.random.choice(PENDING_STATUSES)
+                hours = self.random.randint(1, 72)
+                submitted_at = assignment.due_date + timedelta(hours=hours if status == 'late' else -hours)
+                yield Homework(
+                    assignment=assignment, student_id=student_id, status=status, submitted_at=submitted_at,
+                    text_content=f'Ответ студента {self.student_numbers[student_id]}',
+                    priority=self.random.choice(['low', 'medium', 'medium', 'high']),
+                )
+
+    def create_course_work(self, course, student_ids):
+        assignments, answer_keys = self.create_assignments(course)
+        for batch in self.batches(self.homework_rows(assignments, student_ids)):
+            homeworks = Homework.objects.bulk_create(batch)
+            self.create_grades(course, homeworks)
+            self.create_test_submissions(homeworks, answer_keys)
+            self.create_attachments(homeworks)
+            update_signatures((homework.id, homework.assignment_id, homework.text_content) for homework in homeworks)
+            self.counts['homeworks'] += len(homeworks)
+        self.progress(f'{course.title}: работ всего {self.counts["homeworks"]}')
+
+    def create_grades(self, course, homeworks):
+        grades = []
+        for homework in homeworks:
+            if homework.status == 'graded':
+                max_points = homework.assignment.max_points
+                points = self.random.randint(max_points // 3, max_points)
+                grades.append(Grade(
+                    homework=homework, teacher_id=course.teacher_id, points=points,
+                    grade_value=calculate_final_grade(points * 100 / max_points),
+                ))
+            elif homework.status == 'revision':
+                grades.append(Grade(
+                    homework=homework, teacher_id=course.teacher_id, is_revision_request=True,
+                    revision_comment='Исправьте ошибки', revision_requested_at=homework.submitted_at,
+                ))
+        Grade.objects.bulk_create(grades)
+        self.counts['grades'] += len(grades)
+
+    def create_test_submissions(self, homeworks, answer_keys):
+        submissions = []
+        for homework in homeworks:
+            for question, answers in answer_keys.get(homework.assignment_id, ()):
+                correct = [answer for answer in answers if answer.is_correct]
+                # Примерно две трети ответов верные
+                answer = correct[0] if self.random.random() < 0.67 else self.random.choice(answers)
+                answer_text = ''
+                if question.question_type == 'multiple':
+                    chosen = correct if answer.is_correct else [answer]
+                    answer_text = ','.join(str(item.id) for item in chosen)
+                elif question.question_type == 'matching':
+                    order = [item.id for item in answers]
+                    if not answer.is_correct:
+                        self.random.shuffle(order)
+                    answer_text = ','.join(str(item) for item in order)
+                submissions.append(TestSubmission(
+                    homework=homework, question=question, answer=answer, answer_text=answer_text,
+                ))
+        for batch in self.batches(submissions):
+            TestSubmission.objects.bulk_create(batch)
+        self.counts['test_submissions'] += len(submissions)
+
+    def create_attachments(self, homeworks):
+        if not self.attachments_per_homework:
+            return
+        whole, fraction = divmod(self.attachments_per_homework, 1)
+        storage = Attachment._meta.get_field('file').storage
+        attachments = []
+        for homework in homeworks:
+            count = int(whole) + (self.random.random() < fraction)
+            for number in range(count):
+                size = self.random.randint(*self.attachment_size)
+                file_name = f'Решение {number + 1}.pdf'
+                name = f'homeworks/{homework.id}/answer{number + 1}.pdf'
+                if self.write_files:
+                    name = storage.save(name, ContentFile(self.random.randbytes(size)))
+                    acquire_blob(name, storage)
+                attachments.append(Attachment(homework=homework, file=name, file_name=file_name, file_size=size))
+        Attachment.objects.bulk_create(attachments)
+        self.counts['attachments'] += len(attachments)
+
+    def create_chat(self, course, student_ids):
+        if not self.chat_messages_per_course:
+            return
+        room = ChatRoom.objects.create(course=course, name='Общий чат', created_by_id=course.teacher_id)
+        profiles = dict(StudentProfile.objects.filter(id__in=student_ids[:50]).values_list('id', 'user_id'))
+        senders = [course.teacher_id] + list(profiles.values())
+        messages = self.bulk_create(ChatMessage, (
+            ChatMessage(room=room, sender_id=self.random.choice(senders), message=f'Сообщение {number + 1}')
+            for number in range(self.chat_messages_per_course)
+        ))
+        # auto_now_add ставит одно время всем строкам; разносим сообщения по последним суткам
+        start = self.now - timedelta(days=1)
+        step = timedelta(days=1) / max(len(messages), 1)
+        for message_number, message in enumerate(messages):
+            message.timestamp = start + step * message_number
+        for batch in self.batches(messages):
+            ChatMessage.objects.bulk_update(batch, ['timestamp'])
+        self.counts['chat_messages'] += len(messages)
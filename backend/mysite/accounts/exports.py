@@ -0,0 +1,97 @@
+"""Сборка ZIP-архивов с работами студентов"""
+import os
+
+from django.core.cache import cache
+from django.db.models import Prefetch
+from django.utils import timezone
+
+from .models import Attachment
+from .zipstream import RangeZipStream, ZipEntry
+
+
+def unique_arcname(name, used_names):
+    """Добавляет номер к имени файла, если такое имя уже есть в архиве"""
+    base, extension = os.path.splitext(name)
+    candidate = name
+    number = 1
+    while candidate in used_names:
+        candidate = f"{base} ({number}){extension}"
+        number += 1
+    used_names.add(candidate)
+    return candidate
+
+
+def safe_arcname(name):
+    """Убирает из имени символы, которые архиваторы трактуют как путь"""
+    return name.replace('/', '_').replace('\\', '_').strip() or '_'
+
+
+def zip_date_time(value):
+    return timezone.localtime(value).timetuple() if value else None
+
+
+def homework_zip_entries(homework, folder=''):
+    """Файлы архива для одной домашней работы: вложения, ответ и сведения о работе.
+
+    Даты файлов берутся из базы, поэтому для неизменной работы архив
+    получается побайтно одинаковым.
+    """
+    entries = []
+    used_names = set()
+    date_time = zip_date_time(homework.submitted_at or homework.updated_at)
+    
+    # Добавляем файлы вложений
+    for attachment in homework.attachments.all():
+        file_path = attachment.file.path
+        if os.path.exists(file_path):
+            name = unique_arcname(safe_arcname(attachment.file_name or os.path.basename(file_path)), used_names)
+            entries.append(ZipEntry(folder + name, path=file_path, date_time=zip_date_time(attachment.uploaded_at)))
+    
+    # Добавляем текстовый ответ, если есть
+    if homework.text_content:
+        name = unique_arcname('text_answer.txt', used_names)
+        entries.append(ZipEntry(folder + name, data=homework.text_content, date_time=date_time))
+    
+    # Добавляем информацию о задании
+    submitted_at = timezone.localtime(homework.submitted_at).strftime('%d.%m.%Y %H:%M') if homework.submitted_at else 'Не сдано'
+    info = f"""
+        Студент: {homework.student.user.get_full_name()}
+        Группа: {homework.student.group.name if homework.student.group else 'Не указана'}
+        Задание: {homework.assignment.title}
+        Курс: {homework.assignment.course.title}
+        Дата сдачи: {submitted_at}
+        Статус: {homework.get_status_display()}
+        """
+    entries.append(ZipEntry(folder + unique_arcname('info.txt', used_names), data=info, date_time=date_time))
+    return entries
+
+
+def student_folder(student):
+    """Папка студента в общем архиве: «Фамилия Имя (Группа)»"""
+    name = f"{student.user.last_name} {student.user.first_name}".strip() or student.user.username
+    if student.group:
+        name = f"{name} ({student.group.name})"
+    return safe_arcname(name)
+
+
+def assignment_zip_stream(assignment):
+    """Архив со всеми сданными работами по заданию, по папке на студента.
+
+    Работы, студенты, группы и вложения загружаются двумя запросами.
+    Файлы хранятся без сжатия, чтобы размер архива был известен заранее
+    и прерванную загрузку можно было продолжить запросом Range.
+    """
+    homeworks = assignment.homeworks.exclude(
+        status__in=['assigned', 'missed']
+    ).select_related(
+        'student__user', 'student__group', 'assignment__course'
+    ).prefetch_related(
+        Prefetch('attachments', queryset=Attachment.objects.order_by('homework_id', 'id'))
+    ).order_by('student__user__last_name', 'student__user__first_name', 'id')
+    
+    entries = []
+    used_folders = set()
+    for homework in homeworks:
+        folder = unique_arcname(student_folder(homework.student), used_folders)
+        entries.extend(homework_zip_entries(homework, folder + '/'))
+    return RangeZipStream(entries, crc_cache=cache)
@@ -0,0 +1,96 @@
+"""Кэш фрагментов шаблонов с инвалидацией по тегам.
+
+Фрагмент хранится вместе с версиями тегов, от которых он зависит (курс,
+статистика курса, показанные работы). Версия тега — отдельный ключ кэша;
+инвалидация просто удаляет эти ключи, поэтому нужны только get_many, add и
+delete_many — они есть и у локального, и у файлового кэша Django.
+
+При чтении фрагмента версии его тегов сверяются одним get_many: если хоть
+один тег удален или заменен, фрагмент отрисовывается заново. Версии тегов
+читаются до запроса данных, поэтому изменение, зафиксированное во время
+отрисовки, не потеряется: фрагмент сохранится со старой версией тега.
+"""
+import hashlib
+import uuid
+
+from django.core.cache import cache
+
+from .commit import CommitBatch
+
+FRAGMENT_TIMEOUT = 24 * 3600
+# Тег без срока жизни: вытеснение тега из кэша лишь инвалидирует фрагменты
+TAG_TIMEOUT = None
+
+
+def teacher_tag(teacher_id):
+    """Набор курсов преподавателя"""
+    return f'teacher:{teacher_id}'
+
+
+def course_tag(course_id):
+    """Курс и его задания: названия, сроки, максимальные баллы"""
+    return f'course:{course_id}'
+
+
+def course_stats_tag(course_id):
+    """Счетчики CourseStats курса"""
+    return f'course-stats:{course_id}'
+
+
+def course_homeworks_tag(course_id):
+    """Состав и порядок работ курса: новые, удаленные, сданные"""
+    return f'course-homeworks:{course_id}'
+
+
+def homework_tag(homework_id):
+    """Работа, ее оценка и имя студента"""
+    return f'homework:{homework_id}'
+
+
+def tag_key(tag):
+    return f'accounts:fragment-tag:{tag}'
+
+
+def fragment_key(name, vary):
+    digest = hashlib.sha1(repr([str(value) for value in vary]).encode()).hexdigest()
+    return f'accounts:fragment:{name}:{digest}'
+
+
+def tag_versions(tags):
+    """Текущие версии тегов {ключ тега: версия}; недостающие создаются"""
+    keys = [tag_key(tag) for tag in dict.fromkeys(tags)]
+    versions = cache.get_many(keys)
+    for key in keys:
+        if key not in versions:
+            cache.add(key, uuid.uuid4().hex, TAG_TIMEOUT)
+            versions[key] = cache.get(key)
+    return versions
+
+
+def get_fragment(key):
+    """HTML фрагмента или None, если его нет или изменился хоть один тег"""
+    entry = cache.get(key)
+    if entry is None:
+        return None
+    html, versions = entry
+    if versions and cache.get_many(list(versions)) != versions:
+        return None
+    return html
+
+
+def set_fragment(key, html, versions):
+    cache.set(key, (html, versions), FRAGMENT_TIMEOUT)
+
+
+def invalidate_tags(tags):
+    tags = list(dict.fromkeys(tags))
+    if tags:
+        cache.delete_many([tag_key(tag) for tag in tags])
+
+
+tag_invalidations = CommitBatch(invalidate_tags)
+
+
+def schedule_invalidation(tags):
+    """Инвалидирует теги после фиксации транзакции одним delete_many: до нее читатели видят старые данные"""
+    tag_invalidations.add(tags)
@@ -0,0 +1,192 @@
+"""Построение журнала успеваемости за постоянное число запросов"""
+import hashlib
+from array import array
+from collections import namedtuple
+
+from django.db.models import F
+
+from .commit import CommitBatch
+from .models import Assignment, Course, CourseEnrollment, Homework
+
+# Отрисованный журнал кэшируется по версиям курсов; устаревшие ключи просто истекают
+RESPONSE_CACHE_TIMEOUT = 24 * 3600
+
+# Код статуса 0 зарезервирован под «работа не создана»
+MISSING_STATUS = 'Не сдано'
+STATUS_CODES = {code: index for index, (code, label) in enumerate(Homework.STATUS_CHOICES, 1)}
+STATUS_LABELS = [MISSING_STATUS] + [label for code, label in Homework.STATUS_CHOICES]
+
+GradebookCell = namedtuple('GradebookCell', ['assignment', 'grade', 'max', 'status'])
+
+
+def calculate_final_grade(progress):
+    """Рассчитывает итоговую оценку на основе прогресса"""
+    if progress >= 85:
+        return 5
+    elif progress >= 70:
+        return 4
+    elif progress >= 55:
+        return 3
+    elif progress >= 40:
+        return 2
+    else:
+        return 1
+
+
+class GradebookRow:
+    """Строка журнала: баллы и коды статусов по заданиям курса.
+
+    Наличие оценки хранится отдельной маской graded, а не особым значением
+    баллов: баллы могут быть любым целым, в том числе отрицательным.
+    """
+    __slots__ = ('gradebook', 'student_id', 'student', 'group', 'points', 'graded', 'statuses')
+
+    def __init__(self, gradebook, student_id, student, group):
+        self.gradebook = gradebook
+        self.student_id = student_id
+        self.student = student
+        self.group = group
+        width = len(gradebook.assignment_ids)
+        self.points = array('q', [0]) * width
+        self.graded = bytearray(width)
+        self.statuses = array('b', [0]) * width
+
+    @property
+    def grades(self):
+        """Ячейки строки в виде, удобном для шаблона"""
+        titles = self.gradebook.assignment_titles
+        max_points = self.gradebook.max_points
+        for column, points in enumerate(self.points):
+            yield GradebookCell(
+                titles[column],
+                points if self.graded[column] else None,
+                max_points[column],
+                STATUS_LABELS[self.statuses[column]],
+            )
+
+    @property
+    def total_points(self):
+        return sum(points for points, graded in zip(self.points, self.graded) if graded)
+
+    @property
+    def max_points(self):
+        max_points = self.gradebook.max_points
+        return sum(points for points, graded in zip(max_points, self.graded) if graded)
+
+    @property
+    def progress(self):
+        max_points = self.max_points
+        if max_points > 0:
+            return (self.total_points / max_points) * 100
+        return 0
+
+    @property
+    def final_grade(self):
+        return calculate_final_grade(self.progress)
+
+
+class CourseGradebook:
+    """Матрица студенты × задания для одного курса"""
+
+    def __init__(self, course, assignments):
+        self.course = course
+        self.assignment_ids = [assignment_id for assignment_id, title, max_points in assignments]
+        self.assignment_titles = [title for assignment_id, title, max_points in assignments]
+        self.max_points = array('i', [max_points for assignment_id, title, max_points in assignments])
+        self.columns = {assignment_id: column for column, assignment_id in enumerate(self.assignment_ids)}
+        self.rows = []
+        self.row_index = {}
+
+    def add_student(self, student_id, name, group):
+        row = GradebookRow(self, student_id, name, group)
+        self.row_index[student_id] = row
+        self.rows.append(row)
+        return row
+
+    def set_cell(self, student_id, assignment_id, status, points):
+        row = self.row_index.get(student_id)
+        column = self.columns.get(assignment_id)
+        if row is None or column is None:
+            return
+        row.statuses[column] = STATUS_CODES.get(status, 0)
+        if points is not None:
+            row.points[column] = points
+            row.graded[column] = 1
+
+    def __iter__(self):
+        return iter(self.rows)
+
+    def __len__(self):
+        return len(self.rows)
+
+
+def build_gradebooks(courses):
+    """Строит журналы для набора курсов.
+
+    Выполняет три запроса независимо от числа курсов, студентов и заданий:
+    зачисления, задания и работы вместе с оценками. Как и в
+    StudentCourseProgress.refresh, в журнал попадают только активные зачисления.
+    """
+    courses = list(courses)
+    course_ids = [course.id for course in courses]
+    gradebooks = {}
+
+    assignments_by_course = {course_id: [] for course_id in course_ids}
+    assignment_course = {}
+    for assignment_id, course_id, title, max_points in (
+        Assignment.objects.filter(course_id__in=course_ids)
+        .values_list('id', 'course_id', 'title', 'max_points')
+    ):
+        assignments_by_course[course_id].append((assignment_id, title, max_points))
+        assignment_course[assignment_id] = course_id
+
+    for course in courses:
+        gradebooks[course.id] = CourseGradebook(course, assignments_by_course[course.id])
+
+    enrollments = CourseEnrollment.objects.filter(course_id__in=course_ids, is_active=True).values_list(
+        'course_id', 'student_id', 'student__user__first_name', 'student__user__last_name',
+        'student__group__name',
+    ).order_by('student__user__last_name', 'student__user__first_name', 'student_id')
+    for course_id, student_id, first_name, last_name, group_name in enrollments:
+        name = f"{first_name} {last_name}".strip()
+        gradebooks[course_id].add_student(student_id, name, group_name or '')
+
+    homeworks = Homework.objects.filter(assignment__course_id__in=course_ids).values_list(
+        'assignment_id', 'student_id', 'status', 'grade__points',
+    )
+    for assignment_id, student_id, status, points in homeworks:
+        gradebooks[assignment_course[assignment_id]].set_cell(student_id, assignment_id, status, points)
+
+    return [gradebooks[course_id] for course_id in course_ids]
+
+
+def bump_versions(course_ids):
+    """Увеличивает версию журнала курсов: закэшированные ответы и ETag перестают совпадать"""
+    course_ids = [course_id for course_id in course_ids if course_id is not None]
+    if course_ids:
+        Course.objects.filter(id__in=course_ids).update(gradebook_version=F('gradebook_version') + 1)
+
+
+version_bumps = CommitBatch(bump_versions)
+
+
+def schedule_version_bump(course_ids):
+    """Увеличивает версии курсов после фиксации, одним UPDATE на всю транзакцию.
+
+    Версия меняется после данных, поэтому ответ, отрисованный между фиксацией
+    и UPDATE, может попасть в кэш под старой версией — он уже новый и
+    вытесняется следующим же изменением версии.
+    """
+    version_bumps.add(course_id for course_id in course_ids if course_id is not None)
+
+
+def gradebook_fingerprint(teacher_id, courses, selected_course_id, csrf_secret):
+    """Отпечаток журнала: преподаватель, версии и даты изменения курсов.
+
+    csrf_secret разделяет ответы разных браузеров: в отрисованной странице есть CSRF-токен.
+    """
+    parts = [str(teacher_id), str(selected_course_id or ''), csrf_secret]
+    parts.extend(
+        f'{course.id}:{course.gradebook_version}:{course.updated_at.timestamp()}' for course in courses
+    )
+    return hashlib.sha1('|'.join(parts).encode()).hexdigest()
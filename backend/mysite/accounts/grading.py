@@ -0,0 +1,213 @@
+"""Пакетная проверка работ и массовый запрос доработки.
+
+Все элементы проверяются за один проход и одним запросом к базе, после чего
+оценки записываются одним upsert-запросом, а статусы работ — одним UPDATE.
+Сигналы post_save при этом не отправляются, поэтому статистика курсов
+пересчитывается явно после фиксации транзакции, а комментарии оценок
+переиндексируются для поиска явно.
+"""
+import re
+from functools import partial
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .fragments import homework_tag, schedule_invalidation
+from .gradebook import schedule_version_bump
+from .metrics import GRADING_ACTIONS
+from .search import reindex_grades
+from .models import CourseStats, Grade, Homework, HomeworkHistory, StudentCourseProgress
+
+
+class BatchError(Exception):
+    """Пакет целиком не может быть обработан (неверный формат или размер)"""
+
+
+# Доработку можно запросить только по работе, которую студент сдал
+REVISABLE_STATUSES = ('submitted', 'late', 'graded', 'revision')
+
+INTEGER_RE = re.compile(r'[+-]?[0-9]{1,18}')
+# Границы BIGINT: большее число база не примет
+MIN_INT, MAX_INT = -2 ** 63, 2 ** 63 - 1
+
+
+def max_batch_size():
+    return getattr(settings, 'BATCH_GRADING_MAX_ITEMS', 500)
+
+
+def parse_int(value):
+    """Целое число из JSON: int или строка из цифр; дробные и bool не принимаются"""
+    # bool — подкласс int, но true/false в JSON не являются баллами
+    if type(value) is str and INTEGER_RE.fullmatch(value.strip()):
+        value = int(value)
+    if type(value) is not int:
+        raise ValueError
+    if not MIN_INT <= value <= MAX_INT:
+        raise OverflowError
+    return value
+
+
+def validate_items(items):
+    """Проверяет формат элементов; возвращает {homework_id: данные} и ошибки по позициям"""
+    if not isinstance(items, list) or not items:
+        raise BatchError('Ожидается непустой список оценок')
+    if len(items) > max_batch_size():
+        raise BatchError(f'Не больше {max_batch_size()} оценок за один запрос')
+
+    valid = {}
+    errors = {}
+    for position, item in enumerate(items):
+        try:
+            homework_id = parse_int(item['homework_id'])
+            grade_value = parse_int(item['grade_value'])
+            points = parse_int(item.get('points', 0))
+            comment = item.get('comment', '') or ''
+            if not isinstance(comment, str):
+                raise ValueError
+        except (KeyError, TypeError, ValueError, OverflowError, AttributeError):
+            errors[position] = 'Некорректные данные'
+            continue
+        if grade_value < 1 or grade_value > 5:
+            errors[position] = 'Оценка должна быть от 1 до 5'
+        elif points < 0:
+            errors[position] = 'Баллы не могут быть отрицательными'
+        elif homework_id in valid:
+            errors[position] = 'Работа указана в пакете повторно'
+        else:
+            valid[homework_id] = {
+                'position': position, 'grade_value': grade_value, 'points': points, 'comment': comment,
+            }
+    return valid, errors
+
+
+def grade_homeworks(teacher, items):
+    """Выставляет оценки пакетом; возвращает результаты в порядке элементов запроса"""
+    valid, errors = validate_items(items)
+
+    homeworks = Homework.objects.filter(
+        id__in=list(valid), assignment__course__teacher=teacher
+    ).values_list('id', 'assignment__max_points', 'assignment__course_id')
+    found = {homework_id: (max_points, course_id) for homework_id, max_points, course_id in homeworks}
+
+    grades = []
+    course_ids = set()
+    now = timezone.now()
+    for homework_id, data in valid.items():
+        if homework_id not in found:
+            errors[data['position']] = 'Работа не найдена'
+            continue
+        max_points, course_id = found[homework_id]
+        if data['points'] > max_points:
+            errors[data['position']] = f'Баллы должны быть от 0 до {max_points}'
+            continue
+        grades.append(Grade(
+            homework_id=homework_id, teacher=teacher, grade_value=data['grade_value'],
+            points=data['points'], comment=data['comment'], graded_at=now,
+        ))
+        course_ids.add(course_id)
+
+    if grades:
+        with transaction.atomic():
+            Grade.objects.bulk_create(
+                grades,
+                update_conflicts=True,
+                unique_fields=['homework'],
+                update_fields=['grade_value', 'points', 'comment', 'teacher', 'graded_at'],
+            )
+            homework_ids = [grade.homework_id for grade in grades]
+            Homework.objects.filter(id__in=homework_ids).update(status='graded', updated_at=now)
+            reindex_grades(homework_ids)
+            CourseStats.schedule_refresh(course_ids)
+            transaction.on_commit(partial(StudentCourseProgress.refresh_homeworks, homework_ids))
+            schedule_version_bump(course_ids)
+            schedule_invalidation(homework_tag(homework_id) for homework_id in homework_ids)
+        GRADING_ACTIONS.inc(len(grades), action='grade')
+
+    graded = {grade.homework_id: grade for grade in grades}
+    results = []
+    for position, item in enumerate(items):
+        if position in errors:
+            homework_id = item.get('homework_id') if isinstance(item, dict) else None
+            results.append({'homework_id': homework_id, 'success': False, 'error': errors[position]})
+            continue
+        homework_id = parse_int(item['homework_id'])
+        grade = graded[homework_id]
+        results.append({
+            'homework_id': homework_id, 'success': True,
+            'grade': grade.grade_value, 'points': grade.points, 'grade_display': grade.grade_with_text,
+        })
+    return results
+
+
+def revision_queryset(teacher, homework_ids=None, status=None, course=None):
+    """Работы преподавателя по явному списку id или по фильтрам списка работ.
+
+    Все работы преподавателя выбираются только явным фильтром («all»):
+    запрос без id и без фильтров — ошибка, а не «все работы».
+    """
+    homeworks = Homework.objects.filter(
+        assignment__course__teacher=teacher, status__in=REVISABLE_STATUSES
+    )
+    if homework_ids is not None:
+        if not isinstance(homework_ids, list) or not homework_ids:
+            raise BatchError('Ожидается непустой список работ')
+        try:
+            homework_ids = [parse_int(homework_id) for homework_id in homework_ids]
+        except (TypeError, ValueError, OverflowError):
+            raise BatchError('Некорректный список работ')
+        return homeworks.filter(id__in=homework_ids)
+    if not status and not course:
+        raise BatchError('Укажите работы или фильтр')
+    if status and status != 'all':
+        homeworks = homeworks.filter(status=status)
+    if course and course != 'all':
+        try:
+            homeworks = homeworks.filter(assignment__course_id=parse_int(course))
+        except (TypeError, ValueError, OverflowError):
+            raise BatchError('Некорректный курс')
+    return homeworks
+
+
+def request_revisions(teacher, comment, homeworks):
+    """Отправляет работы на доработку; возвращает id затронутых работ"""
+    if not comment:
+        raise BatchError('Укажите комментарий с замечаниями')
+    rows = list(homeworks.values_list('id', 'assignment__course_id')[:max_batch_size() + 1])
+    if len(rows) > max_batch_size():
+        raise BatchError(f'Не больше {max_batch_size()} работ за один запрос')
+    if not rows:
+        return []
+
+    homework_ids = [homework_id for homework_id, course_id in rows]
+    now = timezone.now()
+    with transaction.atomic():
+        Homework.objects.filter(id__in=homework_ids).update(status='revision', updated_at=now)
+        # Баллы и оценка уже проверенных работ сохраняются, как в request_revision
+        Grade.objects.bulk_create(
+            [
+                Grade(
+                    homework_id=homework_id, teacher=teacher, comment=comment, is_revision_request=True,
+                    revision_comment=comment, revision_requested_at=now, graded_at=now,
+                )
+                for homework_id in homework_ids
+            ],
+            update_conflicts=True,
+            unique_fields=['homework'],
+            update_fields=[
+                'teacher', 'comment', 'is_revision_request', 'revision_comment', 'revision_requested_at', 'graded_at',
+            ],
+        )
+        HomeworkHistory.objects.bulk_create(
+            HomeworkHistory(
+                homework_id=homework_id, changed_by=teacher, change_description=f'Запрошена доработка: {comment}',
+            )
+            for homework_id in homework_ids
+        )
+        reindex_grades(homework_ids)
+        CourseStats.schedule_refresh({course_id for _, course_id in rows})
+        transaction.on_commit(partial(StudentCourseProgress.refresh_homeworks, homework_ids))
+        schedule_version_bump({course_id for _, course_id in rows})
+        schedule_invalidation(homework_tag(homework_id) for homework_id in homework_ids)
+    GRADING_ACTIONS.inc(len(homework_ids), action='revision')
+    return homework_ids
@@ -0,0 +1,46 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+
+from accounts.autograde import OVERWRITE_STATUSES, AnswerKey, autograde_assignment, submission_rows
+from accounts.datagen import DatasetGenerator
+from accounts.models import Assignment
+
+
+class Command(BaseCommand):
+    help = 'Замеряет автоматическую проверку теста на синтетическом потоке студентов'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--students', type=int, default=2000)
+        parser.add_argument('--questions', type=int, default=20)
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            dataset = DatasetGenerator(
+                teachers=1, groups=1, students_per_group=options['students'], courses=1,
+                assignments_per_course=1, fill_rate=1, test_ratio=1, questions_per_test=options['questions'],
+                prefix='bauto',
+            ).generate()
+            assignment = Assignment.objects.select_related('course').get(course_id=dataset.course_ids[0])
+            self.stdout.write(f"Ответов в тесте: {dataset.counts['test_submissions']}")
+
+            with CaptureQueriesContext(connection) as queries:
+                started = time.perf_counter()
+                key = AnswerKey.load(assignment.id)
+                loaded = time.perf_counter()
+                scores = key.score(submission_rows(assignment.id, OVERWRITE_STATUSES))
+                scored = time.perf_counter()
+                result = autograde_assignment(assignment, key=key, overwrite=True)
+                finished = time.perf_counter()
+            transaction.set_rollback(True)
+
+        self.stdout.write(
+            f'Ключ: {(loaded - started) * 1000:.0f} мс, подсчет: {(scored - loaded) * 1000:.0f} мс '
+            f'({len(scores)} работ)'
+        )
+        self.stdout.write(
+            f'Полная проверка с записью: {(finished - scored) * 1000:.0f} мс, '
+            f'оценено работ: {result.graded}, запросов всего: {len(queries)}'
+        )
@@ -0,0 +1,51 @@
+import time
+
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+
+from accounts.chat import history_page, sender_names, sender_names_key
+from accounts.datagen import DatasetGenerator
+from accounts.models import ChatRoom
+
+
+class Command(BaseCommand):
+    help = 'Замеряет страницы истории чата на разной глубине прокрутки большой комнаты'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--messages', type=int, default=500000)
+        parser.add_argument('--page-size', type=int, default=50)
+        parser.add_argument('--repeat', type=int, default=20)
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            started = time.perf_counter()
+            dataset = DatasetGenerator(
+                teachers=1, groups=1, students_per_group=50, courses=1, assignments_per_course=0,
+                chat_messages_per_course=options['messages'], prefix='bchat',
+            ).generate()
+            room = ChatRoom.objects.get(course_id=dataset.course_ids[0])
+            self.stdout.write(
+                f"Сообщений в комнате: {dataset.counts['chat_messages']} "
+                f'({time.perf_counter() - started:.1f} с на генерацию)'
+            )
+            newest = room.messages.latest('id').id
+            oldest = room.messages.earliest('id').id
+            cache.delete(sender_names_key(room.id))
+
+            for depth in (0, 0.01, 0.5, 0.99):
+                before = newest + 1 - int((newest - oldest) * depth)
+                timings = []
+                for _ in range(options['repeat']):
+                    with CaptureQueriesContext(connection) as queries:
+                        page_started = time.perf_counter()
+                        rows, has_more = history_page(room.id, before=before, limit=options['page_size'])
+                        sender_names(room.id, [sender_id for _, sender_id, _ in rows])
+                        timings.append(time.perf_counter() - page_started)
+                timings.sort()
+                self.stdout.write(
+                    f'Глубина {depth:>4.0%}: медиана {timings[len(timings) // 2] * 1000:.2f} мс, '
+                    f'{len(rows)} сообщений, запросов на страницу: {len(queries)}'
+                )
+            transaction.set_rollback(True)
@@ -0,0 +1,67 @@
+import tempfile
+import time
+
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext, override_settings
+
+from accounts.datagen import DatasetGenerator
+from accounts.exports import assignment_zip_stream
+from accounts.models import Assignment
+
+
+class Command(BaseCommand):
+    help = 'Замеряет скорость выгрузки всех работ по заданию одним архивом'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--students', type=int, default=500)
+        parser.add_argument('--files', type=int, default=2, help='Вложений на студента')
+        parser.add_argument('--file-size', type=int, default=256, help='Размер вложения в КБ')
+
+    def handle(self, *args, **options):
+        with tempfile.TemporaryDirectory() as media_root, override_settings(MEDIA_ROOT=media_root):
+            with transaction.atomic():
+                assignment = self.create_assignment(
+                    options['students'], options['files'], options['file_size'] * 1024
+                )
+
+                with CaptureQueriesContext(connection) as queries:
+                    started = time.perf_counter()
+                    stream = assignment_zip_stream(assignment)
+                    build_ms = (time.perf_counter() - started) * 1000
+                self.stdout.write(
+                    f'Подготовка: {len(stream.entries)} файлов, {stream.size / 2 ** 20:.1f} МБ, '
+                    f'{len(queries)} запросов, {build_ms:.0f} мс'
+                )
+
+                cache.clear()
+                self.report('Полная выгрузка', assignment_zip_stream(assignment), 0)
+                middle = stream.size // 2
+                cache.clear()
+                self.report('Докачка с середины, CRC не в кэше', assignment_zip_stream(assignment), middle)
+                self.report('Докачка с середины, CRC в кэше', assignment_zip_stream(assignment), middle)
+                transaction.set_rollback(True)
+
+    def report(self, label, stream, start):
+        started = time.perf_counter()
+        first_byte = None
+        total = 0
+        for chunk in stream.iter_range(start, stream.size - 1):
+            if first_byte is None:
+                first_byte = time.perf_counter() - started
+            total += len(chunk)
+        elapsed = time.perf_counter() - started
+        self.stdout.write(
+            f'{label}: {total / 2 ** 20:.1f} МБ за {elapsed:.2f} с, '
+            f'{total / 2 ** 20 / elapsed:.0f} МБ/с, первый байт через {first_byte * 1000:.0f} мс'
+        )
+
+    def create_assignment(self, students, files, file_size):
+        """Создает задание со сданными работами и файлами вложений на диске"""
+        dataset = DatasetGenerator(
+            teachers=1, groups=1, students_per_group=students, courses=1, assignments_per_course=1,
+            fill_rate=1, graded_ratio=0, attachments_per_homework=files, attachment_size=(file_size, file_size),
+            write_files=True, prefix='bexport',
+        ).generate()
+        return Assignment.objects.get(course_id=dataset.course_ids[0])
@@ -0,0 +1,53 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+
+from accounts.datagen import DatasetGenerator
+from accounts.gradebook import build_gradebooks
+from accounts.models import Course
+
+
+class Command(BaseCommand):
+    help = 'Замеряет число запросов и время построения журнала на синтетических курсах'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--sizes', default='10x5,60x20,120x40,240x80',
+            help='Размеры курсов в виде СТУДЕНТЫxЗАДАНИЯ через запятую',
+        )
+
+    def handle(self, *args, **options):
+        try:
+            sizes = [tuple(int(part) for part in size.split('x')) for size in options['sizes'].split(',')]
+        except ValueError:
+            raise CommandError('Размеры задаются как 120x40,240x80')
+
+        self.stdout.write(f"{'студенты':>9} {'задания':>8} {'ячейки':>8} {'запросы':>8} {'мс':>8}")
+        query_counts = set()
+        for index, (students, assignments) in enumerate(sizes):
+            with transaction.atomic():
+                course = self.create_course(index, students, assignments)
+                with CaptureQueriesContext(connection) as queries:
+                    started = time.perf_counter()
+                    for row in build_gradebooks([course])[0]:
+                        row.final_grade
+                    elapsed = (time.perf_counter() - started) * 1000
+                transaction.set_rollback(True)
+            query_counts.add(len(queries))
+            self.stdout.write(
+                f'{students:>9} {assignments:>8} {students * assignments:>8} {len(queries):>8} {elapsed:>8.1f}'
+            )
+
+        if len(query_counts) > 1:
+            raise CommandError('Число запросов зависит от размера курса')
+        self.stdout.write(self.style.SUCCESS('Число запросов не зависит от размера курса'))
+
+    def create_course(self, index, students, assignments):
+        """Создает курс с заданиями, студентами и оцененными работами"""
+        dataset = DatasetGenerator(
+            teachers=1, groups=1, students_per_group=students, courses=1,
+            assignments_per_course=assignments, fill_rate=1, graded_ratio=1, prefix=f'bench{index}',
+        ).generate()
+        return Course.objects.get(pk=dataset.course_ids[0])
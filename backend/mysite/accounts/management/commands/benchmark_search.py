@@ -0,0 +1,41 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Count
+
+from accounts import search
+from accounts.models import Course
+
+
+class Command(BaseCommand):
+    help = 'Замеряет полнотекстовый поиск преподавателя по текущему индексу (см. rebuild_search_index)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('queries', nargs='*', default=['ответ', 'ответ студента 4', 'студ', 'сообщение 17'])
+        parser.add_argument('--repeat', type=int, default=10)
+
+    def handle(self, *args, **options):
+        if not search.enabled():
+            raise CommandError('Полнотекстовый поиск поддерживается только для SQLite')
+        with connection.cursor() as cursor:
+            cursor.execute(f'SELECT count(*) FROM {search.TABLE}')
+            self.stdout.write(f'Документов в индексе: {cursor.fetchone()[0]}')
+
+        teacher = Course.objects.values('teacher').annotate(courses=Count('id')).order_by('-courses').first()
+        if teacher is None:
+            raise CommandError('В базе нет курсов')
+        course_ids = list(Course.objects.filter(teacher=teacher['teacher']).values_list('id', flat=True))
+        self.stdout.write(f'Курсов у преподавателя: {len(course_ids)}')
+
+        for query in options['queries']:
+            timings = []
+            for _ in range(options['repeat']):
+                started = time.perf_counter()
+                results = search.search_documents(course_ids, query)
+                timings.append(time.perf_counter() - started)
+            timings.sort()
+            self.stdout.write(
+                f'{query!r}: медиана {timings[len(timings) // 2] * 1000:.1f} мс, '
+                f'максимум {timings[-1] * 1000:.1f} мс, результатов {len(results)}'
+            )
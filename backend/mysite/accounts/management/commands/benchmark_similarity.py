@@ -0,0 +1,89 @@
+import random
+import time
+from itertools import combinations
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+
+from accounts.datagen import DatasetGenerator
+from accounts.models import Assignment, Homework
+from accounts.similarity import THRESHOLD, similarity, suspicious_pairs, update_signatures
+
+SYLLABLES = ['ка', 'ро', 'ми', 'ту', 'ле', 'на', 'во', 'за', 'пе', 'ри', 'до', 'гу', 'ше', 'ба', 'ты', 'ло']
+
+
+class Command(BaseCommand):
+    help = 'Замеряет поиск похожих ответов в одном задании: сигнатуры, LSH и полный перебор пар'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--submissions', type=int, default=10000)
+        parser.add_argument('--words', type=int, default=200, help='Слов в одном ответе')
+        parser.add_argument('--copied', type=float, default=0.01, help='Доля списанных ответов')
+        parser.add_argument('--sample', type=int, default=1000, help='Работ для замера полного перебора')
+
+    def handle(self, *args, **options):
+        rng = random.Random(0)
+        vocabulary = sorted({''.join(rng.choices(SYLLABLES, k=rng.randint(2, 4))) for _ in range(5000)})
+        weights = [1 / rank for rank in range(1, len(vocabulary) + 1)]
+
+        with transaction.atomic():
+            dataset = DatasetGenerator(
+                teachers=1, groups=1, students_per_group=options['submissions'], courses=1,
+                assignments_per_course=1, fill_rate=1, prefix='bsim',
+            ).generate()
+            assignment = Assignment.objects.get(course_id=dataset.course_ids[0])
+            homeworks = list(Homework.objects.filter(assignment=assignment).order_by('id'))
+
+            # Ответы из одного словаря; часть списана с другой работы с заменой 2–10% слов
+            texts = {}
+            planted = set()
+            for homework in homeworks:
+                if texts and rng.random() < options['copied']:
+                    source_id = rng.choice(list(texts))
+                    words = texts[source_id].split()
+                    for index in rng.sample(range(len(words)), int(len(words) * rng.uniform(0.02, 0.1))):
+                        words[index] = rng.choice(vocabulary)
+                    planted.add((min(source_id, homework.id), max(source_id, homework.id)))
+                else:
+                    words = rng.choices(vocabulary, weights, k=options['words'])
+                texts[homework.id] = homework.text_content = ' '.join(words)
+            Homework.objects.bulk_update(homeworks, ['text_content'], batch_size=1000)
+            self.stdout.write(f'Работ: {len(homeworks)}, списанных: {len(planted)}')
+
+            started = time.perf_counter()
+            update_signatures((homework.id, assignment.id, homework.text_content) for homework in homeworks)
+            signed = time.perf_counter()
+            self.stdout.write(
+                f'Сигнатуры: {(signed - started) * 1000:.0f} мс, '
+                f'{(signed - started) / len(homeworks) * 1000:.2f} мс на работу'
+            )
+
+            with CaptureQueriesContext(connection) as queries:
+                started = time.perf_counter()
+                pairs = suspicious_pairs(assignment.id, limit=None)
+                finished = time.perf_counter()
+            found = {(first, second) for score, first, second in pairs}
+            self.stdout.write(
+                f'LSH: {(finished - started) * 1000:.0f} мс, запросов: {len(queries)}, пар не ниже {THRESHOLD}: '
+                f'{len(pairs)}, найдено списанных: {len(planted & found)} из {len(planted)}'
+            )
+
+            started = time.perf_counter()
+            suspicious_pairs(assignment.id, limit=None)
+            self.stdout.write(f'Повторный отчет из кэша: {(time.perf_counter() - started) * 1000:.1f} мс')
+
+            sample = dict(
+                assignment.homeworks.order_by('id').values_list('id', 'signature__signature')[:options['sample']]
+            )
+            started = time.perf_counter()
+            for (first_id, first), (second_id, second) in combinations(sample.items(), 2):
+                similarity(first, second)
+            elapsed = time.perf_counter() - started
+            total_pairs = len(homeworks) * (len(homeworks) - 1) // 2
+            sample_pairs = len(sample) * (len(sample) - 1) // 2
+            self.stdout.write(
+                f'Полный перебор: {elapsed * 1000:.0f} мс на {sample_pairs} пар, '
+                f'оценка для всех {total_pairs} пар: {elapsed / sample_pairs * total_pairs:.0f} с'
+            )
+            transaction.set_rollback(True)
@@ -0,0 +1,131 @@
+import asyncio
+import json
+import statistics
+import time
+
+from django.conf import settings
+from django.contrib.auth import BACKEND_SESSION_KEY, HASH_SESSION_KEY, SESSION_KEY
+from django.contrib.auth.models import User
+from django.contrib.sessions.backends.db import SessionStore
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from accounts.chat import database_sync_to_async, get_broker, post_message, websocket_application
+from accounts.datagen import DatasetGenerator
+from accounts.models import ChatRoom, StudentGroup
+
+PREFIX = 'lchat'
+
+
+class Connection:
+    """WebSocket-клиент в памяти: очереди вместо сокета"""
+
+    def __init__(self, room_id, cookie):
+        self.scope = {
+            'type': 'websocket', 'path': f'/ws/chat/{room_id}/', 'query_string': b'',
+            'headers': [(b'cookie', cookie.encode()), (b'host', b'testserver')],
+        }
+        self.incoming = asyncio.Queue()
+        self.outgoing = asyncio.Queue()
+        self.accepted = asyncio.Event()
+        self.received = {}
+
+    async def receive(self):
+        return await self.incoming.get()
+
+    async def send(self, event):
+        if event['type'] == 'websocket.accept':
+            self.accepted.set()
+        else:
+            await self.outgoing.put(event)
+
+    async def run(self):
+        await self.incoming.put({'type': 'websocket.connect'})
+        await websocket_application(self.scope, self.receive, self.send)
+
+    async def collect(self, expected, after_id):
+        while len(self.received) < expected:
+            event = await self.outgoing.get()
+            if event['type'] != 'websocket.send':
+                return
+            message_id = json.loads(event['text'])['id']
+            if message_id > after_id:
+                self.received[message_id] = time.perf_counter()
+
+
+class Command(BaseCommand):
+    help = 'Нагрузочный тест чата: тысячи WebSocket-подключений к одной комнате'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--connections', type=int, default=2000)
+        parser.add_argument('--messages', type=int, default=20)
+
+    def handle(self, *args, **options):
+        dataset = DatasetGenerator(
+            teachers=1, groups=1, students_per_group=1, courses=1, assignments_per_course=0,
+            chat_messages_per_course=0, prefix=PREFIX,
+        ).generate()
+        try:
+            room = ChatRoom.objects.create(
+                course_id=dataset.course_ids[0], name='Нагрузочный тест', created_by_id=dataset.teacher_ids[0],
+            )
+            teacher = User.objects.get(pk=dataset.teacher_ids[0])
+            session = SessionStore()
+            session[SESSION_KEY] = str(teacher.pk)
+            session[BACKEND_SESSION_KEY] = 'django.contrib.auth.backends.ModelBackend'
+            session[HASH_SESSION_KEY] = teacher.get_session_auth_hash()
+            session.create()
+            asyncio.run(self.run(room, teacher, f'{settings.SESSION_COOKIE_NAME}={session.session_key}', options))
+            session.delete()
+        finally:
+            User.objects.filter(username__startswith=f'{PREFIX}_').delete()
+            StudentGroup.objects.filter(code__startswith=f'{PREFIX}-').delete()
+
+    async def run(self, room, teacher, cookie, options):
+        broker = get_broker()
+        clients = [Connection(room.id, cookie) for _ in range(options['connections'])]
+
+        started = time.perf_counter()
+        servers = [asyncio.ensure_future(client.run()) for client in clients]
+        await asyncio.gather(*(client.accepted.wait() for client in clients))
+        connected = time.perf_counter()
+        self.stdout.write(
+            f'Подключений: {broker.subscriber_count(room.id)} за {connected - started:.2f} с'
+        )
+
+        sent_at = {}
+
+        def publish_all():
+            # Считаются только запросы раздачи: сохранение сообщения — один INSERT
+            with CaptureQueriesContext(connection) as queries:
+                for number in range(options['messages']):
+                    message = post_message(teacher, room, f'Сообщение {number}')
+                    sent_at[message.id] = time.perf_counter()
+            return len(queries)
+
+        # Комната новая и пустая: клиенты ждут первые N сообщений
+        collectors = [asyncio.ensure_future(client.collect(options['messages'], 0)) for client in clients]
+        queries = await database_sync_to_async(publish_all)()
+        await asyncio.wait_for(asyncio.gather(*collectors), timeout=120)
+        finished = time.perf_counter()
+
+        latencies = sorted(
+            (received - sent_at[message_id]) * 1000
+            for client in clients for message_id, received in client.received.items()
+        )
+        delivered = len(latencies)
+        self.stdout.write(
+            f'Доставлено {delivered} из {options["connections"] * options["messages"]} '
+            f'за {finished - connected:.2f} с ({delivered / (finished - connected):.0f} сообщений/с)'
+        )
+        self.stdout.write(
+            f'Задержка доставки: p50 {statistics.median(latencies):.1f} мс, '
+            f'p99 {latencies[int(len(latencies) * 0.99) - 1]:.1f} мс, max {latencies[-1]:.1f} мс'
+        )
+        self.stdout.write(f'SQL-запросов на {options["messages"]} сообщений: {queries}')
+
+        for client in clients:
+            await client.incoming.put({'type': 'websocket.disconnect', 'code': 1000})
+        await asyncio.gather(*servers)
+        self.stdout.write(f'Подписчиков после отключения: {broker.subscriber_count(room.id)}')
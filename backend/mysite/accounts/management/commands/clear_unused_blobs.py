@@ -0,0 +1,18 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from accounts.storage import delete_unused_blobs
+
+
+class Command(BaseCommand):
+    help = 'Удаляет файлы хранилища вложений, на которые давно не ссылается ни одно вложение'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--hours', type=int, default=24, help='Сколько часов хранить файлы без ссылок')
+
+    def handle(self, *args, **options):
+        threshold = timezone.now() - timedelta(hours=options['hours'])
+        deleted = delete_unused_blobs(threshold)
+        self.stdout.write(self.style.SUCCESS(f'Удалено файлов: {deleted}'))
@@ -0,0 +1,31 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from accounts.models import Homework, HomeworkSignature
+from accounts.similarity import BATCH_SIZE, update_signatures
+
+
+class Command(BaseCommand):
+    help = 'Считает MinHash-сигнатуры текстовых ответов, сданных до появления поиска похожих работ'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true', help='Пересчитать и уже посчитанные сигнатуры')
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        homeworks = Homework.objects.exclude(text_content='').order_by('id')
+        if not options['all']:
+            homeworks = homeworks.exclude(id__in=HomeworkSignature.objects.values('homework_id'))
+        rows = homeworks.values_list('id', 'assignment_id', 'text_content')
+        total = 0
+        batch = []
+        for row in rows.iterator(chunk_size=BATCH_SIZE):
+            batch.append(row)
+            if len(batch) >= BATCH_SIZE:
+                total += update_signatures(batch)
+                batch = []
+        total += update_signatures(batch)
+        self.stdout.write(self.style.SUCCESS(
+            f'Посчитано сигнатур: {total} за {time.perf_counter() - started:.1f} с'
+        ))
@@ -0,0 +1,75 @@
+import os
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from accounts.models import Attachment, FileBlob
+from accounts.storage import acquire_blob, attachment_storage, blob_name, is_blob_name
+
+
+class Command(BaseCommand):
+    help = 'Переносит вложения в хранилище с адресацией по содержимому, удаляя дубликаты'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='Только посчитать, сколько места освободится')
+
+    def handle(self, *args, **options):
+        storage = attachment_storage()
+        dry_run = options['dry_run']
+        adopted = {}
+        known = set(FileBlob.objects.values_list('digest', flat=True))
+        moved = missing = 0
+        freed = 0
+
+        legacy = Attachment.objects.exclude(file__startswith='cas/').values_list('id', 'file').order_by('id')
+        for attachment_id, name in legacy.iterator():
+            if is_blob_name(name):
+                continue
+            path = storage.path(name)
+            if name not in adopted:
+                if not os.path.exists(path):
+                    missing += 1
+                    self.stderr.write(f'Файл не найден: {name}')
+                    continue
+                size = os.path.getsize(path)
+                if dry_run:
+                    digest = storage.file_digest(path)
+                    new_name = blob_name(digest)
+                else:
+                    new_name = storage.adopt(path)
+                    digest = os.path.basename(new_name)
+                if digest in known:
+                    freed += size
+                known.add(digest)
+                adopted[name] = new_name
+
+            moved += 1
+            if dry_run:
+                continue
+            with transaction.atomic():
+                Attachment.objects.filter(pk=attachment_id).update(file=adopted[name])
+                acquire_blob(adopted[name], storage)
+
+        if not dry_run:
+            # Оригиналы удаляются только после того, как все ссылки в базе обновлены
+            for name in adopted:
+                path = storage.path(name)
+                if os.path.exists(path):
+                    os.remove(path)
+                self.remove_empty_dirs(os.path.dirname(path), storage.location)
+
+        verb = 'Будет перенесено' if dry_run else 'Перенесено'
+        self.stdout.write(self.style.SUCCESS(
+            f'{verb} вложений: {moved}, уникальных файлов: {len(set(adopted.values()))}, '
+            f'освобождается: {freed / 2 ** 20:.1f} МБ, не найдено: {missing}'
+        ))
+
+    def remove_empty_dirs(self, directory, root):
+        root = os.path.abspath(root)
+        directory = os.path.abspath(directory)
+        while directory.startswith(root) and directory != root:
+            try:
+                os.rmdir(directory)
+            except OSError:
+                break
+            directory = os.path.dirname(directory)
@@ -0,0 +1,77 @@
+from datetime import datetime, time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+from accounts.datagen import DatasetGenerator
+
+
+class Command(BaseCommand):
+    help = 'Заполняет базу синтетическими данными заданного размера для замеров производительности'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--teachers', type=int, default=2)
+        parser.add_argument('--groups', type=int, default=4)
+        parser.add_argument('--students-per-group', type=int, default=25)
+        parser.add_argument('--courses', type=int, default=4)
+        parser.add_argument('--groups-per-course', type=int, default=2)
+        parser.add_argument('--assignments', type=int, default=10, help='Заданий на курс')
+        parser.add_argument('--fill-rate', type=float, default=0.9, help='Доля сданных пар студент-задание')
+        parser.add_argument('--graded-ratio', type=float, default=0.6, help='Доля проверенных работ')
+        parser.add_argument('--test-ratio', type=float, default=0.0, help='Доля заданий-тестов')
+        parser.add_argument('--questions', type=int, default=5, help='Вопросов в тесте')
+        parser.add_argument('--chat-messages', type=int, default=0, help='Сообщений чата на курс')
+        parser.add_argument('--attachments', type=float, default=0.0, help='Среднее число вложений на работу')
+        parser.add_argument(
+            '--attachment-size', default='16-256',
+            help='Размер вложения в КБ: число или диапазон МИН-МАКС',
+        )
+        parser.add_argument('--write-files', action='store_true', help='Записывать содержимое вложений на диск')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument(
+            '--base-date', help='Дата или время ISO, от которых отсчитываются сроки; по умолчанию — текущее',
+        )
+        parser.add_argument('--prefix', default='gen', help='Префикс имен пользователей и кодов групп')
+        parser.add_argument('--batch-size', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        try:
+            low, _, high = options['attachment_size'].partition('-')
+            attachment_size = (int(low) * 1024, int(high or low) * 1024)
+        except ValueError:
+            raise CommandError('Размер вложения задается как 64 или 16-256')
+
+        base_date = None
+        if options['base_date']:
+            try:
+                base_date = parse_datetime(options['base_date'])
+                if base_date is None:
+                    date = parse_date(options['base_date'])
+                    base_date = date and datetime.combine(date, time())
+            except ValueError:
+                base_date = None
+            if base_date is None:
+                raise CommandError('Базовая дата задается как 2024-09-01 или 2024-09-01T09:00')
+            if timezone.is_naive(base_date):
+                base_date = timezone.make_aware(base_date)
+
+        try:
+            generator = DatasetGenerator(
+                teachers=options['teachers'], groups=options['groups'],
+                students_per_group=options['students_per_group'], courses=options['courses'],
+                groups_per_course=options['groups_per_course'], assignments_per_course=options['assignments'],
+                fill_rate=options['fill_rate'], graded_ratio=options['graded_ratio'],
+                test_ratio=options['test_ratio'], questions_per_test=options['questions'],
+                chat_messages_per_course=options['chat_messages'],
+                attachments_per_homework=options['attachments'], attachment_size=attachment_size,
+                write_files=options['write_files'], seed=options['seed'], prefix=options['prefix'],
+                batch_size=options['batch_size'], base_date=base_date, progress=self.stdout.write,
+            )
+        except ValueError as error:
+            raise CommandError(str(error))
+
+        dataset = generator.generate()
+        for name, value in dataset.counts.items():
+            self.stdout.write(f'{name:>18}: {value}')
+        self.stdout.write(self.style.SUCCESS(f'Готово за {dataset.elapsed:.1f} с'))
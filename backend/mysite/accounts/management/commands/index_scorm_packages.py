@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+
+from accounts.models import SCORMPackage
+from accounts.scorm import ScormError, index_package
+
+
+class Command(BaseCommand):
+    help = 'Строит индекс файлов и разбирает манифест SCORM пакетов, загруженных до появления индекса'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true', help='Переиндексировать и уже проиндексированные пакеты')
+
+    def handle(self, *args, **options):
+        packages = SCORMPackage.objects.order_by('id')
+        if not options['all']:
+            packages = packages.filter(indexed_at=None)
+        indexed = failed = 0
+        for package in packages.iterator():
+            try:
+                files = index_package(package)
+            except (ScormError, OSError) as e:
+                failed += 1
+                self.stderr.write(f'{package.id} {package.title}: {e}')
+                continue
+            indexed += 1
+            self.stdout.write(f'{package.id} {package.title}: файлов {files}')
+        self.stdout.write(self.style.SUCCESS(f'Проиндексировано пакетов: {indexed}, с ошибками: {failed}'))
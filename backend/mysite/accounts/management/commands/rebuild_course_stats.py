@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from accounts.models import Course, CourseStats
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает статистику всех курсов с нуля'
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            CourseStats.objects.all().delete()
+            stats = CourseStats.refresh(Course.objects.values_list('id', flat=True))
+        self.stdout.write(self.style.SUCCESS(f'Статистика пересчитана для курсов: {len(stats)}'))
@@ -0,0 +1,20 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from accounts import search
+
+
+class Command(BaseCommand):
+    help = 'Перестраивает полнотекстовый индекс работ, комментариев, заданий и чата'
+
+    def handle(self, *args, **options):
+        if not search.enabled():
+            raise CommandError('Полнотекстовый поиск поддерживается только для SQLite')
+        started = time.perf_counter()
+        with transaction.atomic():
+            counts = search.rebuild()
+        for kind, count in counts.items():
+            self.stdout.write(f'{kind}: {count}')
+        self.stdout.write(self.style.SUCCESS(f'Индекс перестроен за {time.perf_counter() - started:.1f} с'))
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from accounts.models import Course, StudentCourseProgress
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает прогресс студентов по всем курсам с нуля'
+
+    def handle(self, *args, **options):
+        total = 0
+        with transaction.atomic():
+            StudentCourseProgress.objects.all().delete()
+            # По одному курсу: память не растет с размером базы
+            for course_id in Course.objects.order_by('id').values_list('id', flat=True):
+                total += len(StudentCourseProgress.refresh([course_id]))
+        self.stdout.write(self.style.SUCCESS(f'Прогресс пересчитан для записей на курсы: {total}'))
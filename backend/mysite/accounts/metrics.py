@@ -0,0 +1,294 @@
+"""Метрики приложения в формате Prometheus.
+
+Значения хранятся в памяти процесса: обновление — короткая секция под
+собственной блокировкой метрики, без обращений к диску или сети.
+
+Если задан METRICS_MULTIPROCESS_DIR (несколько воркеров gunicorn/uWSGI),
+каждый процесс не чаще раза в METRICS_FLUSH_INTERVAL секунд и при выходе
+сбрасывает свои значения в файл ``<pid>-<uuid>.json`` этого каталога, а
+endpoint суммирует файлы всех процессов. Случайная часть имени не дает новому
+воркеру с тем же pid затереть файл завершившегося. Файлы завершившихся
+воркеров остаются, поэтому счетчики не уменьшаются при перезапуске; каталог
+очищается при деплое.
+
+Задержки хранятся гистограммами: p99 считается в Prometheus через
+histogram_quantile по ``accounts_request_duration_seconds_bucket``.
+"""
+import atexit
+import glob
+import json
+import math
+import os
+import tempfile
+import threading
+import time
+import uuid
+from bisect import bisect_left
+
+from django.conf import settings
+from django.db import connections
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (1, 2, 3, 5, 8, 13, 21, 34, 55, 89, 144)
+QUERY_DURATION_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0)
+THROUGHPUT_BUCKETS = tuple(2 ** power * 1024 * 1024 for power in range(11))  # 1 МБ/с .. 1 ГБ/с
+
+
+def escape_label(value):
+    return value.replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def format_labels(names, values, extra=()):
+    pairs = [f'{name}="{escape_label(value)}"' for name, value in zip(names, values)]
+    pairs += [f'{name}="{value}"' for name, value in extra]
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def format_value(value):
+    if value == math.inf:
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=(), registry=None):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.values = {}
+        self.lock = threading.Lock()
+        self.registry = registry if registry is not None else REGISTRY
+        self.registry.register(self)
+
+    def key(self, labels):
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def dump(self):
+        with self.lock:
+            return [[list(key), self.copy_value(value)] for key, value in self.values.items()]
+
+    def copy_value(self, value):
+        return value
+
+    def clear(self):
+        with self.lock:
+            self.values.clear()
+
+    def header(self):
+        return [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.kind}']
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        self.registry.before_update()
+        key = self.key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+        self.registry.after_update()
+
+    def merge(self, total, samples):
+        for key, value in samples:
+            key = tuple(key)
+            total[key] = total.get(key, 0) + value
+
+    def expose(self, total):
+        lines = self.header()
+        for key, value in sorted(total.items()):
+            lines.append(f'{self.name}{format_labels(self.labelnames, key)} {format_value(value)}')
+        return lines
+
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS, registry=None):
+        self.buckets = tuple(buckets)
+        super().__init__(name, documentation, labelnames, registry)
+
+    def observe(self, value, **labels):
+        self.registry.before_update()
+        key = self.key(labels)
+        index = bisect_left(self.buckets, value)
+        with self.lock:
+            state = self.values.get(key)
+            if state is None:
+                # Счетчики по корзинам (последняя — +Inf) и сумма значений
+                state = self.values[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            state[0][index] += 1
+            state[1] += value
+        self.registry.after_update()
+
+    def copy_value(self, value):
+        return [list(value[0]), value[1]]
+
+    def merge(self, total, samples):
+        for key, (counts, value_sum) in samples:
+            key = tuple(key)
+            state = total.setdefault(key, [[0] * (len(self.buckets) + 1), 0.0])
+            for index, count in enumerate(counts):
+                state[0][index] += count
+            state[1] += value_sum
+
+    def expose(self, total):
+        lines = self.header()
+        bounds = self.buckets + (math.inf,)
+        for key, (counts, value_sum) in sorted(total.items()):
+            cumulative = 0
+            for bound, count in zip(bounds, counts):
+                cumulative += count
+                labels = format_labels(self.labelnames, key, [('le', format_value(bound))])
+                lines.append(f'{self.name}_bucket{labels} {cumulative}')
+            labels = format_labels(self.labelnames, key)
+            lines.append(f'{self.name}_sum{labels} {format_value(value_sum)}')
+            lines.append(f'{self.name}_count{labels} {cumulative}')
+        return lines
+
+
+class MetricsRegistry:
+    """Набор метрик процесса и их агрегация между воркерами"""
+
+    def __init__(self):
+        self.metrics = {}
+        self.pid = os.getpid()
+        self.file_name = self.new_file_name()
+        self.next_flush = 0.0
+        atexit.register(self.flush_at_exit)
+
+    def new_file_name(self):
+        return f'{self.pid}-{uuid.uuid4().hex}.json'
+
+    def register(self, metric):
+        self.metrics[metric.name] = metric
+
+    def directory(self):
+        return getattr(settings, 'METRICS_MULTIPROCESS_DIR', None)
+
+    def before_update(self):
+        if os.getpid() != self.pid:
+            # Воркер создан fork-ом после первых измерений: значения родителя в файле родителя
+            self.pid = os.getpid()
+            self.file_name = self.new_file_name()
+            self.next_flush = 0.0
+            for metric in self.metrics.values():
+                metric.clear()
+
+    def after_update(self):
+        if self.directory() and time.monotonic() >= self.next_flush:
+            self.flush()
+
+    def snapshot(self):
+        return {name: metric.dump() for name, metric in self.metrics.items()}
+
+    def flush(self):
+        directory = self.directory()
+        self.next_flush = time.monotonic() + getattr(settings, 'METRICS_FLUSH_INTERVAL', 1.0)
+        os.makedirs(directory, exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        with os.fdopen(fd, 'w') as target:
+            json.dump(self.snapshot(), target)
+        os.replace(temp_path, os.path.join(directory, self.file_name))
+
+    def flush_at_exit(self):
+        # Значения за последний интервал; воркер без своих измерений наследует файл родителя и не пишет
+        if self.directory() and os.getpid() == self.pid:
+            self.flush()
+
+    def collect(self):
+        """Суммарные значения всех процессов: {имя метрики: {метки: значение}}"""
+        directory = self.directory()
+        if not directory:
+            snapshots = [self.snapshot()]
+        else:
+            self.flush()
+            snapshots = []
+            for path in glob.glob(os.path.join(directory, '*.json')):
+                try:
+                    with open(path) as source:
+                        snapshots.append(json.load(source))
+                except (OSError, ValueError):
+                    # Файл мог быть удален или недописан при очистке каталога
+                    continue
+        totals = {name: {} for name in self.metrics}
+        for snapshot in snapshots:
+            for name, samples in snapshot.items():
+                if name in self.metrics:
+                    self.metrics[name].merge(totals[name], samples)
+        return totals
+
+    def render(self):
+        lines = []
+        for name, total in self.collect().items():
+            lines.extend(self.metrics[name].expose(total))
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = MetricsRegistry()
+
+REQUEST_LATENCY = Histogram(
+    'accounts_request_duration_seconds', 'Время обработки запроса до отдачи ответа', ['view'],
+)
+RESPONSES = Counter('accounts_responses_total', 'Ответы по коду статуса', ['view', 'status'])
+REQUEST_QUERIES = Histogram(
+    'accounts_request_queries', 'Число SQL-запросов на один HTTP-запрос', ['view'], QUERY_COUNT_BUCKETS,
+)
+QUERY_DURATION = Histogram(
+    'accounts_db_query_duration_seconds', 'Время выполнения одного SQL-запроса', buckets=QUERY_DURATION_BUCKETS,
+)
+EXPORT_BYTES = Counter('accounts_export_bytes_total', 'Отдано байт архивов', ['kind'])
+EXPORT_THROUGHPUT = Histogram(
+    'accounts_export_bytes_per_second', 'Скорость отдачи архива', ['kind'], THROUGHPUT_BUCKETS,
+)
+GRADING_ACTIONS = Counter('accounts_grading_actions_total', 'Действия проверки работ', ['action'])
+
+
+def metered_stream(chunks, kind):
+    """Пропускает поток архива, считая байты и скорость отдачи"""
+    started = time.perf_counter()
+    sent = 0
+    try:
+        for chunk in chunks:
+            sent += len(chunk)
+            yield chunk
+    finally:
+        elapsed = time.perf_counter() - started
+        EXPORT_BYTES.inc(sent, kind=kind)
+        if sent and elapsed > 0:
+            EXPORT_THROUGHPUT.observe(sent / elapsed, kind=kind)
+
+
+class MetricsMiddleware:
+    """Задержка, статус и число SQL-запросов каждого запроса по имени URL"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def count_query(self, counter):
+        def wrapper(execute, sql, params, many, context):
+            started = time.perf_counter()
+            try:
+                return execute(sql, params, many, context)
+            finally:
+                QUERY_DURATION.observe(time.perf_counter() - started)
+                counter[0] += 1
+        return wrapper
+
+    def __call__(self, request):
+        queries = [0]
+        wrapper = self.count_query(queries)
+        started = time.perf_counter()
+        connection = connections['default']
+        with connection.execute_wrapper(wrapper):
+            response = self.get_response(request)
+        elapsed = time.perf_counter() - started
+
+        match = getattr(request, 'resolver_match', None)
+        # Несовпавшие пути сводятся к одной метке, чтобы 404 не плодили ряды
+        view = (match.url_name or match.view_name) if match else 'unmatched'
+        REQUEST_LATENCY.observe(elapsed, view=view)
+        REQUEST_QUERIES.observe(queries[0], view=view)
+        RESPONSES.inc(view=view, status=response.status_code)
+        return response
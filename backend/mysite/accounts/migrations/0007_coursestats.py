@@ -0,0 +1,33 @@
+# Generated by Django 4.2.7 on 2026-10-18 14:32
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0006_grade_revision_comment_grade_revision_requested_at'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CourseStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('students', models.PositiveIntegerField(default=0, verbose_name='Студентов')),
+                ('assignments', models.PositiveIntegerField(default=0, verbose_name='Заданий')),
+                ('homeworks', models.PositiveIntegerField(default=0, verbose_name='Работ')),
+                ('submitted', models.PositiveIntegerField(default=0, verbose_name='На проверке')),
+                ('graded', models.PositiveIntegerField(default=0, verbose_name='Проверено')),
+                ('revision', models.PositiveIntegerField(default=0, verbose_name='На доработке')),
+                ('late', models.PositiveIntegerField(default=0, verbose_name='Сдано с опозданием')),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('course', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='stats', to='accounts.course')),
+            ],
+            options={
+                'verbose_name': 'Статистика курса',
+                'verbose_name_plural': 'Статистика курсов',
+            },
+        ),
+    ]
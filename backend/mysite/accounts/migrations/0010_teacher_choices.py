@@ -0,0 +1,32 @@
+# Generated by Django 4.2.7 on 2026-10-18 14:40
+
+import accounts.roles
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('accounts', '0009_uploadsession'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='course',
+            name='teacher',
+            field=models.ForeignKey(limit_choices_to=accounts.roles.teacher_choices, on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL, verbose_name='Преподаватель'),
+        ),
+        migrations.AlterField(
+            model_name='grade',
+            name='teacher',
+            field=models.ForeignKey(limit_choices_to=accounts.roles.teacher_choices, on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL, verbose_name='Преподаватель'),
+        ),
+        migrations.AlterField(
+            model_name='scormpackage',
+            name='uploaded_by',
+            field=models.ForeignKey(limit_choices_to=accounts.roles.teacher_choices, on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL),
+        ),
+    ]
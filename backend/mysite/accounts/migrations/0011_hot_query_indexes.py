@@ -0,0 +1,33 @@
+# Generated by Django 4.2.7 on 2026-10-18 14:43
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0010_teacher_choices'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='chatmessage',
+            index=models.Index(fields=['room', 'timestamp'], name='chatmessage_room_time_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='homework',
+            index=models.Index(fields=['assignment', 'status', 'submitted_at'], name='homework_assign_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='homework',
+            index=models.Index(fields=['status', 'submitted_at'], name='homework_status_submit_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='homework',
+            index=models.Index(fields=['submitted_at'], name='homework_submitted_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='homeworkhistory',
+            index=models.Index(fields=['homework', 'changed_at'], name='history_homework_time_idx'),
+        ),
+    ]
@@ -0,0 +1,50 @@
+# Generated by Django 4.2.7 on 2026-10-18 15:12
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0012_chat_history_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='scormpackage',
+            name='indexed_at',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='Проиндексирован'),
+        ),
+        migrations.AddField(
+            model_name='scormpackage',
+            name='launch_path',
+            field=models.CharField(blank=True, max_length=500, verbose_name='Точка входа'),
+        ),
+        migrations.AddField(
+            model_name='scormpackage',
+            name='manifest',
+            field=models.JSONField(blank=True, default=dict, verbose_name='Манифест'),
+        ),
+        migrations.CreateModel(
+            name='SCORMFile',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('path', models.CharField(max_length=500, verbose_name='Путь в пакете')),
+                ('data_offset', models.BigIntegerField(verbose_name='Смещение данных')),
+                ('compressed_size', models.BigIntegerField(verbose_name='Размер в архиве')),
+                ('file_size', models.BigIntegerField(verbose_name='Размер')),
+                ('compress_type', models.PositiveSmallIntegerField(verbose_name='Метод сжатия')),
+                ('crc32', models.BigIntegerField(verbose_name='CRC-32')),
+                ('package', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='files', to='accounts.scormpackage')),
+            ],
+            options={
+                'verbose_name': 'Файл SCORM пакета',
+                'verbose_name_plural': 'Файлы SCORM пакетов',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='scormfile',
+            constraint=models.UniqueConstraint(fields=('package', 'path'), name='scormfile_package_path_uniq'),
+        ),
+    ]
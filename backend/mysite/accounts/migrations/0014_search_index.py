@@ -0,0 +1,33 @@
+# Виртуальная таблица FTS5 для полнотекстового поиска (accounts/search.py).
+# Существующие данные индексирует команда rebuild_search_index.
+
+from django.db import migrations
+
+
+def create_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute(
+        "CREATE VIRTUAL TABLE accounts_search_index USING fts5("
+        "body, scope, tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3')"
+    )
+    # Служебная колонка scope не влияет на релевантность
+    schema_editor.execute(
+        "INSERT INTO accounts_search_index(accounts_search_index, rank) VALUES ('rank', 'bm25(1.0, 0.0)')"
+    )
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'sqlite':
+        schema_editor.execute('DROP TABLE IF EXISTS accounts_search_index')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0013_scorm_index'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 4.2.7 on 2026-10-18 15:19
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0014_search_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='HomeworkSignature',
+            fields=[
+                ('homework', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='signature', serialize=False, to='accounts.homework')),
+                ('signature', models.BinaryField(verbose_name='Сигнатура')),
+                ('computed_at', models.DateTimeField(auto_now=True)),
+                ('assignment', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='accounts.assignment')),
+            ],
+            options={
+                'verbose_name': 'Сигнатура работы',
+                'verbose_name_plural': 'Сигнатуры работ',
+            },
+        ),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 4.2.7 on 2026-10-18 15:25
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0015_homework_signature'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StudentCourseProgress',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('points_earned', models.PositiveIntegerField(default=0, verbose_name='Набрано баллов')),
+                ('points_possible', models.PositiveIntegerField(default=0, verbose_name='Максимум по оцененным работам')),
+                ('assignments', models.PositiveIntegerField(default=0, verbose_name='Заданий в курсе')),
+                ('assigned', models.PositiveIntegerField(default=0, verbose_name='Назначено')),
+                ('submitted', models.PositiveIntegerField(default=0, verbose_name='На проверке')),
+                ('graded', models.PositiveIntegerField(default=0, verbose_name='Проверено')),
+                ('revision', models.PositiveIntegerField(default=0, verbose_name='На доработке')),
+                ('late', models.PositiveIntegerField(default=0, verbose_name='Сдано с опозданием')),
+                ('missed', models.PositiveIntegerField(default=0, verbose_name='Пропущено')),
+                ('last_activity', models.DateTimeField(blank=True, null=True, verbose_name='Последняя сдача')),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('course', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='student_progress', to='accounts.course')),
+                ('student', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='course_progress', to='accounts.studentprofile')),
+            ],
+            options={
+                'verbose_name': 'Прогресс студента по курсу',
+                'verbose_name_plural': 'Прогресс студентов по курсам',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='studentcourseprogress',
+            constraint=models.UniqueConstraint(fields=('student', 'course'), name='progress_student_course_uniq'),
+        ),
+    ]
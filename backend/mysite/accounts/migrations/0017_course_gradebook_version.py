@@ -0,0 +1,18 @@
+# Generated by Django 4.2.7 on 2026-10-18 15:26
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0016_student_course_progress'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='course',
+            name='gradebook_version',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Версия журнала'),
+        ),
+    ]
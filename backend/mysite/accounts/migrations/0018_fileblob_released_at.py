@@ -0,0 +1,18 @@
+# Generated by Django 4.2.7 on 2026-10-18 16:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0017_course_gradebook_version'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='fileblob',
+            name='released_at',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='Ссылок нет с'),
+        ),
+    ]
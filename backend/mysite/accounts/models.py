@@ -3,6 +3,12 @@ from django.contrib.auth.models import User
 from django.core.validators import MinValueValidator, MaxValueValidator
 from django.utils import timezone
 import os
+import uuid
+
+from .commit import CommitBatch
+from .fragments import course_stats_tag, schedule_invalidation
+from .roles import teacher_choices
+from .storage import attachment_storage
 
 class TeacherProfile(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE)
@@ -54,9 +60,11 @@ class Course(models.Model):
     """Курс обучения"""
     title = models.CharField(max_length=200, verbose_name='Название курса')
     description = models.TextField(verbose_name='Описание курса')
-    teacher = models.ForeignKey(User, on_delete=models.CASCADE, limit_choices_to={'groups__name': 'Teacher'},verbose_name='Преподаватель')
+    teacher = models.ForeignKey(User, on_delete=models.CASCADE, limit_choices_to=teacher_choices,verbose_name='Преподаватель')
     students = models.ManyToManyField(StudentProfile, through='CourseEnrollment', verbose_name='Студенты')
     is_active = models.BooleanField(default=True, verbose_name='Активный')
+    # Увеличивается при каждом изменении оценок, работ, заданий и зачислений курса
+    gradebook_version = models.PositiveIntegerField(default=0, editable=False, verbose_name='Версия журнала')
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
@@ -70,6 +78,14 @@ class Course(models.Model):
     @property
     def active_students_count(self):
         return self.students.filter(courseenrollment__is_active=True).count()
+    
+    def has_member(self, user):
+        """Преподаватель курса, администратор или активно записанный студент"""
+        if not user.is_authenticated:
+            return False
+        if user.is_staff or self.teacher_id == user.id:
+            return True
+        return CourseEnrollment.objects.filter(course=self, student__user=user, is_active=True).exists()
 
 class CourseEnrollment(models.Model):
     """Запись о зачислении студента на курс"""
@@ -143,6 +159,12 @@ class Homework(models.Model):
         verbose_name = 'Домашняя работа'
         verbose_name_plural = 'Домашние работы'
         unique_together = ('assignment', 'student')
+        indexes = [
+            # Фильтр по статусу внутри заданий курса и сортировка по дате сдачи
+            models.Index(fields=['assignment', 'status', 'submitted_at'], name='homework_assign_status_idx'),
+            models.Index(fields=['status', 'submitted_at'], name='homework_status_submit_idx'),
+            models.Index(fields=['submitted_at'], name='homework_submitted_idx'),
+        ]
     
     def __str__(self):
         return f"{self.student} - {self.assignment.title}"
@@ -161,6 +183,35 @@ class Homework(models.Model):
             return 'Сдано с опозданием'
         return 'Сдано вовремя'
 
+class HomeworkSignature(models.Model):
+    """MinHash-сигнатура текстового ответа для поиска похожих работ (см. similarity.py)"""
+    homework = models.OneToOneField(Homework, on_delete=models.CASCADE, primary_key=True, related_name='signature')
+    assignment = models.ForeignKey(Assignment, on_delete=models.CASCADE, related_name='+')
+    signature = models.BinaryField(verbose_name='Сигнатура')
+    computed_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        verbose_name = 'Сигнатура работы'
+        verbose_name_plural = 'Сигнатуры работ'
+    
+    def __str__(self):
+        return f"{self.homework_id} - сигнатура"
+
+class FileBlob(models.Model):
+    """Файл в хранилище с адресацией по содержимому и число ссылок на него"""
+    digest = models.CharField(max_length=64, unique=True, verbose_name='SHA-256')
+    size = models.BigIntegerField(verbose_name='Размер (байты)')
+    ref_count = models.PositiveIntegerField(default=0, verbose_name='Число ссылок')
+    released_at = models.DateTimeField(null=True, blank=True, verbose_name='Ссылок нет с')
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        verbose_name = 'Файл хранилища'
+        verbose_name_plural = 'Файлы хранилища'
+    
+    def __str__(self):
+        return f"{self.digest} ({self.ref_count})"
+
 def homework_attachment_path(instance, filename):
     """Путь для сохранения файлов домашних заданий"""
     return f'homeworks/{instance.homework.id}/{filename}'
@@ -169,7 +220,7 @@ class Attachment(models.Model):
     """Вложение к домашней работе"""
     homework = models.ForeignKey(Homework, on_delete=models.CASCADE, 
                                 related_name='attachments')
-    file = models.FileField(upload_to=homework_attachment_path, verbose_name='Файл')
+    file = models.FileField(upload_to=homework_attachment_path, storage=attachment_storage, verbose_name='Файл')
     file_name = models.CharField(max_length=255, verbose_name='Имя файла')
     file_size = models.IntegerField(verbose_name='Размер файла (байты)')
     uploaded_at = models.DateTimeField(auto_now_add=True)
@@ -194,10 +245,29 @@ class Attachment(models.Model):
         """Возвращает расширение файла"""
         return os.path.splitext(self.file_name)[1].lower()
 
+class UploadSession(models.Model):
+    """Незавершенная загрузка вложения частями"""
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    homework = models.ForeignKey(Homework, on_delete=models.CASCADE, related_name='upload_sessions')
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    file_name = models.CharField(max_length=255, verbose_name='Имя файла')
+    total_size = models.BigIntegerField(verbose_name='Размер файла (байты)')
+    offset = models.BigIntegerField(default=0, verbose_name='Загружено (байты)')
+    completed = models.BooleanField(default=False, verbose_name='Завершена')
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        verbose_name = 'Сессия загрузки'
+        verbose_name_plural = 'Сессии загрузки'
+    
+    def __str__(self):
+        return f"{self.file_name} ({self.offset}/{self.total_size})"
+
 class Grade(models.Model):
     """Оценка за домашнюю работу"""
     homework = models.OneToOneField(Homework, on_delete=models.CASCADE, related_name='grade')
-    teacher = models.ForeignKey(User, on_delete=models.CASCADE, limit_choices_to={'groups__name': 'Teacher'},verbose_name='Преподаватель')
+    teacher = models.ForeignKey(User, on_delete=models.CASCADE, limit_choices_to=teacher_choices,verbose_name='Преподаватель')
     grade_value = models.IntegerField(
         validators=[MinValueValidator(1), MaxValueValidator(5)],
         verbose_name='Оценка',
@@ -212,6 +282,8 @@ class Grade(models.Model):
 
     comment = models.TextField(blank=True, verbose_name='Комментарий')
     is_revision_request = models.BooleanField(default=False, verbose_name='Запрос доработки')
+    revision_comment = models.TextField(blank=True, verbose_name='Комментарий к доработке')
+    revision_requested_at = models.DateTimeField(null=True, blank=True, verbose_name='Дата запроса доработки')
     graded_at = models.DateTimeField(auto_now_add=True)
     
     class Meta:
@@ -254,10 +326,219 @@ class HomeworkHistory(models.Model):
         verbose_name = 'История изменений'
         verbose_name_plural = 'История изменений'
         ordering = ['-changed_at']
+        indexes = [
+            models.Index(fields=['homework', 'changed_at'], name='history_homework_time_idx'),
+        ]
     
     def __str__(self):
         return f"{self.homework} - {self.changed_at}"
 
+class CourseStats(models.Model):
+    """Денормализованные счетчики курса для панели преподавателя"""
+    course = models.OneToOneField(Course, on_delete=models.CASCADE, related_name='stats')
+    students = models.PositiveIntegerField(default=0, verbose_name='Студентов')
+    assignments = models.PositiveIntegerField(default=0, verbose_name='Заданий')
+    homeworks = models.PositiveIntegerField(default=0, verbose_name='Работ')
+    submitted = models.PositiveIntegerField(default=0, verbose_name='На проверке')
+    graded = models.PositiveIntegerField(default=0, verbose_name='Проверено')
+    revision = models.PositiveIntegerField(default=0, verbose_name='На доработке')
+    late = models.PositiveIntegerField(default=0, verbose_name='Сдано с опозданием')
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    COUNTERS = ('students', 'assignments', 'homeworks', 'submitted', 'graded', 'revision', 'late')
+    
+    class Meta:
+        verbose_name = 'Статистика курса'
+        verbose_name_plural = 'Статистика курсов'
+    
+    def __str__(self):
+        return f"{self.course} - статистика"
+    
+    @classmethod
+    def refresh(cls, course_ids):
+        """Пересчитывает счетчики для курсов и сохраняет их одним upsert-запросом"""
+        course_ids = list(Course.objects.filter(id__in=course_ids).values_list('id', flat=True))
+        if not course_ids:
+            return []
+        
+        counters = {course_id: dict.fromkeys(cls.COUNTERS, 0) for course_id in course_ids}
+        students = CourseEnrollment.objects.filter(course_id__in=course_ids).values('course_id').annotate(
+            total=models.Count('id')
+        ).order_by()
+        for row in students:
+            counters[row['course_id']]['students'] = row['total']
+        
+        assignments = Assignment.objects.filter(course_id__in=course_ids).values('course_id').annotate(
+            total=models.Count('id')
+        ).order_by()
+        for row in assignments:
+            counters[row['course_id']]['assignments'] = row['total']
+        
+        homeworks = Homework.objects.filter(assignment__course_id__in=course_ids).values(
+            'assignment__course_id'
+        ).annotate(
+            homeworks=models.Count('id'),
+            submitted=models.Count('id', filter=models.Q(status='submitted')),
+            graded=models.Count('id', filter=models.Q(status='graded')),
+            revision=models.Count('id', filter=models.Q(status='revision')),
+            late=models.Count('id', filter=models.Q(status='late')),
+        ).order_by()
+        for row in homeworks:
+            course_id = row.pop('assignment__course_id')
+            counters[course_id].update(row)
+        
+        now = timezone.now()
+        stats = cls.objects.bulk_create(
+            [cls(course_id=course_id, updated_at=now, **values) for course_id, values in counters.items()],
+            update_conflicts=True,
+            unique_fields=['course'],
+            update_fields=list(cls.COUNTERS) + ['updated_at'],
+        )
+        # Карточки курсов на панели преподавателя показывают эти счетчики
+        schedule_invalidation(course_stats_tag(course_id) for course_id in course_ids)
+        return stats
+    
+    @classmethod
+    def schedule_refresh(cls, course_ids):
+        """Пересчитывает курсы после фиксации транзакции, один раз на всю транзакцию"""
+        course_stats_refreshes.add(course_id for course_id in course_ids if course_id is not None)
+
+class StudentCourseProgress(models.Model):
+    """Денормализованный прогресс студента по курсу для страницы успеваемости"""
+    student = models.ForeignKey(StudentProfile, on_delete=models.CASCADE, related_name='course_progress')
+    course = models.ForeignKey(Course, on_delete=models.CASCADE, related_name='student_progress')
+    points_earned = models.PositiveIntegerField(default=0, verbose_name='Набрано баллов')
+    points_possible = models.PositiveIntegerField(default=0, verbose_name='Максимум по оцененным работам')
+    assignments = models.PositiveIntegerField(default=0, verbose_name='Заданий в курсе')
+    assigned = models.PositiveIntegerField(default=0, verbose_name='Назначено')
+    submitted = models.PositiveIntegerField(default=0, verbose_name='На проверке')
+    graded = models.PositiveIntegerField(default=0, verbose_name='Проверено')
+    revision = models.PositiveIntegerField(default=0, verbose_name='На доработке')
+    late = models.PositiveIntegerField(default=0, verbose_name='Сдано с опозданием')
+    missed = models.PositiveIntegerField(default=0, verbose_name='Пропущено')
+    last_activity = models.DateTimeField(null=True, blank=True, verbose_name='Последняя сдача')
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    STATUSES = ('assigned', 'submitted', 'graded', 'revision', 'late', 'missed')
+    FIELDS = ('points_earned', 'points_possible', 'assignments') + STATUSES + ('last_activity',)
+    
+    class Meta:
+        verbose_name = 'Прогресс студента по курсу'
+        verbose_name_plural = 'Прогресс студентов по курсам'
+        constraints = [
+            models.UniqueConstraint(fields=['student', 'course'], name='progress_student_course_uniq'),
+        ]
+    
+    def __str__(self):
+        return f"{self.student} - {self.course}"
+    
+    @property
+    def progress(self):
+        # Как в журнале: доля от максимума только по оцененным работам
+        if self.points_possible > 0:
+            return (self.points_earned / self.points_possible) * 100
+        return 0
+    
+    @property
+    def final_grade(self):
+        from .gradebook import calculate_final_grade
+        return calculate_final_grade(self.progress)
+    
+    @classmethod
+    def refresh(cls, course_ids, student_ids=None):
+        """Пересчитывает прогресс записанных на курсы студентов (всех или только student_ids).
+        
+        Строки сохраняются одним upsert-запросом, строки отчисленных и неактивных студентов удаляются.
+        """
+        course_ids = list(course_ids)
+        enrollments = CourseEnrollment.objects.filter(course_id__in=course_ids, is_active=True)
+        homeworks = Homework.objects.filter(assignment__course_id__in=course_ids)
+        existing = cls.objects.filter(course_id__in=course_ids)
+        if student_ids is not None:
+            student_ids = list(student_ids)
+            enrollments = enrollments.filter(student_id__in=student_ids)
+            homeworks = homeworks.filter(student_id__in=student_ids)
+            existing = existing.filter(student_id__in=student_ids)
+        
+        rows = {
+            key: dict.fromkeys(cls.FIELDS, 0) | {'last_activity': None}
+            for key in enrollments.values_list('course_id', 'student_id')
+        }
+        if rows:
+            assignments = dict(
+                Assignment.objects.filter(course_id__in=course_ids).values('course_id').annotate(
+                    total=models.Count('id')
+                ).values_list('course_id', 'total').order_by()
+            )
+            for (course_id, student_id), values in rows.items():
+                values['assignments'] = assignments.get(course_id, 0)
+            
+            totals = homeworks.values('assignment__course_id', 'student_id').annotate(
+                points_earned=models.Sum('grade__points'),
+                points_possible=models.Sum('assignment__max_points', filter=models.Q(grade__points__isnull=False)),
+                last_activity=models.Max('submitted_at'),
+                **{status: models.Count('id', filter=models.Q(status=status)) for status in cls.STATUSES},
+            ).order_by()
+            for row in totals:
+                values = rows.get((row.pop('assignment__course_id'), row.pop('student_id')))
+                if values is not None:
+                    values.update({field: value for field, value in row.items() if value is not None})
+        
+        stale = [
+            progress_id for progress_id, course_id, student_id in existing.values_list('id', 'course_id', 'student_id')
+            if (course_id, student_id) not in rows
+        ]
+        if stale:
+            cls.objects.filter(id__in=stale).delete()
+        if not rows:
+            return []
+        
+        now = timezone.now()
+        return cls.objects.bulk_create(
+            [
+                cls(course_id=course_id, student_id=student_id, updated_at=now, **values)
+                for (course_id, student_id), values in rows.items()
+            ],
+            update_conflicts=True,
+            unique_fields=['student', 'course'],
+            update_fields=list(cls.FIELDS) + ['updated_at'],
+        )
+    
+    @classmethod
+    def refresh_homeworks(cls, homework_ids):
+        """Пересчитывает прогресс по работам, измененным пакетно (bulk_create, update)"""
+        pairs = set(
+            Homework.objects.filter(id__in=list(homework_ids)).values_list('assignment__course_id', 'student_id')
+        )
+        if pairs:
+            cls.refresh({course_id for course_id, _ in pairs}, {student_id for _, student_id in pairs})
+    
+    @classmethod
+    def refresh_pairs(cls, pairs):
+        """Пересчитывает прогресс по парам (курс, студент); студент None — весь курс"""
+        whole = {course_id for course_id, student_id in pairs if student_id is None}
+        selected = {(course_id, student_id) for course_id, student_id in pairs if course_id not in whole}
+        if whole:
+            cls.refresh(sorted(whole))
+        if selected:
+            cls.refresh({course_id for course_id, _ in selected}, {student_id for _, student_id in selected})
+    
+    @classmethod
+    def schedule_refresh(cls, course_id, student_ids=None):
+        """Пересчитывает прогресс студентов курса (всех или только student_ids) после фиксации транзакции.
+        
+        Пары копятся за всю транзакцию и пересчитываются не больше чем двумя вызовами refresh.
+        """
+        if course_id is None:
+            return
+        if student_ids is None:
+            progress_refreshes.add([(course_id, None)])
+        else:
+            progress_refreshes.add((course_id, student_id) for student_id in student_ids if student_id is not None)
+
+course_stats_refreshes = CommitBatch(lambda course_ids: CourseStats.refresh(sorted(course_ids)))
+progress_refreshes = CommitBatch(StudentCourseProgress.refresh_pairs)
+
 class TestQuestion(models.Model):
     """Вопрос теста"""
     TYPE_CHOICES = [
@@ -328,8 +609,11 @@ class SCORMPackage(models.Model):
     title = models.CharField(max_length=200, verbose_name='Название пакета')
     package_file = models.FileField(upload_to='scorm_packages/', verbose_name='SCORM пакет')
     version = models.CharField(max_length=50, verbose_name='Версия SCORM')
-    uploaded_by = models.ForeignKey(User, on_delete=models.CASCADE, limit_choices_to={'groups__name': 'Teacher'})
+    uploaded_by = models.ForeignKey(User, on_delete=models.CASCADE, limit_choices_to=teacher_choices)
     uploaded_at = models.DateTimeField(auto_now_add=True)
+    manifest = models.JSONField(default=dict, blank=True, verbose_name='Манифест')
+    launch_path = models.CharField(max_length=500, blank=True, verbose_name='Точка входа')
+    indexed_at = models.DateTimeField(null=True, blank=True, verbose_name='Проиндексирован')
     
     class Meta:
         verbose_name = 'SCORM пакет'
@@ -338,6 +622,26 @@ class SCORMPackage(models.Model):
     def __str__(self):
         return self.title
 
+class SCORMFile(models.Model):
+    """Файл внутри zip SCORM пакета: где лежат его данные и как они сжаты"""
+    package = models.ForeignKey(SCORMPackage, on_delete=models.CASCADE, related_name='files')
+    path = models.CharField(max_length=500, verbose_name='Путь в пакете')
+    data_offset = models.BigIntegerField(verbose_name='Смещение данных')
+    compressed_size = models.BigIntegerField(verbose_name='Размер в архиве')
+    file_size = models.BigIntegerField(verbose_name='Размер')
+    compress_type = models.PositiveSmallIntegerField(verbose_name='Метод сжатия')
+    crc32 = models.BigIntegerField(verbose_name='CRC-32')
+    
+    class Meta:
+        verbose_name = 'Файл SCORM пакета'
+        verbose_name_plural = 'Файлы SCORM пакетов'
+        constraints = [
+            models.UniqueConstraint(fields=['package', 'path'], name='scormfile_package_path_uniq'),
+        ]
+    
+    def __str__(self):
+        return self.path
+
 # Модель для чата (дополнительная фича)
 class ChatRoom(models.Model):
     """Чат-комната для курса"""
@@ -367,6 +671,11 @@ class ChatMessage(models.Model):
         verbose_name = 'Сообщение чата'
         verbose_name_plural = 'Сообщения чата'
         ordering = ['timestamp']
+        indexes = [
+            models.Index(fields=['room', 'timestamp'], name='chatmessage_room_time_idx'),
+            # Страницы истории по ключу (room, id)
+            models.Index(fields=['room', 'id'], name='chatmessage_room_id_idx'),
+        ]
     
     def __str__(self):
         return f"{self.sender}: {self.message[:50]}..."
\ No newline at end of file
@@ -0,0 +1,114 @@
+"""Пагинация по ключу (keyset) для длинных списков.
+
+Вместо COUNT(*) и OFFSET страница выбирается условием по последней
+показанной строке: ``(submitted_at, id) < (курсор)`` при сортировке
+``submitted_at DESC NULLS LAST, id DESC``. Стоимость любой страницы
+одинакова, а порядок стабилен и для строк без даты сдачи.
+
+Курсор — подписанная непрозрачная строка; подделанный или устаревший
+курсор молча ведет на первую страницу.
+"""
+from datetime import datetime
+
+from django.core import signing
+from django.db.models import F, Q
+
+CURSOR_SALT = 'accounts.pagination.cursor'
+
+
+class KeysetPage:
+    """Страница результатов с курсорами на соседние страницы"""
+
+    def __init__(self, object_list, next_cursor=None, previous_cursor=None):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    @property
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def has_other_pages(self):
+        return self.has_next or self.has_previous
+
+
+class KeysetPaginator:
+    """Пагинация queryset по паре (field DESC NULLS LAST, pk DESC).
+
+    field может быть nullable; строки без значения идут в конце списка.
+    """
+
+    def __init__(self, queryset, per_page, field):
+        self.queryset = queryset
+        self.per_page = per_page
+        self.field = field
+
+    def encode_cursor(self, obj, direction):
+        value = getattr(obj, self.field)
+        return signing.dumps(
+            [direction, value.isoformat() if value is not None else None, obj.pk],
+            salt=CURSOR_SALT, compress=True,
+        )
+
+    def decode_cursor(self, token):
+        try:
+            direction, value, pk = signing.loads(token, salt=CURSOR_SALT)
+            value = datetime.fromisoformat(value) if value is not None else None
+        except (signing.BadSignature, TypeError, ValueError):
+            return None
+        if direction not in ('after', 'before') or not isinstance(pk, int):
+            return None
+        return direction, value, pk
+
+    def after(self, value, pk):
+        """Строки, идущие в списке после (value, pk)"""
+        field = self.field
+        if value is None:
+            return Q(**{f'{field}__isnull': True, 'pk__lt': pk})
+        return (
+            Q(**{f'{field}__lt': value})
+            | Q(**{field: value, 'pk__lt': pk})
+            | Q(**{f'{field}__isnull': True})
+        )
+
+    def before(self, value, pk):
+        """Строки, идущие в списке перед (value, pk)"""
+        field = self.field
+        if value is None:
+            return Q(**{f'{field}__isnull': True, 'pk__gt': pk}) | Q(**{f'{field}__isnull': False})
+        return Q(**{f'{field}__gt': value}) | Q(**{field: value, 'pk__gt': pk})
+
+    def get_page(self, token=None):
+        cursor = self.decode_cursor(token) if token else None
+        descending = [F(self.field).desc(nulls_last=True), F('pk').desc()]
+        if cursor is None:
+            rows = list(self.queryset.order_by(*descending)[:self.per_page + 1])
+            has_more, has_before = len(rows) > self.per_page, False
+        else:
+            direction, value, pk = cursor
+            if direction == 'after':
+                rows = list(self.queryset.filter(self.after(value, pk)).order_by(*descending)[:self.per_page + 1])
+                has_more, has_before = len(rows) > self.per_page, True
+            else:
+                ascending = [F(self.field).asc(nulls_first=True), F('pk').asc()]
+                rows = list(self.queryset.filter(self.before(value, pk)).order_by(*ascending)[:self.per_page + 1])
+                has_before, has_more = len(rows) > self.per_page, True
+                rows = rows[:self.per_page][::-1]
+        rows = rows[:self.per_page]
+        if not rows:
+            return KeysetPage([])
+        return KeysetPage(
+            rows,
+            next_cursor=self.encode_cursor(rows[-1], 'after') if has_more else None,
+            previous_cursor=self.encode_cursor(rows[0], 'before') if has_before else None,
+        )
@@ -0,0 +1,181 @@
+"""Профилирование запросов: SQL, время шаблонов и поиск N+1.
+
+RequestProfilingMiddleware для части запросов (REQUEST_PROFILE_SAMPLE_RATE)
+считает число SQL-запросов и их суммарное время, время отрисовки шаблонов
+и повторяющиеся запросы (один и тот же SQL с разными параметрами — признак N+1).
+Результат уходит одной JSON-строкой в лог ``accounts.profiling`` и в
+заголовок Server-Timing — его получают только персонал и режим DEBUG.
+
+Для view можно объявить бюджет запросов декоратором query_budget. Превышение
+пишется в лог как предупреждение, а при REQUEST_PROFILE_STRICT = True (в тестах)
+вызывает QueryBudgetExceeded — тестовый клиент пробрасывает его, и тест падает.
+"""
+import contextvars
+import json
+import logging
+import random
+import re
+import time
+from collections import Counter
+from contextlib import ExitStack, contextmanager
+
+from django.conf import settings
+from django.db import connections
+from django.template.backends.django import Template
+
+logger = logging.getLogger('accounts.profiling')
+
+# Списки параметров IN (%s, %s, ...) разной длины дают один отпечаток
+IN_LIST_RE = re.compile(r'IN \((?:%s, )*%s\)')
+
+current_profile = contextvars.ContextVar('current_profile', default=None)
+
+
+class QueryBudgetExceeded(AssertionError):
+    """View выполнил больше запросов, чем объявлено в query_budget"""
+
+
+def query_budget(max_queries):
+    """Объявляет допустимое число SQL-запросов на один вызов view"""
+    def decorator(view_func):
+        view_func.query_budget = max_queries
+        return view_func
+    return decorator
+
+
+def fingerprint(sql):
+    return IN_LIST_RE.sub('IN (...)', sql)
+
+
+class RequestProfile:
+    """Собранные за один запрос показатели"""
+
+    def __init__(self):
+        self.queries = 0
+        self.sql_time = 0.0
+        self.template_time = 0.0
+        self.fingerprints = Counter()
+
+    def record_query(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.sql_time += time.perf_counter() - started
+            self.queries += 1
+            self.fingerprints[fingerprint(sql)] += 1
+
+    def duplicates(self, threshold):
+        return [(sql, count) for sql, count in self.fingerprints.most_common() if count >= threshold]
+
+    @contextmanager
+    def capture(self):
+        """Подключает профиль ко всем соединениям с базой и к отрисовке шаблонов"""
+        token = current_profile.set(self)
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(self.record_query))
+                yield self
+        finally:
+            current_profile.reset(token)
+
+
+def timed_render(render):
+    def wrapper(self, context=None, request=None):
+        profile = current_profile.get()
+        if profile is None:
+            return render(self, context, request)
+        started = time.perf_counter()
+        try:
+            return render(self, context, request)
+        finally:
+            profile.template_time += time.perf_counter() - started
+    wrapper.profiled = True
+    return wrapper
+
+
+def install_template_timer():
+    """Оборачивает отрисовку шаблонов Django; вложенные include не считаются дважды"""
+    if not getattr(Template.render, 'profiled', False):
+        Template.render = timed_render(Template.render)
+
+
+@contextmanager
+def assert_query_budget(max_queries):
+    """Для тестов: падает, если внутри блока выполнено больше max_queries запросов"""
+    profile = RequestProfile()
+    with profile.capture():
+        yield profile
+    if profile.queries > max_queries:
+        raise QueryBudgetExceeded(budget_message(profile, max_queries, 'блок'))
+
+
+def budget_message(profile, budget, name):
+    lines = [f'{name}: {profile.queries} запросов при бюджете {budget}']
+    lines += [f'  {count} x {sql}' for sql, count in profile.fingerprints.most_common(5)]
+    return '\n'.join(lines)
+
+
+class RequestProfilingMiddleware:
+    """Server-Timing и структурированный лог для выборки запросов"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        install_template_timer()
+
+    def __call__(self, request):
+        strict = getattr(settings, 'REQUEST_PROFILE_STRICT', False)
+        sampled = random.random() < getattr(settings, 'REQUEST_PROFILE_SAMPLE_RATE', 0.0)
+        if not strict and not sampled:
+            return self.get_response(request)
+
+        request.query_budget = None
+        started = time.perf_counter()
+        with RequestProfile().capture() as profile:
+            response = self.get_response(request)
+        duration = time.perf_counter() - started
+
+        if settings.DEBUG or getattr(getattr(request, 'user', None), 'is_staff', False):
+            # Время SQL и число запросов раскрывают устройство сайта, поэтому только персоналу
+            response['Server-Timing'] = ', '.join([
+                f'db;dur={profile.sql_time * 1000:.1f};desc="{profile.queries} queries"',
+                f'tpl;dur={profile.template_time * 1000:.1f}',
+                f'app;dur={duration * 1000:.1f}',
+            ])
+        if sampled:
+            # В строгом режиме профилируется каждый запрос, но в лог идет только выборка
+            self.log(request, response, profile, duration)
+
+        budget = request.query_budget
+        if budget is not None and profile.queries > budget:
+            message = budget_message(profile, budget, self.view_name(request))
+            if strict:
+                raise QueryBudgetExceeded(message)
+            logger.warning(message)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if hasattr(request, 'query_budget'):
+            request.query_budget = getattr(view_func, 'query_budget', None)
+
+    def view_name(self, request):
+        match = getattr(request, 'resolver_match', None)
+        return match.view_name if match else request.path
+
+    def log(self, request, response, profile, duration):
+        threshold = getattr(settings, 'REQUEST_PROFILE_DUPLICATE_THRESHOLD', 5)
+        duplicates = profile.duplicates(threshold)
+        record = {
+            'view': self.view_name(request),
+            'method': request.method,
+            'path': request.path,
+            'status': response.status_code,
+            'duration_ms': round(duration * 1000, 1),
+            'queries': profile.queries,
+            'sql_ms': round(profile.sql_time * 1000, 1),
+            'template_ms': round(profile.template_time * 1000, 1),
+            'duplicates': [{'count': count, 'sql': sql[:300]} for sql, count in duplicates[:3]],
+        }
+        level = logging.WARNING if duplicates else logging.INFO
+        logger.log(level, json.dumps(record, ensure_ascii=False))
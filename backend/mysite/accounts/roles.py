@@ -0,0 +1,74 @@
+"""Роли пользователей с кэшированием.
+
+Роли — это имена групп пользователя. Они вычисляются одним запросом,
+кладутся в общий кэш и запоминаются на объекте пользователя до конца
+запроса, поэтому при теплом кэше проверка прав не обращается к базе.
+Кэш сбрасывается обработчиками m2m_changed и сигналами групп в signals.py.
+"""
+from django.contrib.auth.decorators import user_passes_test
+from django.contrib.auth.models import Group
+from django.core.cache import cache
+from django.db.models import Q
+
+TEACHER = 'Teacher'
+STUDENT = 'Student'
+
+ROLES_CACHE_TIMEOUT = 60 * 60
+TEACHER_IDS_CACHE_KEY = 'accounts:roles:teacher_ids'
+
+
+def roles_cache_key(user_id):
+    return f'accounts:roles:user:{user_id}'
+
+
+def get_user_roles(user):
+    """Множество ролей пользователя: не больше одного запроса, ноль при теплом кэше"""
+    if not user.is_authenticated:
+        return frozenset()
+    roles = getattr(user, '_cached_roles', None)
+    if roles is None:
+        key = roles_cache_key(user.pk)
+        roles = cache.get(key)
+        if roles is None:
+            roles = frozenset(user.groups.values_list('name', flat=True))
+            cache.set(key, roles, ROLES_CACHE_TIMEOUT)
+        user._cached_roles = roles
+    return roles
+
+
+def has_role(user, role):
+    return role in get_user_roles(user)
+
+
+# Проверка, является ли пользователь преподавателем
+def is_teacher(user):
+    return user.is_authenticated and (user.is_staff or has_role(user, TEACHER))
+
+
+def role_required(check, login_url=None):
+    """Аналог user_passes_test для проверки роли; неаутентифицированных отправляет на вход"""
+    return user_passes_test(check, login_url=login_url)
+
+
+teacher_required = role_required(is_teacher)
+
+
+def invalidate_user_roles(user_ids):
+    cache.delete_many([roles_cache_key(user_id) for user_id in user_ids])
+
+
+def invalidate_teacher_ids():
+    cache.delete(TEACHER_IDS_CACHE_KEY)
+
+
+def teacher_ids():
+    ids = cache.get(TEACHER_IDS_CACHE_KEY)
+    if ids is None:
+        ids = list(Group.objects.filter(name=TEACHER).values_list('user', flat=True).exclude(user=None))
+        cache.set(TEACHER_IDS_CACHE_KEY, ids, ROLES_CACHE_TIMEOUT)
+    return ids
+
+
+def teacher_choices():
+    """limit_choices_to для полей «Преподаватель» без JOIN по группам"""
+    return Q(pk__in=teacher_ids())
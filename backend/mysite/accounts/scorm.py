@@ -0,0 +1,373 @@
+"""SCORM пакеты: индекс содержимого zip и отдача файлов без распаковки.
+
+При загрузке пакета imsmanifest.xml разбирается один раз, а центральный
+каталог zip переносится в таблицу SCORMFile: для каждого файла хранится
+смещение его данных в архиве, размеры, метод сжатия и CRC-32. Отдача файла —
+один запрос к индексу и один seek в архив:
+
+* несжатый файл читается как есть, поддерживаются диапазоны Range;
+* файл, сжатый deflate, клиенту с Accept-Encoding: gzip отдается без
+  распаковки — сырые данные архива оборачиваются в заголовок и хвост gzip
+  (CRC-32 и размер уже есть в индексе); остальным распаковывается потоком.
+
+Пакет на диск не распаковывается.
+
+Содержимое пакета пишет преподаватель, поэтому файлы отдаются с
+Content-Security-Policy: sandbox без allow-same-origin: у документа пакета
+непрозрачный источник, и его скрипты не читают cookie и страницы сайта. Такой
+документ браузер считает чужим сайтом и сессионную cookie с его запросами не
+отправляет, поэтому доступ к файлам дает подписанный токен в пути URL. Его
+выдает scorm_launch участнику курса, а относительные ссылки внутри пакета
+сохраняют его сами.
+
+По той же причине пакет не видит window.API и window.API_1484_11 плеера
+scorm_launch. В каждую HTML-страницу пакета при отдаче подключается мост
+js/scorm-api.js: он создает API в самой странице, а значения получает от
+плеера и отправляет ему через postMessage.
+"""
+import posixpath
+import re
+import struct
+import xml.etree.ElementTree as ET
+import zipfile
+import zlib
+
+from django.core import signing
+from django.templatetags.static import static
+from django.db import transaction
+from django.http import HttpResponse, StreamingHttpResponse
+from django.utils import timezone
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import http_date
+
+from .models import SCORMFile
+from .serving import CHUNK_SIZE, RangeNotSatisfiable, guess_content_type, requested_byte_range, set_file_headers
+
+MANIFEST_NAME = 'imsmanifest.xml'
+MANIFEST_MAX_SIZE = 5 * 1024 * 1024
+
+LOCAL_HEADER = struct.Struct('<4sHHHHHIIIHH')
+LOCAL_HEADER_SIGNATURE = b'PK\x03\x04'
+
+# Заголовок gzip без имени файла и времени: deflate, ОС «неизвестна»
+GZIP_HEADER = b'\x1f\x8b\x08\x00\x00\x00\x00\x00\x00\xff'
+
+SUPPORTED_COMPRESSION = (zipfile.ZIP_STORED, zipfile.ZIP_DEFLATED)
+
+SANDBOX_POLICY = 'sandbox allow-scripts allow-forms'
+API_SCRIPT = 'js/scorm-api.js'
+# Страницы больше этого отдаются без моста, как остальные файлы
+API_PAGE_MAX_SIZE = 5 * 1024 * 1024
+HEAD_RE = re.compile(rb'<head\b[^>]*>', re.IGNORECASE)
+DOCTYPE_RE = re.compile(rb'^(?:\xef\xbb\xbf)?\s*<!doctype[^>]*>', re.IGNORECASE)
+ACCESS_SALT = 'accounts.scorm.access'
+ACCESS_MAX_AGE = 8 * 3600
+
+
+class ScormError(Exception):
+    """Пакет не является корректным SCORM-архивом"""
+
+
+def local_name(tag):
+    return tag.rsplit('}', 1)[-1]
+
+
+def children(element, name):
+    return [child for child in element if local_name(child.tag) == name]
+
+
+def child_text(element, name):
+    for child in children(element, name):
+        return (child.text or '').strip()
+    return ''
+
+
+def xml_base(element):
+    for attribute, value in element.attrib.items():
+        if local_name(attribute) == 'base':
+            return value
+    return ''
+
+
+def attribute(element, name):
+    # scormtype в SCORM 1.2 и scormType в SCORM 2004 — из пространства имен adlcp
+    for key, value in element.attrib.items():
+        if local_name(key).lower() == name.lower():
+            return value
+    return ''
+
+
+def normalize_path(path):
+    """Путь внутри пакета без ./ и .., или None, если он выходит за пределы пакета"""
+    path = path.replace('\\', '/').split('?', 1)[0].split('#', 1)[0]
+    normalized = posixpath.normpath(path).lstrip('/')
+    if normalized in ('', '.') or normalized.startswith('../') or normalized == '..':
+        return None
+    return normalized
+
+
+def parse_items(element):
+    return [
+        {
+            'identifier': item.get('identifier', ''),
+            'title': child_text(item, 'title'),
+            'resource': item.get('identifierref', ''),
+            'parameters': item.get('parameters', ''),
+            'items': parse_items(item),
+        }
+        for item in children(element, 'item')
+    ]
+
+
+def parse_manifest(data):
+    """Манифест в виде словаря: версия, организации, ресурсы и точка входа"""
+    try:
+        root = ET.fromstring(data)
+    except ET.ParseError as e:
+        raise ScormError(f'Некорректный {MANIFEST_NAME}: {e}')
+    if local_name(root.tag) != 'manifest':
+        raise ScormError(f'В {MANIFEST_NAME} нет элемента manifest')
+
+    metadata = children(root, 'metadata')
+    version = child_text(metadata[0], 'schemaversion') if metadata else ''
+
+    resources = {}
+    for resources_element in children(root, 'resources'):
+        for resource in children(resources_element, 'resource'):
+            href = resource.get('href', '')
+            base = posixpath.join(xml_base(root), xml_base(resources_element), xml_base(resource))
+            resources[resource.get('identifier', '')] = {
+                'type': attribute(resource, 'scormType'),
+                'href': normalize_path(posixpath.join(base, href)) if href else '',
+            }
+
+    organizations = []
+    default_organization = ''
+    for organizations_element in children(root, 'organizations'):
+        default_organization = organizations_element.get('default', '')
+        for organization in children(organizations_element, 'organization'):
+            organizations.append({
+                'identifier': organization.get('identifier', ''),
+                'title': child_text(organization, 'title'),
+                'items': parse_items(organization),
+            })
+
+    return {
+        'identifier': root.get('identifier', ''),
+        'version': version,
+        'default_organization': default_organization,
+        'organizations': organizations,
+        'resources': resources,
+        'launch': launch_path(organizations, default_organization, resources),
+    }
+
+
+def launch_path(organizations, default_organization, resources):
+    """href ресурса первого элемента организации по умолчанию"""
+    ordered = sorted(organizations, key=lambda organization: organization['identifier'] != default_organization)
+    for organization in ordered:
+        pending = list(organization['items'])
+        while pending:
+            item = pending.pop(0)
+            resource = resources.get(item['resource'])
+            if resource and resource['href']:
+                return resource['href'] + (item['parameters'] if item['parameters'].startswith('?') else '')
+            pending[:0] = item['items']
+    for resource in resources.values():
+        if resource['href']:
+            return resource['href']
+    return ''
+
+
+def open_archive(package):
+    # Отдельный файловый объект на каждый вызов: FieldFile.open переиспользует один
+    return package.package_file.storage.open(package.package_file.name, 'rb')
+
+
+def data_offset(archive_file, info):
+    """Смещение данных файла: длины имени и extra в локальном заголовке могут отличаться от каталога"""
+    archive_file.seek(info.header_offset)
+    header = archive_file.read(LOCAL_HEADER.size)
+    if len(header) != LOCAL_HEADER.size:
+        raise ScormError(f'Поврежден заголовок файла {info.filename}')
+    fields = LOCAL_HEADER.unpack(header)
+    if fields[0] != LOCAL_HEADER_SIGNATURE:
+        raise ScormError(f'Поврежден заголовок файла {info.filename}')
+    return info.header_offset + LOCAL_HEADER.size + fields[9] + fields[10]
+
+
+def read_index(archive_file):
+    """Манифест и строки индекса (путь, смещение, размеры, сжатие, CRC) одного архива"""
+    try:
+        archive = zipfile.ZipFile(archive_file)
+    except (zipfile.BadZipFile, OSError) as e:
+        raise ScormError(f'Файл не является zip-архивом: {e}')
+
+    entries = {}
+    for info in archive.infolist():
+        if info.is_dir():
+            continue
+        path = normalize_path(info.filename)
+        if path is None:
+            raise ScormError(f'Недопустимый путь в архиве: {info.filename}')
+        if info.flag_bits & 0x1:
+            raise ScormError(f'Зашифрованный файл: {info.filename}')
+        if info.compress_type not in SUPPORTED_COMPRESSION:
+            raise ScormError(f'Неподдерживаемый метод сжатия у {info.filename}')
+        entries[path] = info
+
+    if MANIFEST_NAME not in entries:
+        raise ScormError(f'В корне пакета нет {MANIFEST_NAME}')
+    if entries[MANIFEST_NAME].file_size > MANIFEST_MAX_SIZE:
+        raise ScormError(f'{MANIFEST_NAME} слишком большой')
+    manifest = parse_manifest(archive.read(entries[MANIFEST_NAME]))
+
+    rows = [
+        (path, data_offset(archive_file, info), info.compress_size, info.file_size, info.compress_type, info.CRC)
+        for path, info in entries.items()
+    ]
+    return manifest, rows
+
+
+def index_package(package):
+    """Разбирает манифест и сохраняет индекс файлов пакета"""
+    with open_archive(package) as archive_file:
+        manifest, rows = read_index(archive_file)
+    if manifest['launch'] and normalize_path(manifest['launch'].split('?', 1)[0]) not in {row[0] for row in rows}:
+        raise ScormError(f"Точка входа {manifest['launch']} отсутствует в пакете")
+
+    with transaction.atomic():
+        SCORMFile.objects.filter(package=package).delete()
+        SCORMFile.objects.bulk_create(
+            (
+                SCORMFile(
+                    package=package, path=path, data_offset=offset, compressed_size=compressed_size,
+                    file_size=file_size, compress_type=compress_type, crc32=crc,
+                )
+                for path, offset, compressed_size, file_size, compress_type, crc in rows
+            ),
+            batch_size=1000,
+        )
+        package.manifest = manifest
+        package.launch_path = manifest['launch']
+        if manifest['version']:
+            package.version = manifest['version'][:50]
+        package.indexed_at = timezone.now()
+        # update вместо save: сигнал post_save пакета не должен запускать индексацию повторно
+        type(package).objects.filter(pk=package.pk).update(
+            manifest=package.manifest, launch_path=package.launch_path, version=package.version,
+            indexed_at=package.indexed_at,
+        )
+    return len(rows)
+
+
+def read_raw(package, entry, start=0, length=None):
+    """Сырые байты данных файла из архива начиная со start"""
+    archive_file = open_archive(package)
+    archive_file.seek(entry.data_offset + start)
+    remaining = entry.compressed_size - start if length is None else length
+    try:
+        while remaining > 0:
+            chunk = archive_file.read(min(CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+    finally:
+        archive_file.close()
+
+
+def inflate(chunks):
+    decompressor = zlib.decompressobj(-zlib.MAX_WBITS)
+    for chunk in chunks:
+        data = decompressor.decompress(chunk)
+        if data:
+            yield data
+    tail = decompressor.flush()
+    if tail:
+        yield tail
+
+
+def gzip_wrap(chunks, entry):
+    yield GZIP_HEADER
+    yield from chunks
+    yield struct.pack('<II', entry.crc32 & 0xFFFFFFFF, entry.file_size & 0xFFFFFFFF)
+
+
+def accepts_gzip(request):
+    return 'gzip' in request.META.get('HTTP_ACCEPT_ENCODING', '')
+
+
+def with_api_script(page):
+    """HTML-страница пакета с подключенным мостом к API плеера: первым скриптом в head"""
+    tag = f'<script src="{static(API_SCRIPT)}"></script>'.encode()
+    # Без head скрипт ставится после doctype, чтобы страница не ушла в режим совместимости
+    match = HEAD_RE.search(page) or DOCTYPE_RE.match(page)
+    position = match.end() if match else 0
+    return page[:position] + tag + page[position:]
+
+
+def access_token(package, user):
+    """Токен доступа к файлам пакета для пользователя"""
+    return signing.dumps([package.id, user.id], salt=ACCESS_SALT)
+
+
+def check_access_token(token, package_id):
+    """id пользователя из токена или None, если токен подделан, истек или выдан для другого пакета"""
+    try:
+        token_package_id, user_id = signing.loads(token, salt=ACCESS_SALT, max_age=ACCESS_MAX_AGE)
+    except (signing.BadSignature, TypeError, ValueError):
+        return None
+    return user_id if token_package_id == package_id else None
+
+
+def serve_entry(request, package, entry):
+    """Отдает файл пакета с ETag, Last-Modified, Range и gzip без распаковки"""
+    # Содержимое файла в пакете не меняется до переиндексации; у gzip-представления
+    # и у страницы с мостом к API свои ETag
+    content_type = guess_content_type(entry.path)
+    deflated = entry.compress_type == zipfile.ZIP_DEFLATED
+    page = content_type == 'text/html' and entry.file_size <= API_PAGE_MAX_SIZE
+    gzipped = deflated and not page and accepts_gzip(request)
+    last_modified = int(package.indexed_at.timestamp())
+    suffix = '-api' if page else '-gz' if gzipped else ''
+    etag = f'"{entry.crc32:08x}-{entry.file_size:x}-{last_modified:x}{suffix}"'
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is None:
+        if page:
+            data = b''.join(read_raw(package, entry))
+            response = HttpResponse(with_api_script(zlib.decompress(data, -zlib.MAX_WBITS) if deflated else data))
+        elif deflated:
+            if gzipped:
+                response = StreamingHttpResponse(gzip_wrap(read_raw(package, entry), entry))
+                response['Content-Encoding'] = 'gzip'
+                response['Content-Length'] = len(GZIP_HEADER) + entry.compressed_size + 8
+            else:
+                response = StreamingHttpResponse(inflate(read_raw(package, entry)))
+                response['Content-Length'] = entry.file_size
+        else:
+            try:
+                byte_range = requested_byte_range(request, entry.file_size, etag, last_modified)
+            except RangeNotSatisfiable:
+                response = HttpResponse(status=416)
+                response['Content-Range'] = f'bytes */{entry.file_size}'
+                return response
+            if byte_range is None:
+                response = StreamingHttpResponse(read_raw(package, entry))
+                response['Content-Length'] = entry.file_size
+            else:
+                start, end = byte_range
+                response = StreamingHttpResponse(read_raw(package, entry, start, end - start + 1), status=206)
+                response['Content-Length'] = end - start + 1
+                response['Content-Range'] = f'bytes {start}-{end}/{entry.file_size}'
+            response['Accept-Ranges'] = 'bytes'
+        set_file_headers(response, posixpath.basename(entry.path), content_type, inline=True)
+        response['Content-Security-Policy'] = SANDBOX_POLICY
+        # Токен в URL не должен уходить на внешние ресурсы пакета
+        response['Referrer-Policy'] = 'no-referrer'
+
+    # 304 тоже: кэш выбирает сохраненное представление по тем же заголовкам, что и 200
+    patch_vary_headers(response, ['Accept-Encoding'])
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(last_modified)
+    return response
@@ -0,0 +1,222 @@
+"""Полнотекстовый поиск по работам, комментариям, заданиям и чату (SQLite FTS5).
+
+Все документы лежат в одной виртуальной таблице accounts_search_index
+(миграция 0014) с двумя колонками:
+
+* ``body`` — текст документа;
+* ``scope`` — служебные токены ``c<id курса>`` и ``k<вид>``.
+
+rowid документа — ``object_id * 4 + вид``, поэтому вид и id объекта
+восстанавливаются без отдельных колонок. Ограничение курсами преподавателя
+и видом документа — часть выражения MATCH: FTS5 пересекает списки вхождений
+в индексе, а не отфильтровывает найденные строки после поиска.
+
+Индекс обновляется сигналами в той же транзакции, что и сами данные; пакетные
+операции (bulk_create, update) вызывают reindex явно. Полная перестройка —
+команда rebuild_search_index. На базах, отличных от SQLite, поиск отключен.
+"""
+import re
+
+from django.db import connection
+from django.urls import reverse
+from django.utils.html import escape
+
+from .models import Assignment, ChatMessage, ChatRoom, Grade, Homework
+
+TABLE = 'accounts_search_index'
+
+HOMEWORK, GRADE, ASSIGNMENT, CHAT = range(4)
+KINDS = {'homework': HOMEWORK, 'grade': GRADE, 'assignment': ASSIGNMENT, 'chat': CHAT}
+KIND_NAMES = {kind: name for name, kind in KINDS.items()}
+KIND_COUNT = len(KINDS)
+
+TERM_RE = re.compile(r'\w+')
+MAX_TERMS = 8
+SNIPPET_TOKENS = 16
+BATCH_SIZE = 500
+
+# Маркеры подсветки: управляющие символы, которых нет в проиндексированном тексте
+MARK_START = '\x02'
+MARK_END = '\x03'
+
+
+def clean_sql(column):
+    return f"replace(replace({column}, char(2), ''), char(3), '')"
+
+
+# SELECT (rowid, body, scope) для каждого вида документа; {where} — условие на id объекта
+DOCUMENT_SQL = {
+    HOMEWORK: (
+        f"SELECT h.id * {KIND_COUNT} + {HOMEWORK}, {clean_sql('h.text_content')}, 'c' || a.course_id || ' k{HOMEWORK}' "
+        f'FROM {Homework._meta.db_table} h JOIN {Assignment._meta.db_table} a ON a.id = h.assignment_id '
+        "WHERE h.text_content <> '' {where}"
+    ),
+    GRADE: (
+        f"SELECT g.id * {KIND_COUNT} + {GRADE}, {clean_sql('trim(g.comment || char(10) || g.revision_comment)')}, "
+        f"'c' || a.course_id || ' k{GRADE}' "
+        f'FROM {Grade._meta.db_table} g JOIN {Homework._meta.db_table} h ON h.id = g.homework_id '
+        f'JOIN {Assignment._meta.db_table} a ON a.id = h.assignment_id '
+        "WHERE (g.comment <> '' OR g.revision_comment <> '') {where}"
+    ),
+    ASSIGNMENT: (
+        f"SELECT a.id * {KIND_COUNT} + {ASSIGNMENT}, {clean_sql('a.title || char(10) || a.description')}, "
+        f"'c' || a.course_id || ' k{ASSIGNMENT}' "
+        f'FROM {Assignment._meta.db_table} a WHERE 1 = 1 {{where}}'
+    ),
+    CHAT: (
+        f"SELECT m.id * {KIND_COUNT} + {CHAT}, {clean_sql('m.message')}, 'c' || r.course_id || ' k{CHAT}' "
+        f'FROM {ChatMessage._meta.db_table} m JOIN {ChatRoom._meta.db_table} r ON r.id = m.room_id '
+        "WHERE m.message <> '' {where}"
+    ),
+}
+
+ID_COLUMNS = {HOMEWORK: 'h.id', GRADE: 'g.id', ASSIGNMENT: 'a.id', CHAT: 'm.id'}
+
+
+def enabled():
+    return connection.vendor == 'sqlite'
+
+
+def batches(ids):
+    ids = list(ids)
+    for start in range(0, len(ids), BATCH_SIZE):
+        yield ids[start:start + BATCH_SIZE]
+
+
+def reindex(kind, object_ids):
+    """Перечитывает документы вида kind из таблиц и заменяет их в индексе"""
+    if not enabled():
+        return
+    with connection.cursor() as cursor:
+        for batch in batches(object_ids):
+            placeholders = ', '.join(['%s'] * len(batch))
+            cursor.execute(
+                f'DELETE FROM {TABLE} WHERE rowid IN ({placeholders})',
+                [object_id * KIND_COUNT + kind for object_id in batch],
+            )
+            select = DOCUMENT_SQL[kind].format(where=f'AND {ID_COLUMNS[kind]} IN ({placeholders})')
+            cursor.execute(f'INSERT INTO {TABLE}(rowid, body, scope) {select}', batch)
+
+
+def remove(kind, object_ids):
+    if not enabled():
+        return
+    with connection.cursor() as cursor:
+        for batch in batches(object_ids):
+            cursor.execute(
+                f"DELETE FROM {TABLE} WHERE rowid IN ({', '.join(['%s'] * len(batch))})",
+                [object_id * KIND_COUNT + kind for object_id in batch],
+            )
+
+
+def reindex_grades(homework_ids):
+    """Оценки, записанные пакетно по id работ"""
+    reindex(GRADE, Grade.objects.filter(homework_id__in=list(homework_ids)).values_list('id', flat=True))
+
+
+def rebuild():
+    """Перестраивает индекс целиком; возвращает число документов по видам"""
+    counts = {}
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {TABLE}')
+        for kind, select in DOCUMENT_SQL.items():
+            cursor.execute(f"INSERT INTO {TABLE}(rowid, body, scope) {select.format(where='')}")
+            counts[KIND_NAMES[kind]] = cursor.rowcount
+        cursor.execute(f"INSERT INTO {TABLE}({TABLE}) VALUES ('optimize')")
+    return counts
+
+
+def match_expression(text, course_ids, kinds=None):
+    """Выражение MATCH: все слова запроса (последнее — как префикс) в курсах и видах документов.
+
+    Слова берутся как строки в кавычках, поэтому синтаксис FTS5 из запроса
+    пользователя не интерпретируется. None — искать нечего.
+    """
+    terms = TERM_RE.findall(text)[:MAX_TERMS]
+    course_ids = list(course_ids)
+    if not terms or not course_ids:
+        return None
+    words = [f'"{term}"' for term in terms]
+    words[-1] += '*'
+    courses = ' OR '.join(f'c{course_id}' for course_id in course_ids)
+    expression = f"body : ({' '.join(words)}) AND scope : ({courses})"
+    if kinds:
+        expression += f" AND scope : ({' OR '.join(f'k{kind}' for kind in kinds)})"
+    return expression
+
+
+def highlight(snippet):
+    """Экранирует фрагмент и превращает маркеры совпадений в <mark>"""
+    return escape(snippet).replace(MARK_START, '<mark>').replace(MARK_END, '</mark>')
+
+
+def search_documents(course_ids, text, kinds=None, limit=20):
+    """Лучшие по BM25 документы: (вид, id объекта, id курса, фрагмент с подсветкой, оценка)"""
+    if not enabled():
+        return []
+    expression = match_expression(text, course_ids, kinds)
+    if expression is None:
+        return []
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'SELECT rowid, scope, snippet({TABLE}, 0, %s, %s, %s, %s), rank FROM {TABLE} '
+            f'WHERE {TABLE} MATCH %s ORDER BY rank LIMIT %s',
+            [MARK_START, MARK_END, '…', SNIPPET_TOKENS, expression, limit],
+        )
+        rows = cursor.fetchall()
+    return [
+        (rowid % KIND_COUNT, rowid // KIND_COUNT, int(scope.split()[0][1:]), highlight(snippet), -rank)
+        for rowid, scope, snippet, rank in rows
+    ]
+
+
+def describe(results):
+    """Заголовки и ссылки найденных документов: не больше одного запроса на вид"""
+    ids = {}
+    for kind, object_id, course_id, snippet, score in results:
+        ids.setdefault(kind, []).append(object_id)
+    described = {}
+    if HOMEWORK in ids:
+        homeworks = Homework.objects.filter(id__in=ids[HOMEWORK]).values_list(
+            'id', 'assignment__title', 'student__user__last_name', 'student__user__first_name'
+        )
+        for homework_id, title, last_name, first_name in homeworks:
+            described[HOMEWORK, homework_id] = (
+                f'{title} — {last_name} {first_name}'.strip(), reverse('homework_detail', args=[homework_id])
+            )
+    if GRADE in ids:
+        grades = Grade.objects.filter(id__in=ids[GRADE]).values_list('id', 'homework_id', 'homework__assignment__title')
+        for grade_id, homework_id, title in grades:
+            described[GRADE, grade_id] = (
+                f'Комментарий к работе: {title}', reverse('homework_detail', args=[homework_id])
+            )
+    if ASSIGNMENT in ids:
+        for assignment_id, title in Assignment.objects.filter(id__in=ids[ASSIGNMENT]).values_list('id', 'title'):
+            described[ASSIGNMENT, assignment_id] = (title, reverse('assignment_detail', args=[assignment_id]))
+    if CHAT in ids:
+        messages = ChatMessage.objects.filter(id__in=ids[CHAT]).values_list('id', 'room_id', 'room__name')
+        for message_id, room_id, room_name in messages:
+            described[CHAT, message_id] = (
+                f'Чат: {room_name}', f"{reverse('chat_history', args=[room_id])}?after={message_id - 1}"
+            )
+    return [
+        {
+            'kind': KIND_NAMES[kind],
+            'id': object_id,
+            'course_id': course_id,
+            'title': described[kind, object_id][0],
+            'url': described[kind, object_id][1],
+            'snippet': snippet,
+            'score': round(score, 3),
+        }
+        for kind, object_id, course_id, snippet, score in results
+        if (kind, object_id) in described
+    ]
+
+
+def matching_ids_sql(course_ids, text, kind):
+    """Подзапрос id объектов вида kind для фильтра queryset через RawSQL; None — без совпадений"""
+    expression = match_expression(text, course_ids, [kind])
+    if expression is None or not enabled():
+        return None
+    return f'SELECT rowid / {KIND_COUNT} FROM {TABLE} WHERE {TABLE} MATCH %s', [expression]
@@ -0,0 +1,203 @@
+"""Отдача файлов: HTTP Range, условные запросы и разгрузка через веб-сервер.
+
+Способ отдачи выбирается настройкой ATTACHMENT_SERVE_BACKEND:
+
+* ``python`` — файл отдает Django (ETag, Last-Modified, 304, Range); полный
+  файл и «хвост» с заданного смещения передаются через wsgi.file_wrapper,
+  который на gunicorn и uWSGI использует sendfile;
+* ``nginx`` — заголовок X-Accel-Redirect, файл отдает nginx из internal-локации
+  ATTACHMENT_ACCEL_PREFIX, настроенной на MEDIA_ROOT;
+* ``apache`` — заголовок X-Sendfile для mod_xsendfile;
+* путь к собственной функции с той же сигнатурой, что у serve_python.
+
+Проверка прав остается во view: бэкенд вызывается только для разрешенного файла.
+"""
+import mimetypes
+import os
+import re
+from urllib.parse import quote
+
+from django.conf import settings
+from django.http import FileResponse, HttpResponse, StreamingHttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import content_disposition_header, http_date, parse_http_date_safe
+from django.utils.module_loading import import_string
+
+CHUNK_SIZE = 64 * 1024
+
+RANGE_RE = re.compile(r'^\s*bytes\s*=\s*(\d*)\s*-\s*(\d*)\s*$', re.IGNORECASE)
+
+# Вложения загружают студенты: в браузере открываются только типы, которые не
+# исполняют скрипты на домене приложения (HTML, SVG и т.п. — только скачивание)
+INLINE_CONTENT_TYPES = {'application/pdf', 'image/png', 'image/jpeg', 'image/gif', 'text/plain'}
+
+
+class RangeNotSatisfiable(Exception):
+    """Запрошенный диапазон лежит за пределами файла (ответ 416)"""
+
+
+def parse_byte_range(header, size):
+    """Разбирает заголовок Range с единственным диапазоном.
+
+    Возвращает (start, end) включительно или None, если заголовок
+    отсутствует или не поддерживается (например, несколько диапазонов) —
+    в этом случае отдается весь файл.
+    """
+    if not header:
+        return None
+    match = RANGE_RE.match(header)
+    if not match:
+        return None
+    first, last = match.groups()
+    if not first and not last:
+        return None
+    if not first:
+        # bytes=-500: последние 500 байт
+        length = int(last)
+        if length == 0:
+            raise RangeNotSatisfiable
+        return max(size - length, 0), size - 1
+    start = int(first)
+    end = int(last) if last else size - 1
+    if start >= size:
+        raise RangeNotSatisfiable
+    if end < start:
+        return None
+    return start, min(end, size - 1)
+
+
+def requested_byte_range(request, size, etag=None, last_modified=None):
+    """Диапазон из запроса с учетом If-Range.
+
+    Если If-Range не совпадает с текущей версией ресурса, Range игнорируется
+    и клиент получает файл целиком.
+    """
+    header = request.META.get('HTTP_RANGE')
+    if not header:
+        return None
+    if_range = request.META.get('HTTP_IF_RANGE')
+    if if_range:
+        if if_range.startswith(('"', 'W/')):
+            if etag is None or if_range.startswith('W/') or if_range != etag:
+                return None
+        else:
+            if_range_date = parse_http_date_safe(if_range)
+            if last_modified is None or if_range_date is None or int(last_modified) != if_range_date:
+                return None
+    return parse_byte_range(header, size)
+
+
+def guess_content_type(filename):
+    content_type, encoding = mimetypes.guess_type(filename)
+    if encoding or not content_type:
+        return 'application/octet-stream'
+    return content_type
+
+
+def read_range(file, length, chunk_size=CHUNK_SIZE):
+    """Читает length байт с текущей позиции и закрывает файл"""
+    try:
+        while length > 0:
+            chunk = file.read(min(chunk_size, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
+    finally:
+        file.close()
+
+
+def set_file_headers(response, filename, content_type, inline):
+    response['Content-Type'] = content_type
+    response['Content-Disposition'] = content_disposition_header(not inline, filename)
+    response['Cache-Control'] = f"private, max-age={getattr(settings, 'ATTACHMENT_CACHE_MAX_AGE', 3600)}"
+    response['X-Content-Type-Options'] = 'nosniff'
+    return response
+
+
+def set_attachment_headers(response, filename, inline):
+    """Заголовки вложения: неизвестные и активные типы отдаются только на скачивание"""
+    content_type = guess_content_type(filename)
+    if content_type not in INLINE_CONTENT_TYPES:
+        content_type = 'application/octet-stream'
+        inline = False
+    set_file_headers(response, filename, content_type, inline)
+    if inline:
+        response['Content-Security-Policy'] = 'sandbox'
+    return response
+
+
+def serve_python(request, path, name, filename, inline=False):
+    """Отдача файла самим Django с поддержкой условных запросов и Range"""
+    stat = os.stat(path)
+    size = stat.st_size
+    etag = f'"{size:x}-{stat.st_mtime_ns:x}"'
+    last_modified = int(stat.st_mtime)
+
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is None:
+        try:
+            byte_range = requested_byte_range(request, size, etag, last_modified)
+        except RangeNotSatisfiable:
+            response = HttpResponse(status=416)
+            response['Content-Range'] = f'bytes */{size}'
+            return response
+
+        file = open(path, 'rb')
+        if byte_range is None:
+            response = FileResponse(file)
+        else:
+            start, end = byte_range
+            file.seek(start)
+            if end == size - 1:
+                # Хвост файла: FileResponse считает Content-Length от текущей позиции,
+                # и сервер может передать его через sendfile
+                response = FileResponse(file, status=206)
+            else:
+                response = StreamingHttpResponse(read_range(file, end - start + 1), status=206)
+                response['Content-Length'] = end - start + 1
+            response['Content-Range'] = f'bytes {start}-{end}/{size}'
+        set_attachment_headers(response, filename, inline)
+        response['Accept-Ranges'] = 'bytes'
+
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(last_modified)
+    return response
+
+
+def serve_x_accel(request, path, name, filename, inline=False):
+    """Передает отдачу nginx: Range и условные запросы обрабатывает он"""
+    prefix = getattr(settings, 'ATTACHMENT_ACCEL_PREFIX', '/protected-media/')
+    response = HttpResponse()
+    set_attachment_headers(response, filename, inline)
+    response['X-Accel-Redirect'] = prefix.rstrip('/') + '/' + quote(name.lstrip('/'))
+    return response
+
+
+def serve_x_sendfile(request, path, name, filename, inline=False):
+    """Передает отдачу Apache с mod_xsendfile"""
+    response = HttpResponse()
+    set_attachment_headers(response, filename, inline)
+    response['X-Sendfile'] = path
+    return response
+
+
+SERVE_BACKENDS = {
+    'python': serve_python,
+    'nginx': serve_x_accel,
+    'apache': serve_x_sendfile,
+}
+
+
+def serve_file(request, path, name, filename, inline=False):
+    """Отдает файл выбранным в настройках способом.
+
+    path — путь на диске, name — имя в хранилище (относительно MEDIA_ROOT),
+    filename — имя, под которым файл получит пользователь.
+    """
+    backend = getattr(settings, 'ATTACHMENT_SERVE_BACKEND', 'python')
+    if backend in SERVE_BACKENDS:
+        backend = SERVE_BACKENDS[backend]
+    else:
+        backend = import_string(backend)
+    return backend(request, path, name, filename, inline=inline)
@@ -0,0 +1,417 @@
+"""Обработчики сигналов, поддерживающие денормализованные данные в актуальном состоянии"""
+from functools import partial
+
+from django.db import transaction
+from django.contrib.auth.models import Group, User
+from django.db.models.signals import m2m_changed, post_delete, post_init, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+
+from .autograde import invalidate_answer_key
+from .chat import invalidate_sender_names, publish_message
+from .gradebook import schedule_version_bump
+from .models import (
+    Assignment, Attachment, ChatMessage, Course, CourseEnrollment, CourseStats, Grade, Homework,
+    SCORMPackage, StudentCourseProgress, TestAnswer, TestQuestion,
+)
+from . import search, similarity
+from .fragments import (
+    course_homeworks_tag, course_tag, homework_tag, schedule_invalidation, teacher_tag,
+)
+from .roles import invalidate_teacher_ids, invalidate_user_roles
+from .scorm import ScormError, index_package
+from .storage import acquire_blob, release_blob
+
+
+def schedule_course_refresh(course_id):
+    """Пересчитывает статистику курса после фиксации транзакции"""
+    CourseStats.schedule_refresh([course_id])
+
+
+def schedule_progress_refresh(course_id, student_ids=None):
+    """Пересчитывает прогресс студентов курса (всех или только student_ids) после фиксации транзакции"""
+    StudentCourseProgress.schedule_refresh(course_id, student_ids)
+
+
+def cascade_course_id(origin):
+    """Курс, при удалении которого или его задания объект удаляется каскадом"""
+    if isinstance(origin, Course):
+        return origin.pk
+    if isinstance(origin, Assignment):
+        return origin.course_id
+    return None
+
+
+def homework_course_id(homework, origin=None):
+    """Курс работы без лишнего запроса, если задание уже загружено или удаляется курс"""
+    course_id = cascade_course_id(origin)
+    if course_id is not None:
+        return course_id
+    if Homework.assignment.field.is_cached(homework):
+        return homework.assignment.course_id
+    return Assignment.objects.filter(pk=homework.assignment_id).values_list('course_id', flat=True).first()
+
+
+def grade_course_student(grade, origin=None):
+    """Курс и студент работы, к которой относится оценка; при каскаде от курса студент None"""
+    course_id = cascade_course_id(origin)
+    if course_id is not None:
+        return course_id, None
+    if Grade.homework.field.is_cached(grade):
+        return homework_course_id(grade.homework), grade.homework.student_id
+    return Homework.objects.filter(pk=grade.homework_id).values_list(
+        'assignment__course_id', 'student_id'
+    ).first() or (None, None)
+
+
+@receiver([post_save, post_delete], sender=CourseEnrollment)
+@receiver([post_save, post_delete], sender=Assignment)
+def course_child_changed(sender, instance, **kwargs):
+    schedule_course_refresh(instance.course_id)
+    schedule_version_bump([instance.course_id])
+
+
+@receiver([post_save, post_delete], sender=CourseEnrollment)
+def enrollment_changed(sender, instance, **kwargs):
+    schedule_progress_refresh(instance.course_id, [instance.student_id])
+
+
+@receiver([post_save, post_delete], sender=Assignment)
+def assignment_changed(sender, instance, **kwargs):
+    # Число заданий и максимальный балл входят в прогресс всех студентов курса
+    schedule_progress_refresh(instance.course_id)
+
+
+@receiver(m2m_changed, sender=Course.students.through)
+def course_students_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    # course.students.add() пишет CourseEnrollment через bulk_create без post_save
+    if reverse and action == 'pre_clear':
+        # clear() со стороны студента не передает pk_set, запоминаем курсы заранее
+        instance._cleared_course_ids = list(
+            CourseEnrollment.objects.filter(student=instance).values_list('course_id', flat=True)
+        )
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if not reverse:
+        schedule_course_refresh(instance.pk)
+        schedule_version_bump([instance.pk])
+        # clear() со стороны курса не передает pk_set — пересчитывается весь курс
+        schedule_progress_refresh(instance.pk, None if action == 'post_clear' else list(pk_set or ()))
+        return
+    if action == 'post_clear':
+        pk_set = instance.__dict__.pop('_cleared_course_ids', [])
+    for course_id in pk_set or ():
+        schedule_course_refresh(course_id)
+        schedule_progress_refresh(course_id, [instance.pk])
+    schedule_version_bump(pk_set or ())
+
+
+# Пересчеты копятся за транзакцию (см. commit.py): каскадное удаление курса
+# пересчитывает его один раз, а не на каждую работу и оценку
+@receiver([post_save, post_delete], sender=Homework)
+def homework_changed(sender, instance, origin=None, **kwargs):
+    course_id = homework_course_id(instance, origin)
+    schedule_course_refresh(course_id)
+    schedule_progress_refresh(course_id, None if cascade_course_id(origin) else [instance.student_id])
+    schedule_version_bump([course_id])
+    # Работа перенесена в задание другого курса (см. homework_remember_previous_course): прежний курс ее теряет
+    previous_course_id = instance.__dict__.get('_previous_course_id')
+    if previous_course_id is not None and previous_course_id != course_id:
+        schedule_course_refresh(previous_course_id)
+        schedule_progress_refresh(previous_course_id, [instance.student_id])
+        schedule_version_bump([previous_course_id])
+
+
+@receiver([post_save, post_delete], sender=Grade)
+def grade_changed(sender, instance, origin=None, **kwargs):
+    course_id, student_id = grade_course_student(instance, origin)
+    schedule_course_refresh(course_id)
+    schedule_progress_refresh(course_id, None if student_id is None else [student_id])
+    schedule_version_bump([course_id])
+
+
+@receiver(pre_save, sender=Attachment)
+def attachment_remember_file(sender, instance, **kwargs):
+    if instance.pk:
+        instance._previous_file_name = Attachment.objects.filter(pk=instance.pk).values_list(
+            'file', flat=True
+        ).first()
+
+
+@receiver(post_save, sender=Attachment)
+def attachment_saved(sender, instance, created, **kwargs):
+    previous = instance.__dict__.pop('_previous_file_name', None)
+    if created or previous != instance.file.name:
+        acquire_blob(instance.file.name, instance.file.storage)
+        if previous:
+            release_blob(previous, instance.file.storage)
+
+
+@receiver(post_delete, sender=Attachment)
+def attachment_deleted(sender, instance, **kwargs):
+    release_blob(instance.file.name, instance.file.storage)
+
+
+@receiver(m2m_changed, sender=User.groups.through)
+def user_groups_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if reverse and action == 'pre_clear':
+        # group.user_set.clear() не передает pk_set, запоминаем участников заранее
+        instance._cleared_user_ids = list(instance.user_set.values_list('pk', flat=True))
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if not reverse:
+        invalidate_user_roles([instance.pk])
+    else:
+        if action == 'post_clear':
+            pk_set = instance.__dict__.pop('_cleared_user_ids', [])
+        invalidate_user_roles(pk_set or [])
+    invalidate_teacher_ids()
+
+
+@receiver(pre_delete, sender=Group)
+def group_remember_members(sender, instance, **kwargs):
+    instance._member_ids = list(instance.user_set.values_list('pk', flat=True))
+
+
+@receiver([post_save, post_delete], sender=Group)
+def group_changed(sender, instance, created=False, **kwargs):
+    if created:
+        return
+    member_ids = instance.__dict__.pop('_member_ids', None)
+    if member_ids is None:
+        member_ids = list(instance.user_set.values_list('pk', flat=True))
+    invalidate_user_roles(member_ids)
+    invalidate_teacher_ids()
+
+
+def schedule_answer_key_invalidation(assignment_id):
+    # Сброс и сразу, и после фиксации: иначе параллельный запрос может
+    # закэшировать ключ по еще не зафиксированным данным
+    if assignment_id is not None:
+        invalidate_answer_key(assignment_id)
+        transaction.on_commit(partial(invalidate_answer_key, assignment_id))
+
+
+@receiver([post_save, post_delete], sender=TestQuestion)
+def test_question_changed(sender, instance, **kwargs):
+    schedule_answer_key_invalidation(instance.assignment_id)
+
+
+@receiver([post_save, post_delete], sender=TestAnswer)
+def test_answer_changed(sender, instance, **kwargs):
+    if TestAnswer.question.field.is_cached(instance):
+        assignment_id = instance.question.assignment_id
+    else:
+        assignment_id = TestQuestion.objects.filter(pk=instance.question_id).values_list(
+            'assignment_id', flat=True
+        ).first()
+    schedule_answer_key_invalidation(assignment_id)
+
+
+@receiver(post_save, sender=ChatMessage)
+def chat_message_created(sender, instance, created, **kwargs):
+    # Подписчики получают сообщение только после фиксации, иначе оно может исчезнуть при откате
+    if created:
+        transaction.on_commit(partial(publish_message, instance))
+
+
+USER_NAME_FIELDS = ('first_name', 'last_name', 'username')
+
+
+def user_names(user):
+    return tuple(user.__dict__.get(field) for field in USER_NAME_FIELDS)
+
+
+@receiver(post_init, sender=User)
+def user_remember_names(sender, instance, **kwargs):
+    # Имена запоминаются без запроса: сохранение без update_fields не обходит работы и курсы,
+    # если имя не менялось
+    if instance.pk is not None:
+        instance._saved_names = user_names(instance)
+
+
+@receiver(pre_save, sender=User)
+def user_check_renamed(sender, instance, update_fields=None, **kwargs):
+    names = user_names(instance)
+    # Вход пользователя обновляет только last_login — имя в кэшах не меняется; без запомненных
+    # имен (объект создан не из базы) считается, что имя могло измениться
+    instance._renamed = (
+        (update_fields is None or bool(set(USER_NAME_FIELDS) & set(update_fields)))
+        and names != instance.__dict__.get('_saved_names')
+    )
+    instance._saved_names = names
+
+
+@receiver(post_save, sender=User)
+def user_renamed(sender, instance, created, **kwargs):
+    if created or not instance.__dict__.get('_renamed'):
+        return
+    room_ids = ChatMessage.objects.filter(sender=instance).values_list('room_id', flat=True).distinct()
+    invalidate_sender_names(list(room_ids))
+    # Имя студента есть в журналах его курсов
+    schedule_version_bump(list(CourseEnrollment.objects.filter(student__user=instance).values_list('course_id', flat=True)))
+
+
+@receiver(pre_save, sender=SCORMPackage)
+def scorm_package_remember_file(sender, instance, **kwargs):
+    if instance.pk:
+        instance._previous_file_name = SCORMPackage.objects.filter(pk=instance.pk).values_list(
+            'package_file', flat=True
+        ).first()
+
+
+def index_saved_package(package):
+    try:
+        index_package(package)
+    except ScormError as e:
+        # Пакет без индекса не открывается; причину показывает scorm_upload или index_scorm_packages
+        package._index_error = str(e)
+
+
+@receiver(post_save, sender=SCORMPackage)
+def scorm_package_saved(sender, instance, created, **kwargs):
+    # Индекс строится один раз на загруженный архив и после фиксации: разбор zip
+    # не держит транзакцию сохранения открытой
+    previous = instance.__dict__.pop('_previous_file_name', None)
+    if created or previous != instance.package_file.name:
+        if not created:
+            # Старый индекс указывает на смещения в прежнем архиве
+            SCORMPackage.objects.filter(pk=instance.pk).update(indexed_at=None)
+            instance.indexed_at = None
+        transaction.on_commit(partial(index_saved_package, instance))
+
+
+# Полнотекстовый индекс обновляется в той же транзакции, что и сами данные
+SEARCH_FIELDS = {
+    Homework: (search.HOMEWORK, {'text_content', 'assignment'}),
+    Grade: (search.GRADE, {'comment', 'revision_comment', 'homework'}),
+    Assignment: (search.ASSIGNMENT, {'title', 'description', 'course'}),
+    ChatMessage: (search.CHAT, {'message', 'room'}),
+}
+
+
+@receiver(post_save, sender=Homework)
+@receiver(post_save, sender=Grade)
+@receiver(post_save, sender=Assignment)
+@receiver(post_save, sender=ChatMessage)
+def search_document_saved(sender, instance, created, update_fields=None, **kwargs):
+    kind, fields = SEARCH_FIELDS[sender]
+    if created or update_fields is None or fields & set(update_fields):
+        search.reindex(kind, [instance.pk])
+
+
+@receiver(post_delete, sender=Homework)
+@receiver(post_delete, sender=Grade)
+@receiver(post_delete, sender=Assignment)
+@receiver(post_delete, sender=ChatMessage)
+def search_document_deleted(sender, instance, origin=None, **kwargs):
+    # Документы каскада от курса или задания уже удалены пачками в search_cascade_deleting
+    if sender is not ChatMessage and origin is not instance and cascade_course_id(origin) is not None:
+        return
+    search.remove(SEARCH_FIELDS[sender][0], [instance.pk])
+
+
+@receiver(pre_delete, sender=Course)
+@receiver(pre_delete, sender=Assignment)
+def search_cascade_deleting(sender, instance, origin=None, **kwargs):
+    # Сигнал отправляется внутри транзакции удаления, поэтому при откате документы вернутся
+    if origin is not instance:
+        return
+    if sender is Course:
+        assignments = Assignment.objects.filter(course=instance)
+        search.remove(search.ASSIGNMENT, assignments.values_list('id', flat=True))
+    else:
+        assignments = Assignment.objects.filter(pk=instance.pk)
+    homeworks = Homework.objects.filter(assignment__in=assignments)
+    search.remove(search.HOMEWORK, homeworks.values_list('id', flat=True))
+    search.remove(search.GRADE, Grade.objects.filter(homework__in=homeworks).values_list('id', flat=True))
+
+
+def signature_source(instance):
+    """Текст и задание работы, от которых зависит сигнатура; None, если поля отложены"""
+    fields = instance.__dict__
+    if 'text_content' not in fields or 'assignment_id' not in fields:
+        return None
+    return fields['text_content'], fields['assignment_id']
+
+
+@receiver(post_init, sender=Homework)
+def homework_remember_saved_fields(sender, instance, **kwargs):
+    # Исходные значения запоминаются без запроса: сохранение только статуса не пересчитывает
+    # сигнатуру, а перенос работы в другое задание виден без чтения старой строки
+    if instance.pk is not None:
+        instance._signature_source = signature_source(instance)
+        instance._saved_assignment_id = instance.__dict__.get('assignment_id')
+
+
+@receiver(post_save, sender=Homework)
+def homework_signature_saved(sender, instance, created, update_fields=None, **kwargs):
+    # Сигнатура считается один раз при изменении текста, а не при каждом построении отчета
+    if not created and update_fields is not None and not {'text_content', 'assignment'} & set(update_fields):
+        return
+    source = signature_source(instance)
+    if created or source is None or source != instance.__dict__.get('_signature_source'):
+        similarity.update_signatures([(instance.pk, instance.assignment_id, instance.text_content)])
+    instance._signature_source = source
+
+
+@receiver(pre_save, sender=Homework)
+def homework_remember_previous_course(sender, instance, **kwargs):
+    # Курс, из которого работа переносится этим сохранением; None — работа осталась в своем курсе
+    saved = instance.__dict__.get('_saved_assignment_id')
+    instance._previous_course_id = None
+    if saved is not None and saved != instance.assignment_id:
+        instance._previous_course_id = Assignment.objects.filter(pk=saved).values_list('course_id', flat=True).first()
+    instance._saved_assignment_id = instance.assignment_id
+
+
+@receiver(post_init, sender=Course)
+def course_remember_teacher(sender, instance, **kwargs):
+    if instance.pk is not None:
+        instance._saved_teacher_id = instance.__dict__.get('teacher_id')
+
+
+# Фрагменты панели преподавателя (см. fragments.py); счетчики курсов
+# инвалидирует CourseStats.refresh
+@receiver([post_save, post_delete], sender=Course)
+def course_fragments_changed(sender, instance, **kwargs):
+    tags = [course_tag(instance.pk), teacher_tag(instance.teacher_id)]
+    # Курс передан другому преподавателю: он пропадает и из панели прежнего
+    previous = instance.__dict__.get('_saved_teacher_id')
+    if previous is not None and previous != instance.teacher_id:
+        tags.append(teacher_tag(previous))
+    instance._saved_teacher_id = instance.teacher_id
+    schedule_invalidation(tags)
+
+
+@receiver([post_save, post_delete], sender=Assignment)
+def assignment_fragments_changed(sender, instance, **kwargs):
+    schedule_invalidation([course_tag(instance.course_id)])
+
+
+@receiver(post_save, sender=Homework)
+@receiver(post_delete, sender=Homework)
+def homework_fragments_changed(sender, instance, created=False, update_fields=None, origin=None, **kwargs):
+    tags = [homework_tag(instance.pk)]
+    # Новая, удаленная или заново сданная работа меняет состав списка последних работ
+    if created or update_fields is None or {'submitted_at', 'assignment', 'student'} & set(update_fields):
+        course_id = homework_course_id(instance, origin)
+        if course_id is not None:
+            tags.append(course_homeworks_tag(course_id))
+    previous_course_id = instance.__dict__.get('_previous_course_id')
+    if previous_course_id is not None:
+        tags.append(course_homeworks_tag(previous_course_id))
+    schedule_invalidation(tags)
+
+
+@receiver([post_save, post_delete], sender=Grade)
+def grade_fragments_changed(sender, instance, **kwargs):
+    schedule_invalidation([homework_tag(instance.homework_id)])
+
+
+@receiver(post_save, sender=User)
+def student_fragments_changed(sender, instance, created, **kwargs):
+    # Флаг _renamed ставит user_check_renamed
+    if created or not instance.__dict__.get('_renamed'):
+        return
+    homework_ids = Homework.objects.filter(student__user=instance).values_list('id', flat=True)
+    schedule_invalidation(homework_tag(homework_id) for homework_id in homework_ids)
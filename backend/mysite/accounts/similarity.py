@@ -0,0 +1,162 @@
+"""Поиск похожих текстовых ответов: MinHash и LSH.
+
+Текст работы разбивается на шинглы — последовательности из SHINGLE_SIZE
+слов. При сохранении текста для работы один раз считается MinHash-сигнатура:
+NUM_HASHES минимумов 32-битных хэшей шинглов, по одному на хэш-функцию.
+Доля совпавших позиций двух сигнатур оценивает коэффициент Жаккара их
+множеств шинглов. Сигнатура хранится в HomeworkSignature (512 байт).
+
+Кандидаты в пары ищутся через LSH: сигнатура режется на BANDS полос по ROWS
+значений, работы с совпавшей полосой попадают в одну корзину. Пара с
+похожестью 0.5 совпадает хотя бы в одной полосе с вероятностью 0.995, а
+сравнивать приходится только пары внутри корзин, а не все n² пар задания.
+"""
+import hashlib
+import re
+import sys
+from array import array
+from collections import Counter, defaultdict
+from itertools import combinations
+
+from django.core.cache import cache
+from django.db.models import Count, Max
+from django.utils import timezone
+
+from .models import HomeworkSignature
+
+WORD_RE = re.compile(r'\w+')
+SHINGLE_SIZE = 3
+
+# Хэши шинглов: blake2b с 64-байтным дайджестом дает 16 32-битных значений,
+# разные соли — независимые хэш-функции
+HASHES_PER_DIGEST = 16
+SALTS = [bytes([index]) * 16 for index in range(8)]
+NUM_HASHES = HASHES_PER_DIGEST * len(SALTS)
+
+ROWS = 3
+BANDS = NUM_HASHES // ROWS
+BAND_BYTES = ROWS * 4
+
+THRESHOLD = 0.5
+REPORT_SIZE = 50
+REPORT_TIMEOUT = 3600
+BATCH_SIZE = 1000
+
+
+def shingles(text):
+    """Множество шинглов текста в байтах; короткий текст — один шингл"""
+    words = WORD_RE.findall(text.casefold())
+    if len(words) <= SHINGLE_SIZE:
+        return {' '.join(words).encode()} if words else set()
+    return {' '.join(words[index:index + SHINGLE_SIZE]).encode() for index in range(len(words) - SHINGLE_SIZE + 1)}
+
+
+def minhash(text):
+    """Сигнатура текста в байтах (little-endian uint32) или None для пустого текста"""
+    items = shingles(text)
+    if not items:
+        return None
+    values = array('I')
+    for salt in SALTS:
+        digests = array('I', b''.join(hashlib.blake2b(item, salt=salt).digest() for item in items))
+        values.extend(min(digests[column::HASHES_PER_DIGEST]) for column in range(HASHES_PER_DIGEST))
+    if sys.byteorder == 'big':
+        values.byteswap()
+    return values.tobytes()
+
+
+def similarity(first, second):
+    """Оценка коэффициента Жаккара по двум сигнатурам"""
+    first, second = memoryview(first).cast('I'), memoryview(second).cast('I')
+    return sum(a == b for a, b in zip(first, second)) / NUM_HASHES
+
+
+def update_signatures(rows):
+    """Пересчитывает сигнатуры по строкам (id работы, id задания, текст)"""
+    now = timezone.now()
+    signatures = []
+    empty = []
+    for homework_id, assignment_id, text in rows:
+        signature = minhash(text or '')
+        if signature is None:
+            empty.append(homework_id)
+        else:
+            signatures.append(HomeworkSignature(
+                homework_id=homework_id, assignment_id=assignment_id, signature=signature, computed_at=now,
+            ))
+    if empty:
+        HomeworkSignature.objects.filter(homework_id__in=empty).delete()
+    for start in range(0, len(signatures), BATCH_SIZE):
+        HomeworkSignature.objects.bulk_create(
+            signatures[start:start + BATCH_SIZE],
+            update_conflicts=True,
+            unique_fields=['homework'],
+            update_fields=['assignment', 'signature', 'computed_at'],
+        )
+    return len(signatures)
+
+
+def similar_pairs(signatures, threshold=THRESHOLD, limit=None):
+    """Похожие пары из {id работы: сигнатура}: (похожесть, id, id) по убыванию похожести.
+
+    Работы с одинаковыми сигнатурами сворачиваются в одну, поэтому сотня
+    одинаковых ответов не превращается в тысячи корзин с одними и теми же парами;
+    при limit пары внутри групп разворачиваются только до нужного числа.
+    """
+    groups = defaultdict(list)
+    for homework_id, signature in signatures.items():
+        groups[bytes(signature)].append(homework_id)
+
+    # Корзины строятся по одной полосе за раз: почти все полосы уникальны, и
+    # Counter по срезам отсеивает их без создания списка на каждую корзину
+    unique = list(groups)
+    candidates = set()
+    for start in range(0, BANDS * BAND_BYTES, BAND_BYTES):
+        bands = [signature[start:start + BAND_BYTES] for signature in unique]
+        counts = Counter(bands)
+        if len(counts) == len(bands):
+            continue
+        shared = {band for band, count in counts.items() if count > 1}
+        buckets = defaultdict(list)
+        for band, signature in zip(bands, unique):
+            if band in shared:
+                buckets[band].append(signature)
+        for members in buckets.values():
+            candidates.update(combinations(members, 2))
+
+    scored = [(1.0, signature, signature) for signature, ids in groups.items() if len(ids) > 1]
+    for first, second in candidates:
+        score = similarity(first, second)
+        if score >= threshold:
+            scored.append((score, first, second))
+    scored.sort(key=lambda item: item[0], reverse=True)
+
+    pairs = []
+    for score, first, second in scored:
+        if first == second:
+            expanded = combinations(sorted(groups[first]), 2)
+        else:
+            expanded = ((a, b) for a in groups[first] for b in groups[second])
+        for a, b in expanded:
+            if limit is not None and len(pairs) >= limit:
+                return pairs
+            pairs.append((score, min(a, b), max(a, b)))
+    return pairs
+
+
+def suspicious_pairs(assignment_id, limit=REPORT_SIZE):
+    """Самые похожие пары работ задания; отчет кэшируется до изменения сигнатур"""
+    state = HomeworkSignature.objects.filter(assignment_id=assignment_id).aggregate(
+        total=Count('homework_id'), latest=Max('computed_at'),
+    )
+    if state['total'] < 2:
+        return []
+    key = f"accounts:similarity:{assignment_id}:{state['total']}:{state['latest'].timestamp()}:{limit}"
+    pairs = cache.get(key)
+    if pairs is None:
+        signatures = dict(
+            HomeworkSignature.objects.filter(assignment_id=assignment_id).values_list('homework_id', 'signature')
+        )
+        pairs = similar_pairs(signatures, limit=limit)
+        cache.set(key, pairs, REPORT_TIMEOUT)
+    return pairs
@@ -0,0 +1,184 @@
+"""Хранилище вложений с адресацией по содержимому.
+
+Каждый загруженный файл хешируется (sha256) во время записи и сохраняется
+один раз под именем ``cas/ab/cd/<sha256>``. Одинаковые файлы разных студентов
+и курсов занимают место на диске один раз; число ссылок на файл хранится
+в FileBlob.
+
+Файл без ссылок удаляется не сразу: release_blob только обнуляет счетчик,
+а clear_unused_blobs удаляет файлы, которые пробыли без ссылок дольше
+периода ожидания. Загрузка дубликата обновляет время изменения файла еще до
+acquire_blob, поэтому файл, на который вот-вот сошлется новое вложение,
+очистка не трогает.
+"""
+import hashlib
+import os
+import shutil
+import tempfile
+
+from django.core.files.move import file_move_safe
+from django.core.files.storage import FileSystemStorage
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.utils import timezone
+
+CAS_PREFIX = 'cas'
+CHUNK_SIZE = 64 * 1024
+
+
+def blob_name(digest):
+    return f'{CAS_PREFIX}/{digest[:2]}/{digest[2:4]}/{digest}'
+
+
+def is_blob_name(name):
+    return bool(name) and name.startswith(CAS_PREFIX + '/')
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    """Файловое хранилище, где имя файла — хеш его содержимого"""
+
+    def get_available_name(self, name, max_length=None):
+        # Итоговое имя определяется содержимым в _save, подбирать свободное не нужно
+        return name
+
+    def _save(self, name, content):
+        if hasattr(content, 'temporary_file_path'):
+            # Файл уже целиком на диске (большая загрузка): хешируем и переносим без копирования
+            path = content.temporary_file_path()
+            try:
+                return self._store(path, self.file_digest(path))
+            finally:
+                # Закрытие удаляет временный файл, поэтому только после переноса
+                content.close()
+        temp_dir = self.path(f'{CAS_PREFIX}/tmp')
+        os.makedirs(temp_dir, exist_ok=True)
+        digest = hashlib.sha256()
+        fd, temp_path = tempfile.mkstemp(dir=temp_dir)
+        try:
+            with os.fdopen(fd, 'wb') as target:
+                for chunk in content.chunks(CHUNK_SIZE):
+                    digest.update(chunk)
+                    target.write(chunk)
+            return self._store(temp_path, digest.hexdigest())
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+
+    def _store(self, path, digest):
+        """Переносит файл в хранилище под именем по хешу; дубликат просто удаляется"""
+        name = blob_name(digest)
+        full_path = self.path(name)
+        if touch(full_path):
+            os.remove(path)
+            return name
+        os.makedirs(os.path.dirname(full_path), exist_ok=True)
+        # Временный каталог загрузок может быть на другой файловой системе
+        file_move_safe(path, full_path, allow_overwrite=True)
+        if self.file_permissions_mode is not None:
+            os.chmod(full_path, self.file_permissions_mode)
+        return name
+
+    def file_digest(self, path):
+        digest = hashlib.sha256()
+        with open(path, 'rb') as source:
+            for chunk in iter(lambda: source.read(CHUNK_SIZE), b''):
+                digest.update(chunk)
+        return digest.hexdigest()
+
+    def adopt(self, path):
+        """Добавляет уже лежащий на диске файл в хранилище, не трогая оригинал.
+
+        Новый файл создается жесткой ссылкой, поэтому данные не копируются;
+        оригинал можно удалить после того, как ссылки в базе обновлены.
+        """
+        name = blob_name(self.file_digest(path))
+        full_path = self.path(name)
+        if not touch(full_path):
+            os.makedirs(os.path.dirname(full_path), exist_ok=True)
+            try:
+                os.link(path, full_path)
+            except OSError:
+                # Другая файловая система или ФС без жестких ссылок
+                shutil.copyfile(path, full_path)
+        return name
+
+
+def touch(path):
+    """Обновляет время изменения файла; False, если файла нет"""
+    try:
+        os.utime(path)
+    except FileNotFoundError:
+        return False
+    return True
+
+
+def attachment_storage():
+    return ContentAddressedStorage()
+
+
+def acquire_blob(name, storage=None):
+    """Увеличивает счетчик ссылок на файл хранилища"""
+    from .models import FileBlob
+
+    if not is_blob_name(name):
+        return
+    digest = os.path.basename(name)
+    blobs = FileBlob.objects.filter(digest=digest)
+    with transaction.atomic():
+        if blobs.update(ref_count=F('ref_count') + 1, released_at=None):
+            return
+        size = (storage or attachment_storage()).size(name)
+        try:
+            # Точка сохранения: после ошибки вставки внешняя транзакция остается рабочей
+            with transaction.atomic():
+                FileBlob.objects.create(digest=digest, size=size, ref_count=1)
+        except IntegrityError:
+            # Запись создал параллельный запрос между UPDATE и INSERT
+            blobs.update(ref_count=F('ref_count') + 1, released_at=None)
+
+
+def release_blob(name, storage=None):
+    """Уменьшает счетчик ссылок; файл без ссылок удалит clear_unused_blobs"""
+    from .models import FileBlob
+
+    if not is_blob_name(name):
+        return
+    digest = os.path.basename(name)
+    with transaction.atomic():
+        blob = FileBlob.objects.select_for_update().filter(digest=digest).first()
+        if blob is None or blob.ref_count == 0:
+            return
+        if blob.ref_count > 1:
+            FileBlob.objects.filter(pk=blob.pk).update(ref_count=F('ref_count') - 1)
+        else:
+            FileBlob.objects.filter(pk=blob.pk).update(ref_count=0, released_at=timezone.now())
+
+
+def delete_unused_blobs(older_than, storage=None):
+    """Удаляет файлы без ссылок, освобожденные и не загружавшиеся заново раньше older_than"""
+    from .models import FileBlob
+
+    storage = storage or attachment_storage()
+    candidates = FileBlob.objects.filter(ref_count=0, released_at__lt=older_than).values_list('pk', flat=True)
+    deleted = 0
+    for pk in list(candidates):
+        with transaction.atomic():
+            # Повторная проверка под блокировкой: вложение могло сослаться на файл после выборки
+            blob = FileBlob.objects.select_for_update().filter(
+                pk=pk, ref_count=0, released_at__lt=older_than
+            ).first()
+            if blob is None:
+                continue
+            name = blob_name(blob.digest)
+            try:
+                modified = os.path.getmtime(storage.path(name))
+            except FileNotFoundError:
+                modified = None
+            if modified is not None and modified >= older_than.timestamp():
+                # Дубликат только что загружен, и acquire_blob вернет файлу ссылку
+                continue
+            # Файл удаляется до фиксации: при откате останется запись без файла, и ее удалит следующий запуск
+            storage.delete(name)
+            blob.delete()
+            deleted += 1
+    return deleted
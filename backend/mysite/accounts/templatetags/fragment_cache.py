@@ -0,0 +1,48 @@
+"""Тег {% cachefragment %}: кэш фрагмента с инвалидацией по тегам (см. accounts/fragments.py).
+
+    {% cachefragment "dashboard_courses" user.id tags=dashboard.course_tags %}
+        ...
+    {% endcachefragment %}
+
+Имя и значения после него образуют ключ фрагмента. Выражение tags
+вычисляется только при промахе, поэтому теги, требующие запроса, не
+замедляют чтение из кэша.
+"""
+from django import template
+
+from accounts.fragments import fragment_key, get_fragment, set_fragment, tag_versions
+
+register = template.Library()
+
+
+class CacheFragmentNode(template.Node):
+    def __init__(self, nodelist, name, vary, tags):
+        self.nodelist = nodelist
+        self.name = name
+        self.vary = vary
+        self.tags = tags
+
+    def render(self, context):
+        key = fragment_key(self.name.resolve(context), [value.resolve(context) for value in self.vary])
+        html = get_fragment(key)
+        if html is None:
+            # Версии тегов читаются до данных, которые запрашивает содержимое фрагмента
+            versions = tag_versions(self.tags.resolve(context) or [])
+            html = self.nodelist.render(context)
+            set_fragment(key, html, versions)
+        return html
+
+
+@register.tag
+def cachefragment(parser, token):
+    bits = token.split_contents()
+    if len(bits) < 3 or not bits[-1].startswith('tags='):
+        raise template.TemplateSyntaxError(f"'{bits[0]}' ожидает имя фрагмента, ключи и tags=<выражение>")
+    nodelist = parser.parse(('endcachefragment',))
+    parser.delete_first_token()
+    return CacheFragmentNode(
+        nodelist,
+        parser.compile_filter(bits[1]),
+        [parser.compile_filter(bit) for bit in bits[2:-1]],
+        parser.compile_filter(bits[-1][len('tags='):]),
+    )
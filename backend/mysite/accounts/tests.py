@@ -1,3 +1,1633 @@
-from django.test import TestCase
+"""Тесты приложения accounts: по классу на подсистему — бюджеты запросов,
+файлы и загрузки, проверка работ, журнал, прогресс, поиск, чат, SCORM.
 
-# Create your tests here.
+Все тесты идут в строгом режиме профилирования (REQUEST_PROFILE_STRICT):
+RequestProfilingMiddleware считает запросы каждого view, и превышение
+query_budget завершается QueryBudgetExceeded, которое тестовый клиент
+пробрасывает в тест.
+"""
+import errno
+import fcntl
+import hashlib
+import io
+import json
+import os
+import re
+import shutil
+import tempfile
+import zipfile
+from datetime import timedelta
+from unittest import mock
+
+from asgiref.sync import sync_to_async
+from asgiref.testing import ApplicationCommunicator
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser, Group, User
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.management import call_command
+from django.core.files.uploadedfile import SimpleUploadedFile, TemporaryUploadedFile
+from django.db import connection, transaction
+from django.db.models import Max
+from django.http import HttpResponse
+from django.test import RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from . import views
+from .chat import (
+    CLOSE_FORBIDDEN, CLOSE_NOT_FOUND, CLOSE_OVERFLOW, event_stream, get_broker, publish_message, sender_names,
+    websocket_application,
+)
+from .chat import history as chat_history
+from . import search
+from .autograde import AUTOGRADE_COMMENT, autograde_assignment, get_answer_key, invalidate_answer_key, local_keys
+from .commit import CommitBatch
+from .datagen import DatasetGenerator
+from .fragments import course_homeworks_tag, homework_tag, tag_versions
+from .gradebook import build_gradebooks
+from .grading import REVISABLE_STATUSES, BatchError, validate_items
+from .metrics import Counter, Histogram, MetricsRegistry
+from .models import (
+    Assignment, Attachment, ChatMessage, ChatRoom, Course, CourseEnrollment, CourseStats, FileBlob, Grade, Homework,
+    HomeworkHistory, HomeworkSignature, SCORMPackage, StudentCourseProgress, StudentProfile, TestAnswer,
+    TestQuestion, TestSubmission, UploadSession,
+)
+from .profiling import QueryBudgetExceeded, assert_query_budget
+from .roles import STUDENT, TEACHER, get_user_roles, is_teacher, teacher_ids, teacher_required
+from .similarity import minhash, similar_pairs, similarity, suspicious_pairs
+from .storage import attachment_storage, blob_name, delete_unused_blobs
+from .uploads import upload_temp_path
+
+MEDIA_ROOT = tempfile.mkdtemp(prefix='accounts-tests-')
+
+
+def tearDownModule():
+    shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+
+
+def response_body(response):
+    if response.streaming:
+        return b''.join(response.streaming_content)
+    return response.content
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT, UPLOAD_TEMP_DIR=None, REQUEST_PROFILE_STRICT=True)
+class AccountsTestCase(TestCase):
+    """Небольшая база от DatasetGenerator; клиент вошел как преподаватель"""
+
+    @classmethod
+    def setUpTestData(cls):
+        dataset = DatasetGenerator(
+            teachers=1, groups=2, students_per_group=6, courses=2, assignments_per_course=4, fill_rate=1,
+            prefix='test',
+        ).generate()
+        cls.teacher = User.objects.get(pk=dataset.teacher_ids[0])
+        cls.course_ids = dataset.course_ids
+
+    def setUp(self):
+        # Роли, фрагменты и ключи тестов живут в кэше, а база откатывается после каждого теста
+        cache.clear()
+        self.client.force_login(self.teacher)
+
+    def pending_homeworks(self):
+        return Homework.objects.filter(
+            assignment__course__teacher=self.teacher, status__in=['submitted', 'late']
+        ).order_by('id')
+
+    def post_json(self, name, data):
+        return self.client.post(reverse(name), json.dumps(data), content_type='application/json')
+
+
+class QueryBudgetTests(AccountsTestCase):
+
+    def test_dashboard_cold_and_warm(self):
+        for _ in range(2):
+            self.assertEqual(self.client.get(reverse('teacher_dashboard')).status_code, 200)
+
+    def test_dashboard_warm_fragments_skip_app_queries(self):
+        self.client.get(reverse('teacher_dashboard'))
+        # Только сессия и пользователь: роли и все фрагменты берутся из кэша
+        with assert_query_budget(2):
+            response = self.client.get(reverse('teacher_dashboard'))
+        self.assertContains(response, Course.objects.get(pk=self.course_ids[0]).title)
+
+    def test_homework_list_filters_and_pages(self):
+        url = reverse('homework_list')
+        course_id = self.course_ids[0]
+        for params in ({}, {'status': 'submitted'}, {'course': course_id}, {'q': 'Ответ'}):
+            self.assertEqual(self.client.get(url, params).status_code, 200)
+
+        page = self.client.get(url).context['page_obj']
+        self.assertTrue(page.has_next)
+        response = self.client.get(url, {'cursor': page.next_cursor})
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse({homework.id for homework in page} & {homework.id for homework in response.context['page_obj']})
+
+    def test_budget_does_not_grow_with_batch_size(self):
+        items = [
+            {'homework_id': homework.id, 'grade_value': 4, 'points': 1, 'comment': 'Хорошо'}
+            for homework in self.pending_homeworks()
+        ]
+        self.assertGreater(len(items), 10)
+        response = self.post_json('grade_homeworks_batch', items)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['graded'], len(items))
+
+    def test_revision_batch_by_filter(self):
+        response = self.post_json('request_revision_batch', {
+            'comment': 'Исправьте оформление', 'filter': {'status': 'graded', 'course': self.course_ids[0]},
+        })
+        self.assertEqual(response.status_code, 200)
+        updated = response.json()['homework_ids']
+        self.assertTrue(updated)
+        self.assertEqual(Homework.objects.filter(id__in=updated).exclude(status='revision').count(), 0)
+
+    def test_strict_mode_fails_view_over_budget(self):
+        with mock.patch.object(views.homework_list, 'query_budget', 1):
+            with self.assertRaises(QueryBudgetExceeded):
+                self.client.get(reverse('homework_list'))
+
+    def test_assert_query_budget_counts_block(self):
+        with self.assertRaises(QueryBudgetExceeded):
+            with assert_query_budget(1):
+                list(Homework.objects.all()[:1])
+                list(Grade.objects.all()[:1])
+
+
+class RequestProfilingTests(AccountsTestCase):
+
+    def test_server_timing_only_for_staff(self):
+        url = reverse('homework_list')
+        self.assertNotIn('Server-Timing', self.client.get(url))
+        User.objects.filter(pk=self.teacher.pk).update(is_staff=True)
+        self.assertIn('queries', self.client.get(url)['Server-Timing'])
+
+    def test_strict_mode_logs_only_sampled_requests(self):
+        with self.assertNoLogs('accounts.profiling'):
+            self.client.get(reverse('homework_list'))
+        with self.settings(REQUEST_PROFILE_SAMPLE_RATE=1.0), self.assertLogs('accounts.profiling') as logs:
+            self.client.get(reverse('homework_list'))
+        record = json.loads(logs.records[0].getMessage())
+        self.assertEqual((record['view'], record['status']), ('homework_list', 200))
+
+class FileServingTests(AccountsTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.homework = self.pending_homeworks().first()
+        self.data = bytes(range(256)) * 40
+        self.attachment = Attachment.objects.create(
+            homework=self.homework, file=ContentFile(self.data, name='report.bin'),
+            file_name='report.bin', file_size=len(self.data),
+        )
+        self.url = reverse('download_attachment', args=[self.attachment.id])
+
+    def test_attachment_range(self):
+        response = self.client.get(self.url, HTTP_RANGE='bytes=100-199')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response['Content-Range'], f'bytes 100-199/{len(self.data)}')
+        self.assertEqual(response_body(response), self.data[100:200])
+
+        response = self.client.get(self.url, HTTP_RANGE='bytes=-50')
+        self.assertEqual(response_body(response), self.data[-50:])
+
+    def test_attachment_unsatisfiable_range(self):
+        response = self.client.get(self.url, HTTP_RANGE=f'bytes={len(self.data)}-')
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response['Content-Range'], f'bytes */{len(self.data)}')
+
+    def test_attachment_if_range_mismatch_returns_whole_file(self):
+        response = self.client.get(self.url, HTTP_RANGE='bytes=0-9', HTTP_IF_RANGE='"stale"')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response_body(response), self.data)
+
+    def test_homework_zip(self):
+        response = self.client.get(reverse('download_homework_zip', args=[self.homework.id]))
+        self.assertEqual(response.status_code, 200)
+        archive = zipfile.ZipFile(io.BytesIO(response_body(response)))
+        self.assertIsNone(archive.testzip())
+        self.assertEqual(archive.read('report.bin'), self.data)
+
+    def test_assignment_zip_resumes_with_range(self):
+        url = reverse('download_assignment_zip', args=[self.homework.assignment_id])
+        response = self.client.get(url)
+        whole = response_body(response)
+        self.assertEqual(int(response['Content-Length']), len(whole))
+
+        head = self.client.get(url, HTTP_RANGE='bytes=0-999')
+        tail = self.client.get(url, HTTP_RANGE='bytes=1000-', HTTP_IF_RANGE=response['ETag'])
+        self.assertEqual((head.status_code, tail.status_code), (206, 206))
+        self.assertEqual(response_body(head) + response_body(tail), whole)
+        self.assertIsNone(zipfile.ZipFile(io.BytesIO(whole)).testzip())
+
+
+class ChunkedUploadTests(AccountsTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.homework = self.pending_homeworks().select_related('student__user').first()
+        self.client.force_login(self.homework.student.user)
+        self.data = b'0123456789abcdef' * 1000
+
+    def start(self):
+        response = self.client.post(
+            reverse('upload_start', args=[self.homework.id]), {'file_name': 'notes.txt', 'total_size': len(self.data)},
+        )
+        self.assertEqual(response.status_code, 201)
+        return reverse('upload_chunk', args=[response.json()['upload_id']])
+
+    def put(self, url, offset, chunk, checksum=None):
+        return self.client.put(
+            url, chunk, content_type='application/octet-stream', HTTP_X_UPLOAD_OFFSET=str(offset),
+            HTTP_X_CHUNK_SHA256=checksum or hashlib.sha256(chunk).hexdigest(),
+        )
+
+    def test_resume_after_rejected_chunks(self):
+        url = self.start()
+        self.assertEqual(self.put(url, 0, self.data[:6000]).json()['offset'], 6000)
+
+        # Повтор уже принятой части и часть не с того смещения
+        response = self.put(url, 0, self.data[:6000])
+        self.assertEqual((response.status_code, response.json()['offset']), (409, 6000))
+        response = self.put(url, 7000, self.data[7000:8000])
+        self.assertEqual((response.status_code, response.json()['offset']), (409, 6000))
+
+        # Поврежденная часть не сдвигает смещение
+        response = self.put(url, 6000, self.data[6000:12000], checksum='0' * 64)
+        self.assertEqual((response.status_code, response.json()['offset']), (400, 6000))
+
+        # Клиент узнает подтвержденное смещение и дозагружает остаток
+        offset = self.client.get(url).json()['offset']
+        self.assertEqual(offset, 6000)
+        self.assertEqual(self.put(url, offset, self.data[offset:]).json()['offset'], len(self.data))
+
+        response = self.client.post(url + 'finalize/')
+        self.assertEqual(response.status_code, 201)
+        attachment = Attachment.objects.get(pk=response.json()['attachment_id'])
+        with attachment.file.open('rb') as source:
+            self.assertEqual(source.read(), self.data)
+        self.assertTrue(UploadSession.objects.get(homework=self.homework).completed)
+
+        response = self.put(url, len(self.data), b'x')
+        self.assertEqual(response.status_code, 409)
+
+    def test_finalize_incomplete_upload(self):
+        url = self.start()
+        self.put(url, 0, self.data[:100])
+        response = self.client.post(url + 'finalize/')
+        self.assertEqual((response.status_code, response.json()['offset']), (409, 100))
+
+    def test_chunk_without_checksum_is_rejected(self):
+        url = self.start()
+        response = self.client.put(
+            url, self.data[:100], content_type='application/octet-stream', HTTP_X_UPLOAD_OFFSET='0',
+        )
+        self.assertEqual((response.status_code, response.json()['offset']), (400, 0))
+
+    def test_finalize_once(self):
+        url = self.start()
+        self.put(url, 0, self.data)
+        session = UploadSession.objects.get(homework=self.homework)
+
+        # Пока файл заблокирован другим запросом (часть или завершение), завершить нельзя
+        with open(upload_temp_path(session), 'rb') as part:
+            fcntl.flock(part, fcntl.LOCK_EX)
+            response = self.client.post(url + 'finalize/')
+        self.assertEqual(response.status_code, 409)
+
+        self.assertEqual(self.client.post(url + 'finalize/').status_code, 201)
+        self.assertEqual(self.client.post(url + 'finalize/').status_code, 409)
+        self.assertEqual(Attachment.objects.filter(homework=self.homework, file_name='notes.txt').count(), 1)
+
+
+class BatchGradingValidationTests(AccountsTestCase):
+
+    def test_batch_shape(self):
+        for items in ({}, [], 'abc'):
+            with self.assertRaises(BatchError):
+                validate_items(items)
+        with self.settings(BATCH_GRADING_MAX_ITEMS=2):
+            with self.assertRaises(BatchError):
+                validate_items([{'homework_id': number, 'grade_value': 5} for number in range(1, 4)])
+
+    def test_only_integral_values(self):
+        items = json.loads(
+            '[{"homework_id": 1, "grade_value": 4.5},'
+            ' {"homework_id": 2, "grade_value": 1e999},'
+            ' {"homework_id": true, "grade_value": 5},'
+            ' {"homework_id": 3, "grade_value": 5, "points": "1_0"},'
+            ' {"homework_id": 99999999999999999999, "grade_value": 5},'
+            ' {"homework_id": "4", "grade_value": " 5 ", "points": "2"}]'
+        )
+        valid, errors = validate_items(items)
+        self.assertEqual(set(errors), {0, 1, 2, 3, 4})
+        self.assertEqual(valid, {4: {'position': 5, 'grade_value': 5, 'points': 2, 'comment': ''}})
+
+    def test_ranges_and_duplicates(self):
+        valid, errors = validate_items([
+            {'homework_id': 1, 'grade_value': 6},
+            {'homework_id': 2, 'grade_value': 5, 'points': -1},
+            {'homework_id': 3, 'grade_value': 5, 'comment': ['a']},
+            {'homework_id': 4, 'grade_value': 5},
+            {'homework_id': 4, 'grade_value': 3},
+            {'grade_value': 3},
+        ])
+        self.assertEqual(list(valid), [4])
+        self.assertEqual(errors[0], 'Оценка должна быть от 1 до 5')
+        self.assertEqual(errors[1], 'Баллы не могут быть отрицательными')
+        self.assertEqual(errors[4], 'Работа указана в пакете повторно')
+        self.assertEqual(set(errors), {0, 1, 2, 4, 5})
+
+    def test_endpoint_reports_errors_per_item(self):
+        homework, other = self.pending_homeworks()[:2]
+        max_points = other.assignment.max_points
+        response = self.post_json('grade_homeworks_batch', [
+            {'homework_id': homework.id, 'grade_value': 5, 'points': 1, 'comment': 'Отлично'},
+            {'homework_id': other.id, 'grade_value': 5, 'points': max_points + 1},
+            {'homework_id': 10 ** 9, 'grade_value': 5},
+            {'homework_id': homework.id + 0.5, 'grade_value': 5},
+        ])
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual((data['success'], data['graded'], data['failed']), (False, 1, 3))
+        self.assertEqual(data['results'][1]['error'], f'Баллы должны быть от 0 до {max_points}')
+        self.assertEqual(data['results'][2]['error'], 'Работа не найдена')
+        self.assertEqual(data['results'][3]['error'], 'Некорректные данные')
+
+        homework.refresh_from_db()
+        self.assertEqual(homework.status, 'graded')
+        self.assertEqual(Grade.objects.get(homework=homework).comment, 'Отлично')
+        self.assertNotEqual(Homework.objects.get(pk=other.pk).status, 'graded')
+
+    def test_endpoint_rejects_malformed_json(self):
+        response = self.client.post(reverse('grade_homeworks_batch'), 'not json', content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(response.json()['success'])
+
+
+class ContentAddressedStorageTests(AccountsTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.homework = self.pending_homeworks().first()
+        self.data = b'same report ' * 100
+        self.digest = hashlib.sha256(self.data).hexdigest()
+
+    def attach(self, content):
+        return Attachment.objects.create(
+            homework=self.homework, file=content, file_name='report.txt', file_size=len(self.data)
+        )
+
+    def blob(self):
+        return FileBlob.objects.get(digest=self.digest)
+
+    def spooled(self):
+        upload = TemporaryUploadedFile('report.txt', 'text/plain', len(self.data), None)
+        upload.write(self.data)
+        upload.seek(0)
+        return upload
+
+    def test_duplicates_share_one_counted_file(self):
+        first = self.attach(ContentFile(self.data, name='report.txt'))
+        second = self.attach(self.spooled())
+        self.assertEqual(first.file.name, blob_name(self.digest))
+        self.assertEqual(second.file.name, first.file.name)
+        self.assertEqual(self.blob().ref_count, 2)
+
+        first.delete()
+        self.assertEqual(self.blob().ref_count, 1)
+        second.delete()
+        self.assertEqual((self.blob().ref_count, self.blob().released_at is not None), (0, True))
+        self.assertTrue(attachment_storage().exists(blob_name(self.digest)))
+
+    def test_spooled_upload_moves_across_file_systems(self):
+        with mock.patch('os.rename', side_effect=OSError(errno.EXDEV, 'Invalid cross-device link')):
+            attachment = self.attach(self.spooled())
+        with attachment.file.open('rb') as source:
+            self.assertEqual(source.read(), self.data)
+
+    def test_unused_file_deleted_after_grace_period(self):
+        self.attach(ContentFile(self.data, name='report.txt')).delete()
+        storage = attachment_storage()
+        self.assertEqual(delete_unused_blobs(timezone.now() - timedelta(hours=1)), 0)
+
+        self.age(hours=2)
+        self.assertEqual(delete_unused_blobs(timezone.now() - timedelta(hours=1)), 1)
+        self.assertFalse(FileBlob.objects.filter(digest=self.digest).exists())
+        self.assertFalse(storage.exists(blob_name(self.digest)))
+
+    def test_duplicate_saved_before_acquire_keeps_file(self):
+        self.attach(ContentFile(self.data, name='report.txt')).delete()
+        self.age(hours=2)
+        # Загрузка уже сохранила дубликат, но acquire_blob еще не выполнен
+        attachment_storage().save('report.txt', ContentFile(self.data))
+        self.assertEqual(delete_unused_blobs(timezone.now() - timedelta(hours=1)), 0)
+
+        attachment = self.attach(ContentFile(self.data, name='report.txt'))
+        self.assertEqual(self.blob().ref_count, 1)
+        self.assertIsNone(self.blob().released_at)
+        self.assertTrue(attachment.file.storage.exists(attachment.file.name))
+
+    def age(self, hours):
+        past = timezone.now() - timedelta(hours=hours)
+        FileBlob.objects.filter(digest=self.digest).update(released_at=past)
+        path = attachment_storage().path(blob_name(self.digest))
+        os.utime(path, (past.timestamp(), past.timestamp()))
+
+
+# Таблицы, которые растут вместе с числом студентов и работ: полный проход по ним недопустим
+HOT_TABLES = {
+    'accounts_homework', 'accounts_grade', 'accounts_attachment', 'accounts_courseenrollment',
+    'accounts_homeworkhistory', 'accounts_chatmessage', 'accounts_uploadsession', 'accounts_testsubmission',
+    'accounts_studentcourseprogress', 'accounts_homeworksignature', 'accounts_scormfile',
+}
+
+# Полный проход по таблице без индекса: «SCAN accounts_homework», но не «SCAN ... USING INDEX»
+FULL_SCAN_RE = re.compile(r'^SCAN (\w+)(?: AS \w+)?$')
+
+# Выборки «последние N строк», которые должны читать индекс в нужном порядке, а не сортировать все строки
+ORDERED_LABELS = {'chat_history', 'chat_history?before', 'chat_history?after', 'chat_events', 'homework history'}
+TEMP_SORT = 'USE TEMP B-TREE FOR ORDER BY'
+
+SCORM_MANIFEST = b'''<?xml version="1.0"?>
+<manifest identifier="lesson" xmlns:adlcp="http://www.adlnet.org/xsd/adlcp_rootv1p2">
+  <organizations default="org">
+    <organization identifier="org">
+      <title>Lesson</title>
+      <item identifier="item" identifierref="sco"><title>Lesson</title></item>
+    </organization>
+  </organizations>
+  <resources>
+    <resource identifier="sco" type="webcontent" adlcp:scormtype="sco" href="index.html">
+      <file href="index.html"/>
+    </resource>
+  </resources>
+</manifest>
+'''
+
+
+def scorm_zip(index=b'<html><body>Lesson</body></html>'):
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED) as archive:
+        archive.writestr('imsmanifest.xml', SCORM_MANIFEST)
+        archive.writestr('index.html', index)
+    return SimpleUploadedFile('lesson.zip', buffer.getvalue(), content_type='application/zip')
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT, UPLOAD_TEMP_DIR=None, REQUEST_PROFILE_STRICT=True)
+class QueryPlanTests(TestCase):
+    """Запросы всех view на синтетической базе после ANALYZE не читают горячие таблицы целиком.
+
+    Снимается EXPLAIN QUERY PLAN каждого SELECT; ошибкой считается полный
+    проход по таблице из HOT_TABLES и сортировка без индекса в выборках
+    «последние N строк». Любой ответ не из 2xx — тоже ошибка: страница с
+    ошибкой не выполняет свои запросы, и их планы остались бы непроверенными.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        dataset = DatasetGenerator(
+            teachers=2, groups=4, students_per_group=15, courses=2, groups_per_course=2, assignments_per_course=6,
+            fill_rate=0.8, graded_ratio=0.5, test_ratio=0.3, chat_messages_per_course=150,
+            attachments_per_homework=0.3, unsubmitted_rows=True, prefix='plan',
+        ).generate()
+        cls.course = Course.objects.select_related('teacher').get(pk=dataset.course_ids[0])
+        cls.teacher = cls.course.teacher
+        cls.homework = Homework.objects.filter(assignment__course=cls.course, status='submitted').first()
+        cls.test_assignment = Assignment.objects.filter(course=cls.course, questions__isnull=False).first()
+        cls.room = ChatRoom.objects.filter(course=cls.course).first()
+        cls.attachment = Attachment.objects.create(
+            homework=cls.homework, file=ContentFile(b'report', name='report.txt'), file_name='report.txt', file_size=6,
+        )
+        HomeworkHistory.objects.bulk_create(
+            HomeworkHistory(homework_id=homework_id, changed_by=cls.teacher, change_description='Оценка')
+            for homework_id in Homework.objects.filter(assignment__course=cls.course).values_list('id', flat=True)
+        )
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+
+    def setUp(self):
+        cache.clear()
+        self.statements = []
+        self.label = None
+
+    def record(self, execute, sql, params, many, context):
+        if not many and sql.lstrip().upper().startswith('SELECT'):
+            self.statements.append((self.label, sql, params))
+        return execute(sql, params, many, context)
+
+    def request(self, label, method, url, data=None, status=None, **extra):
+        self.label = label
+        response = getattr(self.client, method)(url, data, **extra)
+        body = response_body(response)
+        if status is None:
+            self.assertLess(response.status_code, 300, f'{label}: ответ {response.status_code}')
+        else:
+            self.assertEqual(response.status_code, status, f'{label}: ответ {response.status_code}')
+        return response, body
+
+    def test_views_use_indexes(self):
+        course, homework, room = self.course, self.homework, self.room
+        student = homework.student
+        with connection.execute_wrapper(self.record):
+            self.client.force_login(self.teacher)
+            self.teacher_pages(course, homework, room, student)
+            self.teacher_actions(course, homework, room)
+            self.client.force_login(student.user)
+            self.student_actions(homework, room)
+
+            self.label = 'chat_events'
+            chat_history(room.id, room.messages.earliest('id').id)
+            self.label = 'homework history'
+            list(homework.history.all()[:20])
+
+        problems = self.explain()
+        self.assertFalse(problems, '\n'.join(f'{label}: {detail}\n    {sql}' for label, sql, detail in problems))
+
+    def teacher_pages(self, course, homework, room, student):
+        assignment = homework.assignment
+        pages = [
+            ('dashboard', reverse('teacher_dashboard'), {}),
+            ('homework_list', reverse('homework_list'), {}),
+            ('homework_list?status', reverse('homework_list'), {'status': 'submitted'}),
+            ('homework_list?course', reverse('homework_list'), {'course': course.id}),
+            ('homework_list?status&course', reverse('homework_list'), {'status': 'graded', 'course': course.id}),
+            ('homework_list?q', reverse('homework_list'), {'q': 'ответ'}),
+            ('homework_detail', reverse('homework_detail', args=[homework.id]), {}),
+            ('course_assignments', reverse('course_assignments', args=[course.id]), {}),
+            ('assignment_detail', reverse('assignment_detail', args=[assignment.id]), {}),
+            ('gradebook', reverse('gradebook'), {}),
+            ('gradebook_course', reverse('gradebook_course', args=[course.id]), {}),
+            ('student_progress', reverse('student_progress', args=[student.id]), {}),
+            ('search', reverse('search'), {'q': 'ответ'}),
+            ('search?kind', reverse('search'), {'q': 'ответ', 'kind': ['grade', 'chat']}),
+            ('chat_history', reverse('chat_history', args=[room.id]), {}),
+            ('chat_history?before', reverse('chat_history', args=[room.id]), {'before': room.messages.latest('id').id}),
+            ('chat_history?after', reverse('chat_history', args=[room.id]), {'after': room.messages.earliest('id').id}),
+            ('download_attachment', reverse('download_attachment', args=[self.attachment.id]), {}),
+            ('download_homework_zip', reverse('download_homework_zip', args=[homework.id]), {}),
+            ('download_assignment_zip', reverse('download_assignment_zip', args=[assignment.id]), {}),
+        ]
+        for label, url, params in pages:
+            response, body = self.request(label, 'get', url, params)
+            if label == 'homework_list':
+                self.request('homework_list?cursor', 'get', url, {'cursor': response.context['page_obj'].next_cursor})
+
+    def teacher_actions(self, course, homework, room):
+        pending = list(
+            Homework.objects.filter(assignment__course=course, status='submitted')
+            .exclude(pk=homework.pk).values_list('id', flat=True)[:3]
+        )
+        self.request('grade_homework', 'post', reverse('grade_homework', args=[pending[0]]), {
+            'grade_value': 5, 'points': 1, 'comment': 'Хорошо',
+        })
+        self.request('request_revision', 'post', reverse('request_revision', args=[pending[1]]), {
+            'comment': 'Исправьте',
+        })
+        self.request('grade_homeworks_batch', 'post', reverse('grade_homeworks_batch'), json.dumps([
+            {'homework_id': pending[2], 'grade_value': 4, 'points': 1},
+        ]), content_type='application/json')
+        self.request('request_revision_batch', 'post', reverse('request_revision_batch'), json.dumps({
+            'comment': 'Исправьте', 'filter': {'status': 'graded', 'course': course.id},
+        }), content_type='application/json')
+        self.request('autograde_test', 'post', reverse('autograde_test', args=[self.test_assignment.id]))
+        self.request('chat_send', 'post', reverse('chat_send', args=[room.id]), json.dumps({'message': 'Привет'}),
+                     content_type='application/json')
+
+        # Индекс пакета строится после фиксации сохранения
+        with self.captureOnCommitCallbacks(execute=True):
+            response, body = self.request('scorm_upload', 'post', reverse('scorm_upload', args=[course.id]), {
+                'package': scorm_zip(),
+            })
+        response, body = self.request('scorm_launch', 'get', json.loads(body)['launch_url'])
+        self.request('scorm_file', 'get', response.context['launch_url'])
+
+    def student_actions(self, homework, room):
+        data = b'chunk' * 100
+        response, body = self.request('upload_start', 'post', reverse('upload_start', args=[homework.id]), {
+            'file_name': 'notes.txt', 'total_size': len(data),
+        })
+        url = reverse('upload_chunk', args=[json.loads(body)['upload_id']])
+        self.request('upload_chunk', 'put', url, data, content_type='application/octet-stream',
+                     HTTP_X_UPLOAD_OFFSET='0', HTTP_X_CHUNK_SHA256=hashlib.sha256(data).hexdigest())
+        self.request('upload_chunk?status', 'get', url)
+        self.request('upload_finalize', 'post', url + 'finalize/')
+        self.request('chat_history?student', 'get', reverse('chat_history', args=[room.id]))
+
+    def explain(self):
+        problems = []
+        with connection.cursor() as cursor:
+            for label, sql, params in self.statements:
+                cursor.execute('EXPLAIN QUERY PLAN ' + sql, params)
+                for detail in [row[3] for row in cursor.fetchall()]:
+                    match = FULL_SCAN_RE.match(detail)
+                    if match and match.group(1) in HOT_TABLES:
+                        problems.append((label, sql, detail))
+                    elif detail == TEMP_SORT and label in ORDERED_LABELS:
+                        problems.append((label, sql, detail))
+        return problems
+
+
+class RevisionBatchTests(AccountsTestCase):
+
+    def revisable(self):
+        return Homework.objects.filter(assignment__course__teacher=self.teacher, status__in=REVISABLE_STATUSES)
+
+    def test_request_without_ids_or_filter_is_rejected(self):
+        before = self.revisable().count()
+        for body in ({'comment': 'x'}, {'comment': 'x', 'filter': {}}, {'comment': 'x', 'filter': {'status': ''}}):
+            response = self.post_json('request_revision_batch', body)
+            self.assertEqual(response.status_code, 400)
+            self.assertEqual(response.json()['error'], 'Укажите работы или фильтр')
+        self.assertEqual(self.revisable().count(), before)
+
+    def test_explicit_all_filter_selects_every_revisable_homework(self):
+        expected = set(self.revisable().values_list('id', flat=True))
+        response = self.post_json('request_revision_batch', {'comment': 'x', 'filter': {'status': 'all'}})
+        self.assertEqual(set(response.json()['homework_ids']), expected)
+
+    def test_out_of_range_ids_are_rejected(self):
+        for body in ({'comment': 'x', 'homework_ids': [10 ** 30]}, {'comment': 'x', 'filter': {'course': 10 ** 30}}):
+            response = self.post_json('request_revision_batch', body)
+            self.assertEqual(response.status_code, 400)
+            self.assertFalse(response.json()['success'])
+
+    def test_selected_homeworks(self):
+        homework = self.pending_homeworks().first()
+        response = self.post_json('request_revision_batch', {'comment': 'Доработайте', 'homework_ids': [homework.id]})
+        self.assertEqual(response.json()['homework_ids'], [homework.id])
+        grade = Grade.objects.get(homework=homework)
+        self.assertEqual((grade.is_revision_request, grade.revision_comment), (True, 'Доработайте'))
+
+
+class DashboardFragmentTests(AccountsTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        # Отложенные обработчики подготовки регистрируются на уровне класса и не принимают ключи тестов
+        super().setUpTestData()
+        Course.objects.filter(pk=cls.course_ids[0]).update(title='Курс для фрагментов')
+        cls.course = Course.objects.get(pk=cls.course_ids[0])
+        cls.other = User.objects.create_user('other_teacher')
+        cls.other.groups.add(Group.objects.get(name=TEACHER))
+        with cls.captureOnCommitCallbacks(execute=True):
+            cls.target = Course.objects.create(title='Другой курс', description='', teacher=cls.other)
+            cls.assignment = Assignment.objects.create(
+                course=cls.target, title='Задание', description='', due_date=timezone.now()
+            )
+
+    def dashboard(self, user=None):
+        self.client.force_login(user or self.teacher)
+        return self.client.get(reverse('teacher_dashboard')).content.decode()
+
+    def test_renamed_course_is_rendered_again(self):
+        self.dashboard()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.course.title = 'Переименованный курс'
+            self.course.save()
+        self.assertIn('Переименованный курс', self.dashboard())
+
+    def test_reassigned_course_leaves_previous_teacher_dashboard(self):
+        self.assertIn(self.course.title, self.dashboard())
+        self.assertNotIn(self.course.title, self.dashboard(self.other))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.course.teacher = self.other
+            self.course.save()
+        self.assertNotIn(self.course.title, self.dashboard())
+        self.assertIn(self.course.title, self.dashboard(self.other))
+
+    def test_moved_homework_invalidates_both_courses(self):
+        homework = Homework.objects.filter(assignment__course=self.course).first()
+        tags = [course_homeworks_tag(self.course.id), course_homeworks_tag(self.target.id)]
+        before = tag_versions(tags)
+        with self.captureOnCommitCallbacks(execute=True):
+            homework.assignment = self.assignment
+            homework.save()
+        after = tag_versions(tags)
+        self.assertFalse(set(before.items()) & set(after.items()))
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT, UPLOAD_TEMP_DIR=None, REQUEST_PROFILE_STRICT=True)
+class ScormTests(TransactionTestCase):
+    """Индекс строится после фиксации, поэтому транзакции здесь настоящие"""
+
+    def setUp(self):
+        cache.clear()
+        shutil.rmtree(os.path.join(MEDIA_ROOT, 'scorm_packages'), ignore_errors=True)
+        self.teacher = User.objects.create_user('scorm_teacher')
+        self.teacher.groups.add(Group.objects.get_or_create(name=TEACHER)[0])
+        self.course = Course.objects.create(title='Курс', description='', teacher=self.teacher)
+        self.client.force_login(self.teacher)
+
+    def upload(self, package):
+        return self.client.post(reverse('scorm_upload', args=[self.course.id]), {'package': package})
+
+    def launch(self):
+        data = self.upload(scorm_zip(b'<!DOCTYPE html><html><head><title>L</title></head><body>Lesson</body></html>'))
+        return self.client.get(json.loads(data.content)['launch_url'])
+
+    def test_upload_is_indexed_after_commit(self):
+        response = self.upload(scorm_zip())
+        data = json.loads(response.content)
+        self.assertTrue(data['success'])
+        self.assertEqual(data['files'], 2)
+        self.assertIsNotNone(SCORMPackage.objects.get(pk=data['id']).indexed_at)
+
+    def test_invalid_package_is_rejected_and_removed(self):
+        buffer = io.BytesIO()
+        with zipfile.ZipFile(buffer, 'w') as archive:
+            archive.writestr('index.html', b'<html></html>')
+        response = self.upload(SimpleUploadedFile('broken.zip', buffer.getvalue()))
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('imsmanifest.xml', json.loads(response.content)['error'])
+        self.assertFalse(SCORMPackage.objects.exists())
+        self.assertFalse(os.listdir(os.path.join(MEDIA_ROOT, 'scorm_packages')))
+
+    def test_launch_opens_sandboxed_frame_with_api_bridge(self):
+        response = self.launch()
+        self.assertContains(response, 'sandbox="allow-scripts allow-forms"')
+        self.assertContains(response, 'js/scorm-player.js')
+        page = self.client.get(response.context['launch_url'])
+        self.assertIn('allow-scripts', page['Content-Security-Policy'])
+        self.assertNotIn('allow-same-origin', page['Content-Security-Policy'])
+        self.assertEqual(
+            page.content,
+            b'<!DOCTYPE html><html><head><script src="/static/js/scorm-api.js"></script><title>L</title></head>'
+            b'<body>Lesson</body></html>',
+        )
+
+    def test_not_modified_keeps_vary(self):
+        url = self.launch().context['launch_url'].replace('index.html', 'imsmanifest.xml')
+        first = self.client.get(url, HTTP_ACCEPT_ENCODING='gzip')
+        response_body(first)
+        second = self.client.get(url, HTTP_ACCEPT_ENCODING='gzip', HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(second.status_code, 304)
+        self.assertEqual(second['Vary'], first['Vary'])
+        self.assertIn('Accept-Encoding', second['Vary'])
+
+    def test_replaced_archive_is_hidden_until_indexed(self):
+        url = self.launch().context['launch_url']
+        package = SCORMPackage.objects.get()
+        package.package_file = scorm_zip(b'<html><body>New</body></html>')
+        with transaction.atomic():
+            package.save()
+            self.assertEqual(self.client.get(url).status_code, 404)
+        self.assertIn(b'New', self.client.get(url).content)
+
+
+class DatasetGeneratorTests(TestCase):
+    BASE_DATE = timezone.make_aware(timezone.datetime(2024, 9, 2, 9, 0))
+
+    def generate(self, prefix):
+        dataset = DatasetGenerator(
+            teachers=1, groups=2, students_per_group=3, courses=1, assignments_per_course=2, fill_rate=1,
+            graded_ratio=0.5, prefix=prefix, base_date=self.BASE_DATE,
+        ).generate()
+        students = [
+            (profile.user.username.removeprefix(prefix), profile.student_id.removeprefix(prefix),
+             profile.user.get_full_name())
+            for profile in StudentProfile.objects.filter(student_id__startswith=f'{prefix}-')
+            .select_related('user').order_by('student_id')
+        ]
+        homeworks = list(
+            Homework.objects.filter(assignment__course_id__in=dataset.course_ids)
+            .order_by('student__student_id', 'assignment__title')
+            .values_list('assignment__title', 'status', 'text_content', 'submitted_at')
+        )
+        return dataset, students, homeworks
+
+    def test_same_seed_and_base_date_give_same_content(self):
+        first = self.generate('one')
+        second = self.generate('two')
+        self.assertEqual(first[1], second[1])
+        self.assertEqual(first[2], second[2])
+        self.assertEqual(first[1][0][:2], ('_s0', '-000000'))
+        # Сроки отсчитываются от base_date: у первого из двух заданий срок ровно в base_date
+        assignment = Assignment.objects.get(course_id=first[0].course_ids[0], title='Задание 1')
+        self.assertEqual(assignment.due_date, self.BASE_DATE)
+
+    def test_search_index_and_signatures_are_built(self):
+        dataset, students, homeworks = self.generate('idx')
+        self.assertEqual(
+            HomeworkSignature.objects.filter(homework__assignment__course_id__in=dataset.course_ids).count(),
+            len(homeworks),
+        )
+        if search.enabled():
+            self.assertTrue(search.search_documents(dataset.course_ids, 'Ответ студента'))
+
+
+class GradebookTests(AccountsTestCase):
+
+    def gradebook(self, course_id):
+        return build_gradebooks(Course.objects.filter(pk=course_id))[0]
+
+    def cell(self, homework):
+        gradebook = self.gradebook(homework.assignment.course_id)
+        row = gradebook.row_index[homework.student_id]
+        return list(row.grades)[gradebook.columns[homework.assignment_id]]
+
+    def test_zero_and_negative_points_are_grades(self):
+        homeworks = list(Homework.objects.filter(assignment__course_id=self.course_ids[0], status='graded')[:2])
+        Grade.objects.filter(homework=homeworks[0]).update(points=-1)
+        Grade.objects.filter(homework=homeworks[1]).update(points=0)
+        self.assertEqual(self.cell(homeworks[0]).grade, -1)
+        self.assertEqual(self.cell(homeworks[1]).grade, 0)
+
+    def test_ungraded_cell_is_empty(self):
+        homework = Homework.objects.filter(assignment__course_id=self.course_ids[0]).exclude(status='graded').first()
+        Grade.objects.filter(homework=homework).delete()
+        self.assertIsNone(self.cell(homework).grade)
+
+    def test_inactive_enrollment_is_not_listed(self):
+        enrollment = CourseEnrollment.objects.filter(course_id=self.course_ids[0]).first()
+        CourseEnrollment.objects.filter(pk=enrollment.pk).update(is_active=False)
+        gradebook = self.gradebook(self.course_ids[0])
+        self.assertNotIn(enrollment.student_id, gradebook.row_index)
+        self.assertEqual(len(gradebook), CourseEnrollment.objects.filter(course_id=self.course_ids[0]).count() - 1)
+
+    def test_moved_homework_refreshes_previous_course(self):
+        source, target = self.course_ids
+        homework = Homework.objects.filter(assignment__course_id=source).first()
+        version = Course.objects.get(pk=source).gradebook_version
+        before = CourseStats.objects.get(course_id=source).homeworks
+        with self.captureOnCommitCallbacks(execute=True):
+            homework.assignment = Assignment.objects.create(
+                course_id=target, title='Новое задание', description='', due_date=timezone.now(),
+            )
+            homework.save()
+        self.assertEqual(CourseStats.objects.get(course_id=source).homeworks, before - 1)
+        self.assertGreater(Course.objects.get(pk=source).gradebook_version, version)
+        progress = StudentCourseProgress.objects.get(course_id=source, student_id=homework.student_id)
+        self.assertEqual(
+            progress.assigned + progress.submitted + progress.graded + progress.revision + progress.late,
+            Homework.objects.filter(assignment__course_id=source, student_id=homework.student_id).count(),
+        )
+
+    def test_commit_batch_drops_keys_of_rolled_back_savepoint(self):
+        handled = []
+        batch = CommitBatch(handled.append)
+        with self.captureOnCommitCallbacks(execute=True):
+            batch.add([1])
+            with self.assertRaises(ValueError), transaction.atomic():
+                batch.add([2])
+                raise ValueError
+            batch.add([3])
+        self.assertEqual(sorted(key for keys in handled for key in keys), [1, 3])
+
+
+class CourseStatsSignalTests(AccountsTestCase):
+    STATS_FIELDS = ('students', 'assignments', 'homeworks', 'submitted', 'graded', 'revision', 'late')
+
+    def stats(self, course_id):
+        return CourseStats.objects.filter(course_id=course_id).values(*self.STATS_FIELDS).get()
+
+    def assert_matches_recount(self, course_id):
+        stats = self.stats(course_id)
+        CourseStats.refresh([course_id])
+        self.assertEqual(stats, self.stats(course_id))
+
+    def test_submitted_and_graded_homework(self):
+        course_id = self.course_ids[0]
+        student = StudentProfile.objects.filter(courseenrollment__course_id=course_id).first()
+        before = self.stats(course_id)
+        with self.captureOnCommitCallbacks(execute=True):
+            assignment = Assignment.objects.create(
+                course_id=course_id, title='Новое задание', description='', due_date=timezone.now(),
+            )
+            homework = Homework.objects.create(
+                assignment=assignment, student=student, status='submitted', submitted_at=timezone.now(),
+            )
+        after = self.stats(course_id)
+        self.assertEqual(after['assignments'], before['assignments'] + 1)
+        self.assertEqual(after['homeworks'], before['homeworks'] + 1)
+        self.assertEqual(after['submitted'], before['submitted'] + 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Grade.objects.create(homework=homework, teacher=self.teacher, points=90, grade_value=5)
+            homework.status = 'graded'
+            homework.save()
+        graded = self.stats(course_id)
+        self.assertEqual(graded['submitted'], before['submitted'])
+        self.assertEqual(graded['graded'], before['graded'] + 1)
+        self.assert_matches_recount(course_id)
+
+    def test_removed_student_through_many_to_many(self):
+        course = Course.objects.get(pk=self.course_ids[0])
+        student = course.students.first()
+        before = self.stats(course.id)
+        with self.captureOnCommitCallbacks(execute=True):
+            course.students.remove(student)
+        self.assertEqual(self.stats(course.id)['students'], before['students'] - 1)
+        self.assert_matches_recount(course.id)
+
+    def test_deleted_assignment_cascades_once(self):
+        course_id = self.course_ids[0]
+        assignment = Assignment.objects.filter(course_id=course_id).first()
+        removed = assignment.homeworks.count()
+        before = self.stats(course_id)
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            assignment.delete()
+        # Пересчеты копятся за транзакцию: по одному обработчику на вид пересчета
+        self.assertLessEqual(len(callbacks), 4)
+        after = self.stats(course_id)
+        self.assertEqual(after['assignments'], before['assignments'] - 1)
+        self.assertEqual(after['homeworks'], before['homeworks'] - removed)
+        self.assert_matches_recount(course_id)
+
+
+class UserRenameTests(AccountsTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.get(username='test_s0')
+        homework_ids = Homework.objects.filter(student__user=self.user).values_list('id', flat=True)
+        self.homework_tags = [homework_tag(homework_id) for homework_id in homework_ids]
+
+    def test_unchanged_save_does_not_touch_homeworks_or_courses(self):
+        with self.captureOnCommitCallbacks() as callbacks, self.assertNumQueries(1):
+            self.user.save()
+        self.assertEqual(callbacks, [])
+
+    def test_rename_invalidates_homeworks_and_gradebooks(self):
+        before = tag_versions(self.homework_tags)
+        version = Course.objects.get(pk=self.course_ids[0]).gradebook_version
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.last_name = 'Переименованный'
+            self.user.save()
+        after = tag_versions(self.homework_tags)
+        self.assertFalse(set(before.items()) & set(after.items()))
+        self.assertGreater(Course.objects.get(pk=self.course_ids[0]).gradebook_version, version)
+
+    def test_login_update_is_ignored(self):
+        self.user.first_name = 'Другое'
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.user.save(update_fields=['last_login'])
+        self.assertEqual(callbacks, [])
+
+
+class RoleCacheTests(AccountsTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.student = User.objects.get(username='test_s0')
+        self.teachers = Group.objects.get(name=TEACHER)
+
+    def fresh(self, user):
+        return User.objects.get(pk=user.pk)
+
+    def test_warm_cache_makes_no_queries(self):
+        user = self.fresh(self.teacher)
+        with self.assertNumQueries(1):
+            self.assertEqual(get_user_roles(user) - {STUDENT}, {TEACHER})
+        user = self.fresh(self.teacher)
+        with self.assertNumQueries(0):
+            self.assertTrue(is_teacher(user))
+
+    def test_decorator_uses_cached_roles(self):
+        view = teacher_required(lambda request: HttpResponse('ok'))
+        get_user_roles(self.fresh(self.teacher))
+        request = RequestFactory().get('/')
+        request.user = self.fresh(self.teacher)
+        with self.assertNumQueries(0):
+            self.assertEqual(view(request).status_code, 200)
+        request.user = AnonymousUser()
+        self.assertEqual(view(request).status_code, 302)
+
+    def test_membership_changes_invalidate_roles(self):
+        self.assertFalse(is_teacher(self.fresh(self.student)))
+        self.student.groups.add(self.teachers)
+        self.assertTrue(is_teacher(self.fresh(self.student)))
+        self.assertIn(self.student.pk, teacher_ids())
+        self.teachers.user_set.remove(self.student)
+        self.assertFalse(is_teacher(self.fresh(self.student)))
+        self.assertNotIn(self.student.pk, teacher_ids())
+
+    def test_cleared_and_renamed_groups_invalidate_roles(self):
+        self.assertTrue(is_teacher(self.fresh(self.teacher)))
+        self.teacher.groups.clear()
+        self.assertFalse(is_teacher(self.fresh(self.teacher)))
+        self.student.groups.add(self.teachers)
+        self.assertTrue(is_teacher(self.fresh(self.student)))
+        self.teachers.name = 'Former teachers'
+        self.teachers.save()
+        self.assertFalse(is_teacher(self.fresh(self.student)))
+
+
+class MetricsTests(AccountsTestCase):
+
+    def registry(self):
+        registry = MetricsRegistry()
+        counter = Counter('test_actions_total', 'Действия', ['action'], registry=registry)
+        histogram = Histogram('test_duration_seconds', 'Время', ['view'], buckets=(0.1, 1.0), registry=registry)
+        return registry, counter, histogram
+
+    def test_text_format(self):
+        registry, counter, histogram = self.registry()
+        counter.inc(action='grade')
+        counter.inc(2, action='a "quoted"\nlabel')
+        for value in (0.05, 0.5, 5):
+            histogram.observe(value, view='gradebook')
+        text = registry.render()
+        self.assertIn('# TYPE test_actions_total counter', text)
+        self.assertIn('test_actions_total{action="grade"} 1', text)
+        self.assertIn('test_actions_total{action="a \\"quoted\\"\\nlabel"} 2', text)
+        self.assertIn('test_duration_seconds_bucket{view="gradebook",le="0.1"} 1', text)
+        self.assertIn('test_duration_seconds_bucket{view="gradebook",le="1.0"} 2', text)
+        self.assertIn('test_duration_seconds_bucket{view="gradebook",le="+Inf"} 3', text)
+        self.assertIn('test_duration_seconds_sum{view="gradebook"} 5.55', text)
+        self.assertIn('test_duration_seconds_count{view="gradebook"} 3', text)
+
+    def test_worker_files_are_summed(self):
+        directory = tempfile.mkdtemp(dir=MEDIA_ROOT)
+        with override_settings(METRICS_MULTIPROCESS_DIR=directory):
+            first, first_counter, first_histogram = self.registry()
+            second, second_counter, second_histogram = self.registry()
+            first_counter.inc(action='grade')
+            second_counter.inc(3, action='grade')
+            second_histogram.observe(0.5, view='gradebook')
+            # Второй воркер сбрасывает значения не чаще METRICS_FLUSH_INTERVAL; при выходе — всегда
+            second.flush_at_exit()
+            text = first.render()
+        self.assertEqual(len(os.listdir(directory)), 2)
+        self.assertIn('test_actions_total{action="grade"} 4', text)
+        self.assertIn('test_duration_seconds_count{view="gradebook"} 1', text)
+
+    def test_forked_worker_starts_from_zero(self):
+        registry, counter, histogram = self.registry()
+        counter.inc(action='grade')
+        file_name = registry.file_name
+        with mock.patch('accounts.metrics.os.getpid', return_value=registry.pid + 1):
+            counter.inc(action='revision')
+        self.assertNotEqual(registry.file_name, file_name)
+        self.assertEqual(registry.collect()['test_actions_total'], {('revision',): 1})
+
+    def test_endpoint_requires_token_or_staff(self):
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, 403)
+        self.client.get(reverse('teacher_dashboard'))
+        with override_settings(METRICS_TOKEN='secret'):
+            self.assertEqual(
+                self.client.get(reverse('metrics'), HTTP_AUTHORIZATION='Bearer wrong').status_code, 403,
+            )
+            response = self.client.get(reverse('metrics'), HTTP_AUTHORIZATION='Bearer secret')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/plain; version=0.0.4'))
+        self.assertIn(b'accounts_request_duration_seconds_bucket{view="teacher_dashboard",le="+Inf"}', response.content)
+        self.assertIn(b'accounts_responses_total{view="teacher_dashboard",status="200"}', response.content)
+
+
+def create_test_assignment(course_id):
+    """Тест из четырех вопросов по 10 баллов, по одному каждого типа; возвращает задание и варианты по именам"""
+    assignment = Assignment.objects.create(
+        course_id=course_id, title='Тест', description='', assignment_type='test', max_points=40,
+        due_date=timezone.now(),
+    )
+    options = {}
+    for order, (kind, answers) in enumerate([
+        ('single', [('A', True), ('B', False)]),
+        ('multiple', [('C', True), ('D', True), ('E', False), ('F', False)]),
+        ('matching', [('X', False), ('Y', False), ('Z', False)]),
+        ('text', [('Сорок два', True)]),
+    ]):
+        question = TestQuestion.objects.create(
+            assignment=assignment, question_text=kind, question_type=kind, points=10, order=order,
+        )
+        options[kind] = question
+        for answer_order, (text, is_correct) in enumerate(answers):
+            options[text] = TestAnswer.objects.create(
+                question=question, answer_text=text, is_correct=is_correct, order=answer_order,
+            )
+    return assignment, options
+
+
+class AutogradeTests(AccountsTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.assignment, cls.options = create_test_assignment(cls.course_ids[0])
+        cls.students = list(StudentProfile.objects.filter(courseenrollment__course_id=cls.course_ids[0])[:4])
+
+    def ids(self, names):
+        return ','.join(str(self.options[name].id) for name in names)
+
+    def submit(self, student, status='submitted', **answers):
+        homework = Homework.objects.create(
+            assignment=self.assignment, student=student, status=status, submitted_at=timezone.now(),
+        )
+        ids = self.ids
+        TestSubmission.objects.bulk_create([
+            TestSubmission(homework=homework, question=self.options['single'], answer=self.options[answers['single']]),
+            TestSubmission(homework=homework, question=self.options['multiple'], answer_text=ids(answers['multiple'])),
+            TestSubmission(homework=homework, question=self.options['matching'], answer_text=ids(answers['matching'])),
+            TestSubmission(homework=homework, question=self.options['text'], answer_text=answers['text']),
+        ])
+        return homework
+
+    def test_partial_credit_for_every_question_type(self):
+        perfect = self.submit(self.students[0], single='A', multiple='CD', matching='XYZ', text='  сорок   ДВА ')
+        # multiple: (1 верный − 1 лишний) / 2 = 0; matching: 1 из 3 на месте
+        poor = self.submit(self.students[1], single='B', multiple='CE', matching='XZY', text='другое')
+        # multiple: 1 из 2; matching: 1 из 3
+        half = self.submit(self.students[2], single='B', multiple='C', matching='YXZ', text='')
+        result = autograde_assignment(self.assignment, teacher=self.teacher)
+        self.assertEqual(result.scores, {perfect.id: 40, poor.id: 3, half.id: 8})
+        grade = Grade.objects.get(homework=perfect)
+        self.assertEqual((grade.points, grade.grade_value, grade.comment), (40, 5, AUTOGRADE_COMMENT))
+        self.assertEqual(Homework.objects.get(pk=poor.pk).status, 'graded')
+
+    def test_revision_and_graded_work_is_kept_without_overwrite(self):
+        revision = self.submit(self.students[0], 'revision', single='A', multiple='CD', matching='XYZ', text='')
+        graded = self.submit(self.students[1], 'graded', single='A', multiple='CD', matching='XYZ', text='')
+        Grade.objects.create(homework=graded, teacher=self.teacher, points=1, grade_value=1, comment='Смотрел сам')
+        self.assertEqual(autograde_assignment(self.assignment, teacher=self.teacher).graded, 0)
+
+        result = autograde_assignment(self.assignment, teacher=self.teacher, overwrite=True)
+        self.assertEqual(result.scores, {graded.id: 30})
+        grade = Grade.objects.get(homework=graded)
+        # Оценка пересчитана, комментарий преподавателя остался
+        self.assertEqual((grade.points, grade.comment), (30, 'Смотрел сам'))
+        self.assertFalse(Grade.objects.filter(homework=revision).exists())
+
+    def test_view_grades_only_tests(self):
+        for student in self.students:
+            self.submit(student, single='A', multiple='C', matching='XYZ', text='сорок два')
+        url = reverse('autograde_test', args=[self.assignment.id])
+        with self.captureOnCommitCallbacks(execute=True):
+            data = json.loads(self.client.post(url).content)
+        self.assertEqual((data['graded'], data['max_points']), (len(self.students), 40))
+        points = Grade.objects.filter(homework__assignment=self.assignment).values_list('points', flat=True)
+        self.assertEqual(set(points), {35})
+        homework = Homework.objects.filter(assignment__course_id=self.course_ids[0]).exclude(
+            assignment=self.assignment
+        ).first()
+        response = self.client.post(reverse('autograde_test', args=[homework.assignment_id]))
+        self.assertEqual(response.status_code, 400)
+
+
+class AnswerKeyTests(AccountsTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.assignment, cls.options = create_test_assignment(cls.course_ids[0])
+
+    def setUp(self):
+        super().setUp()
+        local_keys.clear()
+
+    def test_warm_cache_makes_no_queries(self):
+        with self.assertNumQueries(2):
+            key = get_answer_key(self.assignment.id)
+        with self.assertNumQueries(0):
+            self.assertIs(get_answer_key(self.assignment.id), key)
+        # Другой процесс берет ключ из общего кэша
+        local_keys.clear()
+        with self.assertNumQueries(0):
+            self.assertEqual(get_answer_key(self.assignment.id).version, key.version)
+
+    def test_compiled_key(self):
+        key = get_answer_key(self.assignment.id)
+        self.assertEqual(key.question_ids, [self.options[kind].id for kind in ('single', 'multiple', 'matching', 'text')])
+        self.assertEqual(list(key.weights), [10.0] * 4)
+        self.assertEqual(key.correct_masks[:2], [0b1, 0b11])
+        self.assertEqual(key.matching_orders[2], tuple(self.options[name].id for name in 'XYZ'))
+        self.assertEqual(key.accepted_texts[3], frozenset(['сорок два']))
+
+    def test_same_content_keeps_version(self):
+        version = get_answer_key(self.assignment.id).version
+        invalidate_answer_key(self.assignment.id)
+        with self.assertNumQueries(2):
+            self.assertEqual(get_answer_key(self.assignment.id).version, version)
+
+    def test_question_and_answer_changes_invalidate_key(self):
+        key = get_answer_key(self.assignment.id)
+        answer = TestAnswer.objects.get(pk=self.options['B'].pk)
+        answer.is_correct = True
+        answer.save()
+        changed = get_answer_key(self.assignment.id)
+        self.assertNotEqual(changed.version, key.version)
+        self.assertEqual(changed.correct_masks[0], 0b11)
+
+        question = TestQuestion.objects.get(pk=self.options['text'].pk)
+        question.points = 20
+        question.save()
+        self.assertEqual(get_answer_key(self.assignment.id).total_points, 50)
+
+        TestAnswer.objects.get(pk=self.options['F'].pk).delete()
+        self.assertNotIn(self.options['F'].pk, get_answer_key(self.assignment.id).option_bits)
+
+
+class ChatRoomTestCase(AccountsTestCase):
+    """Комната курса с тремя сообщениями; close_old_connections отключен.
+
+    В TestCase соединение с базой находится внутри транзакции теста, и
+    close_old_connections из database_sync_to_async закрыло бы его. Раздача
+    сообщений идет после фиксации, которой в TestCase нет, поэтому тесты
+    вызывают publish_message сами.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.room = ChatRoom.objects.create(course_id=cls.course_ids[0], name='Общий чат', created_by=cls.teacher)
+        cls.messages = [
+            ChatMessage.objects.create(room=cls.room, sender=cls.teacher, message=f'Сообщение {number}')
+            for number in range(3)
+        ]
+        cls.outsider = User.objects.create_user('outsider')
+
+    def setUp(self):
+        super().setUp()
+        patcher = mock.patch('accounts.chat.close_old_connections')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    async def post(self, text):
+        message = await sync_to_async(ChatMessage.objects.create)(room=self.room, sender=self.teacher, message=text)
+        await sync_to_async(publish_message)(message)
+        return message
+
+
+class ChatWebSocketTests(ChatRoomTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.outsider_client = self.client_class()
+        self.outsider_client.force_login(self.outsider)
+
+    def scope(self, path=None, query=b'', origin='testserver', client=None):
+        client = client or self.client
+        headers = [(b'host', b'testserver'), (b'cookie', f'sessionid={client.cookies["sessionid"].value}'.encode())]
+        if origin:
+            headers.append((b'origin', f'http://{origin}'.encode()))
+        return {
+            'type': 'websocket', 'path': path or f'/ws/chat/{self.room.id}/', 'query_string': query,
+            'headers': headers,
+        }
+
+    async def connect(self, scope):
+        communicator = ApplicationCommunicator(websocket_application, scope)
+        await communicator.send_input({'type': 'websocket.connect'})
+        return communicator, await communicator.receive_output(1)
+
+    async def test_replays_missed_messages_then_streams_new_ones(self):
+        communicator, event = await self.connect(self.scope(query=f'after={self.messages[0].id}'.encode()))
+        self.assertEqual(event['type'], 'websocket.accept')
+        replayed = [json.loads((await communicator.receive_output(1))['text']) for _ in range(2)]
+        self.assertEqual([item['id'] for item in replayed], [message.id for message in self.messages[1:]])
+        self.assertEqual(replayed[0]['sender_name'], self.teacher.get_full_name() or self.teacher.username)
+
+        message = await self.post('Новое')
+        self.assertEqual(json.loads((await communicator.receive_output(1))['text'])['id'], message.id)
+        self.assertTrue(await communicator.receive_nothing(0.05))
+
+        await communicator.send_input({'type': 'websocket.receive', 'text': json.dumps({'message': '  Привет  '})})
+        await communicator.send_input({'type': 'websocket.disconnect', 'code': 1000})
+        await communicator.wait(1)
+        self.assertEqual(get_broker().subscriber_count(self.room.id), 0)
+        saved = await sync_to_async(ChatMessage.objects.filter(room=self.room).latest)('id')
+        self.assertEqual(saved.message, 'Привет')
+
+    async def test_rejects_unknown_path_foreign_origin_and_outsiders(self):
+        communicator, event = await self.connect(self.scope(path='/ws/chat/abc/'))
+        self.assertEqual(event, {'type': 'websocket.close', 'code': CLOSE_NOT_FOUND})
+        communicator, event = await self.connect(self.scope(origin='evil.example'))
+        self.assertEqual(event, {'type': 'websocket.close', 'code': CLOSE_FORBIDDEN})
+        communicator, event = await self.connect(self.scope(client=self.outsider_client))
+        self.assertEqual(event, {'type': 'websocket.close', 'code': CLOSE_FORBIDDEN})
+
+    @override_settings(CHAT_SUBSCRIBER_QUEUE_SIZE=1)
+    async def test_slow_client_is_disconnected(self):
+        communicator, event = await self.connect(self.scope(query=f'after={self.messages[-1].id}'.encode()))
+        self.assertEqual(event['type'], 'websocket.accept')
+        # Три публикации без передачи управления циклу: вторая уже не помещается в очередь
+        for number in range(1, 4):
+            get_broker().publish(self.room.id, self.messages[-1].id + number, '{}')
+        outputs = []
+        while not outputs or outputs[-1]['type'] != 'websocket.close':
+            outputs.append(await communicator.receive_output(1))
+        self.assertEqual(outputs[-1]['code'], CLOSE_OVERFLOW)
+        await communicator.wait(1)
+        self.assertEqual(get_broker().subscriber_count(self.room.id), 0)
+
+
+class ChatEventStreamTests(ChatRoomTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.async_client.force_login(self.outsider)
+
+    @override_settings(CHAT_SSE_HEARTBEAT=0.05)
+    async def test_replays_missed_messages_pings_and_streams_new_ones(self):
+        stream = event_stream(self.room.id, self.messages[0].id)
+        try:
+            self.assertEqual(await stream.__anext__(), 'retry: 3000\n\n')
+            replayed = [await stream.__anext__() for _ in range(2)]
+            self.assertEqual(
+                [int(event.split('\n')[0].removeprefix('id: ')) for event in replayed],
+                [message.id for message in self.messages[1:]],
+            )
+            self.assertEqual(await stream.__anext__(), ': ping\n\n')
+            self.assertEqual(get_broker().subscriber_count(self.room.id), 1)
+
+            message = await self.post('Новое')
+            event = await stream.__anext__()
+            self.assertTrue(event.startswith(f'id: {message.id}\ndata: '))
+            self.assertEqual(json.loads(event.split('data: ', 1)[1])['message'], 'Новое')
+        finally:
+            await stream.aclose()
+        self.assertEqual(get_broker().subscriber_count(self.room.id), 0)
+
+    async def test_outsider_cannot_subscribe(self):
+        response = await self.async_client.get(reverse('chat_events', args=[self.room.id]))
+        self.assertEqual(response.status_code, 403)
+        self.assertEqual(get_broker().subscriber_count(self.room.id), 0)
+
+    def test_send_validates_message_and_access(self):
+        url = reverse('chat_send', args=[self.room.id])
+
+        def send(text):
+            return self.client.post(url, json.dumps({'message': text}), content_type='application/json')
+
+        self.assertEqual(send('   ').status_code, 400)
+        response = send(' Привет ')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(ChatMessage.objects.get(id=response.json()['id']).message, 'Привет')
+
+        self.client.force_login(self.outsider)
+        self.assertEqual(send('Привет').status_code, 403)
+
+
+@override_settings(CHAT_HISTORY_PAGE_SIZE=2)
+class ChatHistoryTests(ChatRoomTestCase):
+
+    def page(self, **params):
+        response = self.client.get(reverse('chat_history', args=[self.room.id]), params)
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_pages_before_and_after_cursor(self):
+        first, second, third = self.messages
+        latest = self.page()
+        self.assertEqual(latest['messages'], [
+            [second.id, self.teacher.id, second.message], [third.id, self.teacher.id, third.message],
+        ])
+        self.assertTrue(latest['has_more'])
+        self.assertEqual(latest['senders'], {str(self.teacher.id): self.teacher.get_full_name() or self.teacher.username})
+
+        older = self.page(before=second.id)
+        self.assertEqual([row[0] for row in older['messages']], [first.id])
+        self.assertFalse(older['has_more'])
+
+        newer = self.page(after=first.id)
+        self.assertEqual([row[0] for row in newer['messages']], [second.id, third.id])
+        self.assertFalse(newer['has_more'])
+        self.assertEqual(self.page(after=third.id), {'success': True, 'messages': [], 'senders': {}, 'has_more': False})
+
+    def test_sender_names_are_cached_per_room(self):
+        with self.assertNumQueries(1):
+            sender_names(self.room.id, [self.teacher.id, self.outsider.id])
+        with self.assertNumQueries(0):
+            names = sender_names(self.room.id, [self.teacher.id])
+        self.assertEqual(names, {self.teacher.id: self.teacher.get_full_name() or self.teacher.username})
+
+    def test_rejects_bad_cursor_and_outsiders(self):
+        url = reverse('chat_history', args=[self.room.id])
+        self.assertEqual(self.client.get(url, {'before': 'abc'}).status_code, 400)
+        self.client.force_login(self.outsider)
+        self.assertEqual(self.client.get(url).status_code, 403)
+
+
+class SearchTests(AccountsTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        homeworks = list(Homework.objects.filter(assignment__course_id=cls.course_ids[0]).order_by('id')[:2])
+        cls.dense, cls.sparse = homeworks
+        cls.dense.text_content = 'кварк кварк кварк <b>глюон</b>'
+        cls.dense.save()
+        cls.sparse.text_content = 'кварк ' + ' '.join(f'слово{number}' for number in range(40))
+        cls.sparse.save()
+        room = ChatRoom.objects.create(course_id=cls.course_ids[1], name='Физика', created_by=cls.teacher)
+        cls.message = ChatMessage.objects.create(room=room, sender=cls.teacher, message='Кварк в чате')
+
+        other = User.objects.create_user('other_teacher')
+        other.groups.add(Group.objects.get(name=TEACHER))
+        with cls.captureOnCommitCallbacks(execute=True):
+            course = Course.objects.create(title='Чужой курс', description='', teacher=other)
+            assignment = Assignment.objects.create(
+                course=course, title='Кварк', description='', due_date=timezone.now(),
+            )
+            cls.foreign = Homework.objects.create(
+                assignment=assignment, student=cls.dense.student, text_content='кварк кварк кварк кварк',
+            )
+
+    def search(self, **params):
+        response = self.client.get(reverse('search'), params)
+        self.assertEqual(response.status_code, 200)
+        return response.json()['results']
+
+    def test_results_are_limited_to_own_courses_and_ranked(self):
+        results = self.search(q='кварк')
+        self.assertEqual(
+            [(item['kind'], item['id']) for item in results],
+            [('homework', self.dense.id), ('chat', self.message.id), ('homework', self.sparse.id)],
+        )
+        self.assertTrue(all(item['course_id'] in self.course_ids for item in results))
+        self.assertEqual(results[0]['url'], reverse('homework_detail', args=[self.dense.id]))
+
+    def test_prefix_kind_filter_and_highlighting(self):
+        results = self.search(q='глю')
+        self.assertEqual([item['id'] for item in results], [self.dense.id])
+        self.assertIn('<mark>глюон</mark>', results[0]['snippet'])
+        self.assertIn('&lt;b&gt;', results[0]['snippet'])
+        self.assertEqual([item['id'] for item in self.search(q='кварк', kind='chat')], [self.message.id])
+        # Синтаксис FTS5 из запроса не интерпретируется
+        self.assertEqual(self.search(q='кварк OR NOT "глюон'), [])
+        self.assertEqual(self.search(q='  '), [])
+
+    def test_homework_list_search(self):
+        response = self.client.get(reverse('homework_list'), {'q': 'кварк'})
+        self.assertEqual({homework.id for homework in response.context['page_obj']}, {self.dense.id, self.sparse.id})
+        self.assertIsNone(response.context['total_count'])
+        response = self.client.get(reverse('homework_list'), {'q': '!!!'})
+        self.assertEqual(list(response.context['page_obj']), [])
+
+
+class SimilarityTests(AccountsTestCase):
+    TEXT = ' '.join(f'слово{number}' for number in range(60))
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.assignment = Assignment.objects.filter(course_id=cls.course_ids[0]).order_by('id').first()
+        cls.homeworks = list(cls.assignment.homeworks.order_by('id'))
+
+    def set_text(self, homework, text):
+        homework.text_content = text
+        homework.save()
+
+    def test_signature_estimates_jaccard(self):
+        self.assertIsNone(minhash(' ,. '))
+        self.assertEqual(minhash(self.TEXT), minhash(self.TEXT.upper().replace(' ', ', ')))
+        self.assertEqual(similarity(minhash(self.TEXT), minhash(self.TEXT)), 1)
+        edited = self.TEXT.replace('слово59', 'другое')
+        self.assertGreater(similarity(minhash(self.TEXT), minhash(edited)), 0.8)
+        self.assertLess(similarity(minhash(self.TEXT), minhash('совсем другой ответ на задание')), 0.1)
+
+    def test_identical_signatures_are_grouped(self):
+        signature = minhash(self.TEXT)
+        signatures = {1: signature, 2: signature, 3: signature, 4: minhash('другой ответ на задание')}
+        self.assertEqual(similar_pairs(signatures), [(1.0, 1, 2), (1.0, 1, 3), (1.0, 2, 3)])
+        self.assertEqual(similar_pairs(signatures, limit=1), [(1.0, 1, 2)])
+
+    def test_signature_follows_text(self):
+        homework = self.homeworks[0]
+        self.set_text(homework, self.TEXT)
+        signature = HomeworkSignature.objects.get(homework=homework)
+        self.assertEqual(bytes(signature.signature), minhash(self.TEXT))
+        homework.status = 'graded'
+        homework.save(update_fields=['status'])
+        self.assertEqual(HomeworkSignature.objects.get(homework=homework).computed_at, signature.computed_at)
+        self.set_text(homework, '')
+        self.assertFalse(HomeworkSignature.objects.filter(homework=homework).exists())
+
+    def test_report_lists_similar_pairs(self):
+        first, second, third = self.homeworks[:3]
+        self.set_text(first, self.TEXT)
+        self.set_text(second, self.TEXT.replace('слово59', 'другое'))
+        self.set_text(third, self.TEXT)
+        pairs = suspicious_pairs(self.assignment.id)
+        self.assertEqual([pair[1:] for pair in pairs], [(first.id, third.id), (first.id, second.id), (second.id, third.id)])
+        self.assertEqual(pairs[0][0], 1.0)
+        # Пока сигнатуры не менялись, отчет берется из кэша
+        with self.assertNumQueries(1):
+            self.assertEqual(suspicious_pairs(self.assignment.id), pairs)
+
+        response = self.client.get(reverse('assignment_detail', args=[self.assignment.id]))
+        report = response.context['suspicious_pairs']
+        self.assertEqual([(item['first'].id, item['second'].id) for item in report], [pair[1:] for pair in pairs])
+        self.assertContains(response, first.student.user.last_name)
+
+
+class StudentProgressTests(AccountsTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.course_id = cls.course_ids[0]
+        cls.student = StudentProfile.objects.filter(courseenrollment__course_id=cls.course_id).order_by('id').first()
+
+    def progress(self):
+        return StudentCourseProgress.objects.get(course_id=self.course_id, student=self.student)
+
+    def expected(self):
+        homeworks = Homework.objects.filter(assignment__course_id=self.course_id, student=self.student)
+        graded = homeworks.filter(grade__points__isnull=False).select_related('grade', 'assignment')
+        return {
+            'points_earned': sum(homework.grade.points for homework in graded),
+            'points_possible': sum(homework.assignment.max_points for homework in graded),
+            'assignments': Assignment.objects.filter(course_id=self.course_id).count(),
+            'last_activity': homeworks.aggregate(latest=Max('submitted_at'))['latest'],
+            **{status: homeworks.filter(status=status).count() for status in StudentCourseProgress.STATUSES},
+        }
+
+    def assertProgressMatches(self):
+        progress = self.progress()
+        self.assertEqual({field: getattr(progress, field) for field in self.expected()}, self.expected())
+
+    def test_signals_keep_progress_current(self):
+        self.assertProgressMatches()
+        with self.captureOnCommitCallbacks(execute=True):
+            assignment = Assignment.objects.create(
+                course_id=self.course_id, title='Новое задание', description='', max_points=50, due_date=timezone.now(),
+            )
+            homework = Homework.objects.create(
+                assignment=assignment, student=self.student, status='submitted', submitted_at=timezone.now(),
+            )
+        self.assertProgressMatches()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Grade.objects.create(homework=homework, teacher=self.teacher, points=30, grade_value=4)
+            homework.status = 'graded'
+            homework.save()
+        self.assertProgressMatches()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            enrollment = CourseEnrollment.objects.get(course_id=self.course_id, student=self.student)
+            enrollment.is_active = False
+            enrollment.save()
+        self.assertFalse(StudentCourseProgress.objects.filter(course_id=self.course_id, student=self.student).exists())
+
+    def test_page_reads_stored_progress(self):
+        url = reverse('student_progress', args=[self.student.id])
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(len(response.context['courses']), 2)
+        tables = [query['sql'] for query in queries if 'accounts_' in query['sql']]
+        self.assertEqual(len(tables), 1)
+        self.assertIn('accounts_studentcourseprogress', tables[0])
+
+        # Без построенного прогресса страница строит его сама
+        StudentCourseProgress.objects.filter(student=self.student).delete()
+        response = self.client.get(url)
+        self.assertEqual([item.course_id for item in response.context['courses']], sorted(
+            self.course_ids, key=lambda course_id: Course.objects.get(id=course_id).title,
+        ))
+        self.assertProgressMatches()
+
+    def test_rebuild_command(self):
+        StudentCourseProgress.objects.filter(course_id=self.course_id).update(points_earned=0, graded=0)
+        StudentCourseProgress.objects.filter(course_id=self.course_ids[1]).delete()
+        call_command('rebuild_student_progress', stdout=io.StringIO())
+        self.assertProgressMatches()
+        self.assertEqual(
+            StudentCourseProgress.objects.count(),
+            CourseEnrollment.objects.filter(is_active=True).count(),
+        )
+
+
+class GradebookResponseTests(AccountsTestCase):
+
+    def setUp(self):
+        super().setUp()
+        # Без CSRF-cookie ответ не кэшируется и не получает ETag; браузер получает ее на странице входа
+        self.assertNotIn('ETag', self.client.get(reverse('gradebook')))
+        self.client.cookies[settings.CSRF_COOKIE_NAME] = 'a' * 32
+
+    def get(self, name='gradebook', args=(), **headers):
+        with mock.patch('accounts.views.build_gradebooks', wraps=build_gradebooks) as build:
+            response = self.client.get(reverse(name, args=args), headers=headers)
+        return response, build.call_count
+
+    def test_not_modified_and_cached_page(self):
+        response, builds = self.get()
+        self.assertEqual((response.status_code, builds), (200, 1))
+        etag = response['ETag']
+        self.assertIn('no-cache', response['Cache-Control'])
+        self.assertIn('private', response['Cache-Control'])
+
+        with self.assertNumQueries(3):
+            not_modified, builds = self.get(if_none_match=etag)
+        self.assertEqual((not_modified.status_code, builds), (304, 0))
+        self.assertEqual(not_modified['ETag'], etag)
+
+        cached, builds = self.get()
+        self.assertEqual((cached.status_code, builds), (200, 0))
+        self.assertEqual(cached.content, response.content)
+
+        course_page, _ = self.get('gradebook_course', [self.course_ids[0]])
+        self.assertNotEqual(course_page['ETag'], etag)
+
+    def test_grade_change_changes_etag(self):
+        etag = self.get()[0]['ETag']
+        grade = Grade.objects.filter(homework__assignment__course_id=self.course_ids[0]).first()
+        with self.captureOnCommitCallbacks(execute=True):
+            grade.points = (grade.points or 0) + 1
+            grade.save()
+        response, builds = self.get(if_none_match=etag)
+        self.assertEqual((response.status_code, builds), (200, 1))
+        self.assertNotEqual(response['ETag'], etag)
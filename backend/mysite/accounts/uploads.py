@@ -0,0 +1,158 @@
+"""Загрузка вложений частями с возможностью продолжить после обрыва связи.
+
+Протокол:
+
+1. ``POST homework/<id>/uploads/`` с file_name и total_size создает сессию;
+2. ``PUT uploads/<uuid>/`` с обязательными заголовками X-Upload-Offset
+   и X-Chunk-SHA256 дописывает часть прямо во временный файл; смещение
+   должно совпадать с уже подтвержденным, иначе сервер отвечает 409
+   и сообщает текущее, а часть с неверной суммой отклоняется с 400;
+3. ``GET uploads/<uuid>/`` возвращает подтвержденное смещение, с которого
+   клиент продолжает загрузку после обрыва;
+4. ``POST uploads/<uuid>/finalize/`` создает Attachment с file_size.
+
+Запись частей и завершение одной сессии идут строго по очереди: на время
+работы временный файл блокируется (flock), и состояние сессии перечитывается
+из базы уже под блокировкой. Блокировка файла работает и на SQLite, где
+select_for_update ничего не делает; одновременный запрос сразу получает 409.
+"""
+import fcntl
+import hashlib
+import os
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.files import File
+from django.db import transaction
+from django.utils import timezone
+
+from .models import Attachment, UploadSession
+
+CHUNK_SIZE = 64 * 1024
+
+
+class UploadError(Exception):
+    """Ошибка протокола загрузки с HTTP-статусом для ответа"""
+
+    def __init__(self, message, status=400, offset=None):
+        super().__init__(message)
+        self.status = status
+        self.offset = offset
+
+
+class UploadedPart(File):
+    """Собранный временный файл; хранилище может перенести его без копирования"""
+
+    def temporary_file_path(self):
+        return self.file.name
+
+
+def max_chunk_size():
+    return getattr(settings, 'UPLOAD_MAX_CHUNK_SIZE', 8 * 1024 * 1024)
+
+
+def upload_temp_path(session):
+    directory = getattr(settings, 'UPLOAD_TEMP_DIR', None) or os.path.join(settings.MEDIA_ROOT, 'uploads')
+    os.makedirs(directory, exist_ok=True)
+    return os.path.join(directory, f'{session.pk}.part')
+
+
+def start_upload(homework, user, file_name, total_size):
+    file_name = os.path.basename(file_name or '').strip()
+    if not file_name:
+        raise UploadError('Укажите имя файла')
+    if total_size < 0 or total_size > getattr(settings, 'UPLOAD_MAX_FILE_SIZE', 2 * 1024 ** 3):
+        raise UploadError('Недопустимый размер файла', status=413)
+    session = UploadSession.objects.create(
+        homework=homework, user=user, file_name=file_name[:255], total_size=total_size
+    )
+    open(upload_temp_path(session), 'wb').close()
+    return session
+
+
+@contextmanager
+def locked_part(session):
+    """Временный файл сессии под эксклюзивной блокировкой; сессия перечитана под ней"""
+    try:
+        target = open(upload_temp_path(session), 'r+b')
+    except FileNotFoundError:
+        raise UploadError('Загрузка уже завершена', status=409, offset=session.offset)
+    with target:
+        try:
+            fcntl.flock(target, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            raise UploadError('Загрузка уже обрабатывается другим запросом', status=409, offset=session.offset)
+        session.refresh_from_db(fields=['offset', 'completed'])
+        if session.completed:
+            raise UploadError('Загрузка уже завершена', status=409, offset=session.offset)
+        yield target
+
+
+def append_chunk(session, offset, stream, length, checksum):
+    """Дописывает часть по смещению offset, проверяя ее sha256.
+
+    Данные читаются из потока запроса блоками и пишутся сразу в файл,
+    минуя обработчики загрузки Django. При ошибке файл обрезается
+    до последнего подтвержденного смещения.
+    """
+    if length <= 0 or length > max_chunk_size():
+        raise UploadError('Недопустимый размер части', status=413, offset=session.offset)
+
+    digest = hashlib.sha256()
+    with locked_part(session) as target:
+        if offset != session.offset:
+            raise UploadError('Неверное смещение', status=409, offset=session.offset)
+        if offset + length > session.total_size:
+            raise UploadError('Часть выходит за размер файла', offset=session.offset)
+
+        # Отбрасываем хвост неподтвержденной части от прерванной попытки
+        target.truncate(offset)
+        target.seek(offset)
+        remaining = length
+        while remaining > 0:
+            chunk = stream.read(min(CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            digest.update(chunk)
+            target.write(chunk)
+            remaining -= len(chunk)
+        if remaining or digest.hexdigest() != checksum.lower():
+            target.truncate(offset)
+            raise UploadError('Часть повреждена, отправьте ее повторно', offset=offset)
+        target.flush()
+
+        UploadSession.objects.filter(pk=session.pk).update(offset=offset + length, updated_at=timezone.now())
+    session.offset = offset + length
+    return session.offset
+
+
+def finalize_upload(session):
+    """Создает вложение из собранного файла"""
+    path = upload_temp_path(session)
+    with locked_part(session):
+        if session.offset != session.total_size or os.path.getsize(path) != session.total_size:
+            raise UploadError('Файл загружен не полностью', status=409, offset=session.offset)
+
+        with transaction.atomic():
+            # Условное обновление: вложение создает только тот, кто первым завершил сессию
+            if not UploadSession.objects.filter(pk=session.pk, completed=False).update(
+                completed=True, updated_at=timezone.now()
+            ):
+                raise UploadError('Загрузка уже завершена', status=409, offset=session.offset)
+            session.completed = True
+            attachment = Attachment(
+                homework=session.homework, file_name=session.file_name, file_size=session.total_size
+            )
+            with open(path, 'rb') as source:
+                attachment.file.save(session.file_name, UploadedPart(source), save=False)
+            attachment.save()
+    if os.path.exists(path):
+        os.remove(path)
+    return attachment
+
+
+def discard_upload(session):
+    path = upload_temp_path(session)
+    if os.path.exists(path):
+        os.remove(path)
+    session.delete()
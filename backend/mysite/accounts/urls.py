@@ -11,20 +11,45 @@ urlpatterns = [
 
     # Домашние задания
     path('homeworks/', views.homework_list, name='homework_list'),  # ОБРАТИТЕ ВНИМАНИЕ: 'homework_list'
+    path('homeworks/grade/', views.grade_homeworks_batch, name='grade_homeworks_batch'),
+    path('homeworks/request-revision/', views.request_revision_batch, name='request_revision_batch'),
     path('homework/<int:homework_id>/', views.homework_detail, name='homework_detail'),
     path('homework/<int:homework_id>/grade/', views.grade_homework, name='grade_homework'),
     path('homework/<int:homework_id>/request-revision/', views.request_revision, name='request_revision'),
     path('homework/<int:homework_id>/download/', views.download_homework_zip, name='download_homework_zip'),
     path('attachment/<int:attachment_id>/download/', views.download_attachment, name='download_attachment'),
     
+    # Загрузка вложений частями
+    path('homework/<int:homework_id>/uploads/', views.upload_start, name='upload_start'),
+    path('uploads/<uuid:upload_id>/', views.upload_chunk, name='upload_chunk'),
+    path('uploads/<uuid:upload_id>/finalize/', views.upload_finalize, name='upload_finalize'),
+    
     # Курсы и задания
     path('course/<int:course_id>/assignments/', views.course_assignments, name='course_assignments'),
     path('assignment/<int:assignment_id>/', views.assignment_detail, name='assignment_detail'),
+    path('assignment/<int:assignment_id>/autograde/', views.autograde_test, name='autograde_test'),
+    path('assignment/<int:assignment_id>/download/', views.download_assignment_zip, name='download_assignment_zip'),
+    
+    # Чат курса (WebSocket обслуживается в mysite/asgi.py по пути /ws/chat/<room_id>/)
+    path('chat/<int:room_id>/events/', views.chat_events, name='chat_events'),
+    path('chat/<int:room_id>/send/', views.chat_send, name='chat_send'),
+    path('chat/<int:room_id>/messages/', views.chat_history, name='chat_history'),
+    
+    # SCORM пакеты
+    path('course/<int:course_id>/scorm/', views.scorm_upload, name='scorm_upload'),
+    path('scorm/<int:package_id>/', views.scorm_launch, name='scorm_launch'),
+    path('scorm/<int:package_id>/<str:token>/<path:path>', views.scorm_file, name='scorm_file'),
+    
+    # Поиск
+    path('search/', views.search, name='search'),
     
     # Журнал успеваемости
     path('gradebook/', views.gradebook, name='gradebook'),
     path('gradebook/course/<int:course_id>/', views.gradebook, name='gradebook_course'),
     
+    # Метрики Prometheus
+    path('metrics/', views.metrics, name='metrics'),
+    
     # Прогресс студента
     path('student/<int:student_id>/progress/', views.student_progress, name='student_progress'),
 ] + staticfiles_urlpatterns()
\ No newline at end of file
@@ -1,19 +1,48 @@
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth import login, authenticate
 from django.contrib.auth.forms import AuthenticationForm
-from django.contrib.auth.decorators import login_required, user_passes_test
+from django.contrib.auth.decorators import login_required
 from django.contrib import messages
+from django.db import transaction
 from django.db.models import Count, Q
-from django.http import JsonResponse, HttpResponse, FileResponse
-from django.views.decorators.http import require_POST, require_GET
-from django.core.paginator import Paginator
+from django.db.models.expressions import RawSQL
+from django.http import Http404, JsonResponse, HttpResponse, StreamingHttpResponse
+from django.urls import reverse
+from django.views.decorators.http import require_POST, require_GET, require_http_methods
+from django.views.decorators.clickjacking import xframe_options_sameorigin
 from django.utils import timezone
+from django.utils.http import urlencode
 from django.conf import settings
+from django.core.cache import cache
+from django.template.loader import render_to_string
+from django.utils.cache import get_conditional_response, patch_cache_control
+import hmac
+import json
 import os
-import zipfile
-import io
 from .forms import TeacherRegistrationForm, GradeForm
-from .models import Course, Assignment, Homework, Attachment, Grade, StudentGroup
+from .models import (
+    Course, CourseEnrollment, CourseStats, Assignment, Homework, Attachment, Grade, SCORMFile, SCORMPackage,
+    StudentCourseProgress, StudentGroup, UploadSession,
+)
+from .roles import teacher_required
+from .pagination import KeysetPaginator
+from .metrics import GRADING_ACTIONS, REGISTRY, metered_stream
+from .profiling import query_budget
+from .autograde import autograde_assignment
+from .chat import (
+    accessible_room, clean_message, database_sync_to_async, event_stream, history_page, parse_after, post_message,
+    sender_names,
+)
+from .grading import BatchError, grade_homeworks, request_revisions, revision_queryset
+from .dashboard import TeacherDashboard
+from .gradebook import RESPONSE_CACHE_TIMEOUT, build_gradebooks, gradebook_fingerprint
+from .exports import assignment_zip_stream, homework_zip_entries
+from .scorm import access_token, check_access_token, normalize_path, serve_entry
+from .search import HOMEWORK, KINDS, describe, matching_ids_sql, search_documents
+from .similarity import suspicious_pairs
+from .serving import RangeNotSatisfiable, requested_byte_range, serve_file
+from .uploads import UploadError, append_chunk, discard_upload, finalize_upload, max_chunk_size, start_upload
+from .zipstream import ZipStream
 import logging
 
 logger = logging.getLogger(__name__)
@@ -23,10 +52,6 @@ def home(request):
     """Домашняя страница - перенаправляет на вход"""
     return redirect('login')
 
-# Проверка, является ли пользователь преподавателем
-def is_teacher(user):
-    return user.groups.filter(name='Teacher').exists() or user.is_staff
-
 # страницы для входа, регистрации
 def register(request):
     if request.method == 'POST':
@@ -62,70 +87,39 @@ def user_login(request):
     return render(request, 'accounts/login.html', {'form': form})
 
 @login_required
+@query_budget(8)
 def teacher_dashboard(request):
     """Панель управления преподавателя"""
-    # Получаем курсы преподавателя
-    courses = Course.objects.filter(teacher=request.user).prefetch_related('assignments')
-    
-    # Добавляем статистику для каждого курса
-    for course in courses:
-        # Считаем студентов в курсе
-        course.students_count = course.students.count()
-        # Считаем задания в курсе
-        course.assignments_count = course.assignments.count()
-        # Считаем задания на проверке для этого курса
-        course.pending_count = Homework.objects.filter(
-            assignment__course=course,
-            status='submitted'
-        ).count()
-    
-    # Получаем домашние задания для таблицы (с пагинацией)
-    homeworks = Homework.objects.filter(
-        assignment__course__teacher=request.user
-    ).select_related(
-        'student__user',
-        'assignment__course',
-        'grade'
-    ).order_by('-submitted_at')[:20]  # Показываем последние 20 заданий
-    
-    # Статистика
-    pending_count = Homework.objects.filter(
-        assignment__course__teacher=request.user,
-        status='submitted'
-    ).count()
-    
-    graded_count = Homework.objects.filter(
-        assignment__course__teacher=request.user,
-        status='graded'
-    ).count()
+    # Курсы, счетчики и последние работы запрашиваются лениво — только для
+    # фрагментов шаблона, которых нет в кэше или чьи теги инвалидированы
+    dashboard = TeacherDashboard(request.user)
     
     # Для наград (заглушки)
     total_points = 0  # Можно заменить на реальное значение
     
     context = {
         'user': request.user,
-        'courses': courses,
-        'homeworks': homeworks,  # Переименовал с submissions на homeworks
-        'pending_submissions_count': pending_count,
-        'graded_submissions_count': graded_count,
+        'dashboard': dashboard,
         'total_points': total_points,
     }
     return render(request, 'accounts/teacher_dashboard.html', context)
 
 @login_required
-@user_passes_test(is_teacher)
+@teacher_required
+@query_budget(8)
 def homework_list(request):
     """Список домашних заданий для проверки"""
     # Фильтрация
     status_filter = request.GET.get('status', 'all')
     course_filter = request.GET.get('course', 'all')
+    search_query = request.GET.get('q', '').strip()
     
     # Получаем задания для курсов преподавателя
     homeworks = Homework.objects.filter(
         assignment__course__teacher=request.user
     ).select_related(
-        'student', 'assignment', 'assignment__course'
-    ).order_by('-submitted_at')
+        'student__user', 'student__group', 'assignment__course', 'grade'
+    ).prefetch_related('attachments')
     
     # Применяем фильтры
     if status_filter != 'all':
@@ -134,25 +128,48 @@ def homework_list(request):
     if course_filter != 'all':
         homeworks = homeworks.filter(assignment__course_id=course_filter)
     
-    # Пагинация
-    paginator = Paginator(homeworks, 20)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
-    
-    # Получаем курсы для фильтра
-    courses = Course.objects.filter(teacher=request.user)
+    # Поиск по тексту ответа: id работ берутся из полнотекстового индекса
+    courses = list(Course.objects.filter(teacher=request.user).select_related('stats'))
+    if search_query:
+        matching = matching_ids_sql([course.id for course in courses], search_query, HOMEWORK)
+        homeworks = homeworks.filter(id__in=RawSQL(*matching)) if matching else homeworks.none()
+    
+    # Пагинация по курсору: без COUNT(*) и OFFSET
+    paginator = KeysetPaginator(homeworks, 20, 'submitted_at')
+    page_obj = paginator.get_page(request.GET.get('cursor'))
+    
+    # Приблизительные итоги берем из счетчиков курсов
+    stats = [
+        course.stats for course in courses
+        if hasattr(course, 'stats') and (course_filter == 'all' or str(course.id) == course_filter)
+    ]
+    counter = 'homeworks' if status_filter == 'all' else status_filter
+    total_count = sum(getattr(item, counter) for item in stats) if counter in CourseStats.COUNTERS else None
+    if search_query:
+        # Счетчики курсов не учитывают поиск
+        total_count = None
+    
+    filters = {key: value for key, value in (('status', status_filter), ('course', course_filter)) if value != 'all'}
+    if search_query:
+        filters['q'] = search_query
+    filter_query = urlencode(filters)
     
     context = {
         'page_obj': page_obj,
         'courses': courses,
         'status_filter': status_filter,
         'course_filter': course_filter,
+        'search_query': search_query,
         'status_choices': Homework.STATUS_CHOICES,
+        'filter_query': filter_query,
+        'total_count': total_count,
+        'pending_count': sum(item.submitted for item in stats),
+        'graded_count': sum(item.graded for item in stats),
     }
     return render(request, 'accounts/homework_list.html', context)
 
 @login_required
-@user_passes_test(is_teacher)
+@teacher_required
 def homework_detail(request, homework_id):
     """Детальная страница домашнего задания"""
     homework = get_object_or_404(
@@ -217,7 +234,7 @@ def homework_detail(request, homework_id):
     return render(request, 'accounts/homework.html', context)
 
 @login_required
-@user_passes_test(is_teacher)
+@teacher_required
 @require_POST
 def grade_homework(request, homework_id):
     """API для выставления оценки (AJAX)"""
@@ -248,21 +265,23 @@ def grade_homework(request, homework_id):
                 'error': 'Оценка должна быть от 1 до 5'
             }, status=400)
         
-        # Создаем или обновляем оценку
-        grade, created = Grade.objects.update_or_create(
-            homework=homework,
-            defaults={
-                'grade_value': grade_value,
-                'points': points,
-                'comment': comment,
-                'teacher': request.user,
-                'graded_at': timezone.now()
-            }
-        )
-        
-        # Обновляем статус домашнего задания
-        homework.status = 'graded'
-        homework.save()
+        # Оценка и статус в одной транзакции: пересчеты курса выполняются один раз после фиксации
+        with transaction.atomic():
+            grade, created = Grade.objects.update_or_create(
+                homework=homework,
+                defaults={
+                    'grade_value': grade_value,
+                    'points': points,
+                    'comment': comment,
+                    'teacher': request.user,
+                    'graded_at': timezone.now()
+                }
+            )
+            
+            # Обновляем статус домашнего задания
+            homework.status = 'graded'
+            homework.save()
+        GRADING_ACTIONS.inc(action='grade')
         
         return JsonResponse({
             'success': True,
@@ -287,7 +306,29 @@ def grade_homework(request, homework_id):
         }, status=500)
 
 @login_required
-@user_passes_test(is_teacher)
+@teacher_required
+@require_POST
+@query_budget(16)
+def grade_homeworks_batch(request):
+    """API для выставления оценок сразу нескольким работам (JSON-список)"""
+    try:
+        items = json.loads(request.body)
+        results = grade_homeworks(request.user, items)
+    except ValueError:
+        return JsonResponse({'success': False, 'error': 'Некорректный JSON'}, status=400)
+    except BatchError as e:
+        return JsonResponse({'success': False, 'error': str(e)}, status=400)
+    
+    graded = sum(1 for result in results if result['success'])
+    return JsonResponse({
+        'success': graded == len(results),
+        'graded': graded,
+        'failed': len(results) - graded,
+        'results': results,
+    })
+
+@login_required
+@teacher_required
 @require_POST
 def request_revision(request, homework_id):
     """Запрос доработки домашнего задания"""
@@ -321,6 +362,7 @@ def request_revision(request, homework_id):
         # Изменяем статус домашнего задания на "на доработке"
         homework.status = 'revision'
         homework.save()
+        GRADING_ACTIONS.inc(action='revision')
         
         return JsonResponse({
             'success': True,
@@ -336,8 +378,47 @@ def request_revision(request, homework_id):
             'error': f'Ошибка при отправке запроса: {str(e)}'
         }, status=500)
 
+
 @login_required
-@user_passes_test(is_teacher)
+@teacher_required
+@require_POST
+@query_budget(16)
+def request_revision_batch(request):
+    """Запрос доработки сразу для выбранных работ или для фильтра списка работ.
+
+    Тело запроса — JSON: {"comment": ..., "homework_ids": [...]} или
+    {"comment": ..., "filter": {"status": ..., "course": ...}}; все работы —
+    только явным фильтром {"status": "all"}.
+    """
+    try:
+        data = json.loads(request.body)
+        if not isinstance(data, dict):
+            raise BatchError('Ожидается JSON-объект')
+        filters = data.get('filter') or {}
+        if 'homework_ids' not in data and not isinstance(filters, dict):
+            raise BatchError('Укажите работы или фильтр')
+        homeworks = revision_queryset(
+            request.user,
+            homework_ids=data.get('homework_ids'),
+            status=filters.get('status') if 'homework_ids' not in data else None,
+            course=filters.get('course') if 'homework_ids' not in data else None,
+        )
+        homework_ids = request_revisions(request.user, str(data.get('comment') or '').strip(), homeworks)
+    except ValueError:
+        return JsonResponse({'success': False, 'error': 'Некорректный JSON'}, status=400)
+    except BatchError as e:
+        return JsonResponse({'success': False, 'error': str(e)}, status=400)
+    
+    return JsonResponse({
+        'success': True,
+        'message': f'На доработку отправлено работ: {len(homework_ids)}',
+        'updated': len(homework_ids),
+        'homework_ids': homework_ids,
+        'status': 'revision',
+        'status_display': 'На доработке',
+    })
+@login_required
+@teacher_required
 def download_attachment(request, attachment_id):
     """Скачивание отдельного файла"""
     attachment = get_object_or_404(
@@ -348,63 +429,316 @@ def download_attachment(request, attachment_id):
     
     file_path = attachment.file.path
     if os.path.exists(file_path):
-        response = FileResponse(
-            open(file_path, 'rb'),
-            content_type='application/octet-stream'
+        # ?inline=1 открывает в браузере PDF, картинки и текст; остальное только скачивается
+        return serve_file(
+            request,
+            file_path,
+            attachment.file.name,
+            attachment.file_name or os.path.basename(file_path),
+            inline=request.GET.get('inline') == '1'
         )
-        response['Content-Disposition'] = f'attachment; filename="{os.path.basename(file_path)}"'
-        return response
     
     return HttpResponse('Файл не найден', status=404)
 
+def upload_error_response(error):
+    return JsonResponse({
+        'success': False,
+        'error': str(error),
+        'offset': error.offset
+    }, status=error.status)
+
+@login_required
+@require_POST
+def upload_start(request, homework_id):
+    """Начало загрузки вложения частями (загружает сам студент)"""
+    homework = get_object_or_404(Homework, id=homework_id, student__user=request.user)
+    
+    try:
+        total_size = int(request.POST.get('total_size', ''))
+        session = start_upload(homework, request.user, request.POST.get('file_name'), total_size)
+    except ValueError:
+        return JsonResponse({
+            'success': False,
+            'error': 'Некорректный размер файла'
+        }, status=400)
+    except UploadError as e:
+        return upload_error_response(e)
+    
+    return JsonResponse({
+        'success': True,
+        'upload_id': str(session.pk),
+        'offset': session.offset,
+        'max_chunk_size': max_chunk_size()
+    }, status=201)
+
+@login_required
+@require_http_methods(['GET', 'PUT', 'DELETE'])
+def upload_chunk(request, upload_id):
+    """Состояние загрузки (GET), очередная часть (PUT) или отмена (DELETE)"""
+    session = get_object_or_404(UploadSession, pk=upload_id, user=request.user)
+    
+    if request.method == 'DELETE':
+        discard_upload(session)
+        return JsonResponse({'success': True})
+    
+    if request.method == 'PUT':
+        checksum = request.headers.get('X-Chunk-SHA256', '')
+        try:
+            offset = int(request.headers.get('X-Upload-Offset', ''))
+            length = int(request.headers.get('Content-Length', ''))
+            if not checksum:
+                raise ValueError
+        except ValueError:
+            return JsonResponse({
+                'success': False,
+                'error': 'Нужны заголовки X-Upload-Offset, Content-Length и X-Chunk-SHA256',
+                'offset': session.offset
+            }, status=400)
+        try:
+            append_chunk(session, offset, request, length, checksum)
+        except UploadError as e:
+            return upload_error_response(e)
+    
+    return JsonResponse({
+        'success': True,
+        'offset': session.offset,
+        'total_size': session.total_size,
+        'completed': session.completed
+    })
+
+@login_required
+@require_POST
+def upload_finalize(request, upload_id):
+    """Завершение загрузки: создание вложения"""
+    session = get_object_or_404(
+        UploadSession.objects.select_related('homework'),
+        pk=upload_id,
+        user=request.user
+    )
+    
+    try:
+        attachment = finalize_upload(session)
+    except UploadError as e:
+        return upload_error_response(e)
+    
+    return JsonResponse({
+        'success': True,
+        'attachment_id': attachment.id,
+        'file_name': attachment.file_name,
+        'file_size': attachment.file_size
+    }, status=201)
+
 @login_required
-@user_passes_test(is_teacher)
+@teacher_required
 def download_homework_zip(request, homework_id):
     """Скачивание всех файлов домашнего задания в ZIP"""
     homework = get_object_or_404(
-        Homework.objects.prefetch_related('attachments'),
+        Homework.objects.select_related(
+            'student__user', 'student__group', 'assignment__course'
+        ).prefetch_related('attachments'),
         id=homework_id,
         assignment__course__teacher=request.user
     )
     
-    # Создаем ZIP архив в памяти
-    zip_buffer = io.BytesIO()
-    with zipfile.ZipFile(zip_buffer, 'w', zipfile.ZIP_DEFLATED) as zip_file:
-        # Добавляем файлы вложений
-        for attachment in homework.attachments.all():
-            file_path = attachment.file.path
-            if os.path.exists(file_path):
-                zip_file.write(
-                    file_path,
-                    os.path.basename(file_path)
-                )
-        
-        # Добавляем текстовый ответ, если есть
-        if homework.text_content:
-            zip_file.writestr('text_answer.txt', homework.text_content)
-        
-        # Добавляем информацию о задании
-        info = f"""
-        Студент: {homework.student.user.get_full_name()}
-        Группа: {homework.student.group.name if homework.student.group else 'Не указана'}
-        Задание: {homework.assignment.title}
-        Курс: {homework.assignment.course.title}
-        Дата сдачи: {homework.submitted_at.strftime('%d.%m.%Y %H:%M')}
-        Статус: {homework.get_status_display()}
-        """
-        zip_file.writestr('info.txt', info)
-    
-    zip_buffer.seek(0)
-    
-    response = HttpResponse(
-        zip_buffer.getvalue(),
+    # Архив собирается по мере отправки, файлы читаются блоками
+    response = StreamingHttpResponse(
+        metered_stream(ZipStream(homework_zip_entries(homework)), 'homework'),
         content_type='application/zip'
     )
     response['Content-Disposition'] = f'attachment; filename="homework_{homework_id}_{homework.student.user.username}.zip"'
     return response
 
 @login_required
-@user_passes_test(is_teacher)
+@teacher_required
+def download_assignment_zip(request, assignment_id):
+    """Скачивание всех работ по заданию одним архивом с поддержкой докачки"""
+    assignment = get_object_or_404(
+        Assignment.objects.select_related('course'),
+        id=assignment_id,
+        course__teacher=request.user
+    )
+    
+    stream = assignment_zip_stream(assignment)
+    try:
+        byte_range = requested_byte_range(request, stream.size, stream.etag)
+    except RangeNotSatisfiable:
+        response = HttpResponse(status=416)
+        response['Content-Range'] = f'bytes */{stream.size}'
+        return response
+    
+    if byte_range is None:
+        response = StreamingHttpResponse(metered_stream(stream, 'assignment'), content_type='application/zip')
+        response['Content-Length'] = stream.size
+    else:
+        start, end = byte_range
+        response = StreamingHttpResponse(
+            metered_stream(stream.iter_range(start, end), 'assignment'), content_type='application/zip', status=206
+        )
+        response['Content-Length'] = end - start + 1
+        response['Content-Range'] = f'bytes {start}-{end}/{stream.size}'
+    response['Accept-Ranges'] = 'bytes'
+    response['ETag'] = stream.etag
+    response['Content-Disposition'] = f'attachment; filename="assignment_{assignment.id}_submissions.zip"'
+    return response
+
+@login_required
+@teacher_required
+@require_POST
+def autograde_test(request, assignment_id):
+    """Автоматическая проверка сданных ответов теста; overwrite=1 — и уже проверенных"""
+    assignment = get_object_or_404(
+        Assignment.objects.select_related('course'),
+        id=assignment_id,
+        course__teacher=request.user
+    )
+    if assignment.assignment_type != 'test':
+        return JsonResponse({
+            'success': False,
+            'error': 'Автоматическая проверка доступна только для тестов'
+        }, status=400)
+    
+    overwrite = request.POST.get('overwrite') == '1'
+    result = autograde_assignment(assignment, teacher=request.user, overwrite=overwrite)
+    return JsonResponse({
+        'success': True,
+        'message': f'Проверено работ: {result.graded}',
+        'graded': result.graded,
+        'max_points': result.max_points,
+    })
+
+async def chat_events(request, room_id):
+    """Сообщения комнаты потоком Server-Sent Events (замена WebSocket)"""
+    room = await database_sync_to_async(accessible_room)(request.user, room_id)
+    if room is None:
+        return JsonResponse({'success': False, 'error': 'Нет доступа к комнате'}, status=403)
+    after_id = parse_after(request.headers.get('Last-Event-ID') or request.GET.get('after'))
+    response = StreamingHttpResponse(event_stream(room.id, after_id), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    # Иначе nginx буферизует поток и сообщения приходят пачками
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+@login_required
+@require_POST
+def chat_send(request, room_id):
+    """Отправка сообщения в комнату для клиентов SSE"""
+    room = accessible_room(request.user, room_id)
+    if room is None:
+        return JsonResponse({'success': False, 'error': 'Нет доступа к комнате'}, status=403)
+    try:
+        data = json.loads(request.body)
+    except ValueError:
+        return JsonResponse({'success': False, 'error': 'Некорректный JSON'}, status=400)
+    text = clean_message(data.get('message') if isinstance(data, dict) else None)
+    if not text:
+        return JsonResponse({'success': False, 'error': 'Пустое сообщение'}, status=400)
+    message = post_message(request.user, room, text)
+    return JsonResponse({'success': True, 'id': message.id})
+
+@login_required
+@require_GET
+def chat_history(request, room_id):
+    """Страница истории комнаты: ?before=<id> — старше, ?after=<id> — новее, без них — последние.
+
+    Сообщения — [id, отправитель, текст] в порядке отправки, имена отправителей
+    передаются один раз в словаре senders.
+    """
+    room = accessible_room(request.user, room_id)
+    if room is None:
+        return JsonResponse({'success': False, 'error': 'Нет доступа к комнате'}, status=403)
+    try:
+        before = int(request.GET['before']) if 'before' in request.GET else None
+        after = int(request.GET['after']) if 'after' in request.GET else None
+    except ValueError:
+        return JsonResponse({'success': False, 'error': 'Некорректный id сообщения'}, status=400)
+    rows, has_more = history_page(
+        room.id, before=before, after=after, limit=getattr(settings, 'CHAT_HISTORY_PAGE_SIZE', 50)
+    )
+    names = sender_names(room.id, [sender_id for _, sender_id, _ in rows])
+    return JsonResponse(
+        {
+            'success': True,
+            'messages': rows,
+            'senders': {str(sender_id): name for sender_id, name in names.items()},
+            'has_more': has_more,
+        },
+        json_dumps_params={'ensure_ascii': False, 'separators': (',', ':')},
+    )
+
+@login_required
+@teacher_required
+@require_POST
+def scorm_upload(request, course_id):
+    """Загрузка SCORM пакета: манифест и индекс файлов строятся сразу после сохранения"""
+    course = get_object_or_404(Course, id=course_id, teacher=request.user)
+    package_file = request.FILES.get('package')
+    if package_file is None:
+        return JsonResponse({'success': False, 'error': 'Выберите файл пакета'}, status=400)
+    title = request.POST.get('title', '').strip() or os.path.splitext(package_file.name)[0]
+    # Индекс строит обработчик on_commit сигнала post_save: вне транзакции — до возврата из create
+    package = SCORMPackage.objects.create(
+        course=course, title=title[:200], package_file=package_file, uploaded_by=request.user,
+    )
+    error = package.__dict__.pop('_index_error', None)
+    if error:
+        package.package_file.delete(save=False)
+        package.delete()
+        return JsonResponse({'success': False, 'error': error}, status=400)
+    return JsonResponse({
+        'success': True,
+        'id': package.id,
+        'version': package.version,
+        'files': package.files.count(),
+        'launch_url': reverse('scorm_launch', args=[package.id]),
+    })
+
+def scorm_package_for(request, package_id):
+    package = get_object_or_404(SCORMPackage.objects.select_related('course'), id=package_id)
+    if not package.course.has_member(request.user) or package.indexed_at is None:
+        raise Http404
+    return package
+
+@xframe_options_sameorigin
+@login_required
+@require_GET
+def scorm_launch(request, package_id):
+    """Плеер пакета: точка входа из манифеста во фрейме-песочнице по ссылке с токеном доступа"""
+    package = scorm_package_for(request, package_id)
+    if not package.launch_path:
+        raise Http404
+    path, _, query = package.launch_path.partition('?')
+    url = reverse('scorm_file', args=[package.id, access_token(package, request.user), path])
+    user = request.user
+    return render(request, 'accounts/scorm_player.html', {
+        'package': package,
+        'launch_url': f'{url}?{query}' if query else url,
+        # cmi.core.student_name в SCORM 1.2: «Фамилия, Имя»
+        'learner_name': ', '.join(filter(None, [user.last_name, user.first_name])) or user.username,
+    })
+
+@xframe_options_sameorigin
+@require_GET
+def scorm_file(request, package_id, token, path):
+    """Файл из SCORM пакета: доступ по токену из scorm_launch, один запрос к индексу и чтение со смещения"""
+    if check_access_token(token, package_id) is None:
+        raise Http404
+    package = get_object_or_404(SCORMPackage, id=package_id, indexed_at__isnull=False)
+    entry = get_object_or_404(SCORMFile, package=package, path=normalize_path(path) or '')
+    return serve_entry(request, package, entry)
+
+@login_required
+@teacher_required
+@require_GET
+def search(request):
+    """Полнотекстовый поиск по курсам преподавателя: ?q=...&kind=homework|grade|assignment|chat"""
+    query = request.GET.get('q', '').strip()
+    kinds = [KINDS[kind] for kind in request.GET.getlist('kind') if kind in KINDS]
+    course_ids = Course.objects.filter(teacher=request.user).values_list('id', flat=True)
+    results = search_documents(course_ids, query, kinds) if query else []
+    return JsonResponse({'success': True, 'query': query, 'results': describe(results)})
+
+@login_required
+@teacher_required
 def course_assignments(request, course_id):
     """Задания курса"""
     course = get_object_or_404(
@@ -422,7 +756,7 @@ def course_assignments(request, course_id):
     return render(request, 'accounts/course_assignments.html', context)
 
 @login_required
-@user_passes_test(is_teacher)
+@teacher_required
 def assignment_detail(request, assignment_id):
     """Детали задания и список работ студентов"""
     assignment = get_object_or_404(
@@ -443,6 +777,17 @@ def assignment_detail(request, assignment_id):
     submitted_count = homeworks.filter(status__in=['submitted', 'graded', 'revision']).count()
     graded_count = homeworks.filter(status='graded').count()
     
+    # Подозрительно похожие ответы: пары по убыванию похожести
+    pairs = suspicious_pairs(assignment.id)
+    paired = Homework.objects.filter(
+        id__in={homework_id for pair in pairs for homework_id in pair[1:]}
+    ).select_related('student__user').in_bulk()
+    suspicious = [
+        {'similarity': round(score, 2), 'first': paired[first], 'second': paired[second]}
+        for score, first, second in pairs
+        if first in paired and second in paired
+    ]
+    
     context = {
         'assignment': assignment,
         'homeworks': homeworks,
@@ -450,107 +795,93 @@ def assignment_detail(request, assignment_id):
         'submitted_count': submitted_count,
         'graded_count': graded_count,
         'pending_count': submitted_count - graded_count,
+        'suspicious_pairs': suspicious,
     }
     return render(request, 'accounts/assignment_detail.html', context)
 
 @login_required
-@user_passes_test(is_teacher)
+@teacher_required
+@query_budget(10)
 def student_progress(request, student_id):
-    """Прогресс студента по всем курсам"""
-    # Здесь должна быть логика получения прогресса студента
-    # Для MVP можно вернуть заглушку
+    """Прогресс студента по курсам преподавателя"""
+    progress = StudentCourseProgress.objects.filter(
+        student_id=student_id, course__teacher=request.user
+    ).select_related('course', 'student__user', 'student__group').order_by('course__title')
+    courses = list(progress)
+    if not courses:
+        enrolled = list(CourseEnrollment.objects.filter(
+            student_id=student_id, course__teacher=request.user, is_active=True
+        ).values_list('course_id', flat=True))
+        if not enrolled:
+            raise Http404('Студент не записан на ваши курсы')
+        # Прогресс еще не построен (например, до запуска rebuild_student_progress); бюджет рассчитан на этот путь
+        StudentCourseProgress.refresh(enrolled, [student_id])
+        courses = list(progress.all())
+    
+    student = courses[0].student
     context = {
-        'student': {'name': 'Иванов Алексей'},
-        'courses': [],
+        'student': {
+            'id': student.id,
+            'name': student.full_name,
+            'group': student.group.name if student.group else '',
+        },
+        'courses': courses,
     }
     return render(request, 'accounts/student_progress.html', context)
 
 @login_required
-@user_passes_test(is_teacher)
+@teacher_required
+@query_budget(8)
 def gradebook(request, course_id=None):
-    """Журнал успеваемости"""
+    """Журнал успеваемости.
+    
+    Ответ зависит только от версий журналов курсов: при совпадении ETag
+    отвечаем 304, иначе отдаем отрисованную страницу из кэша и строим журнал
+    заново только после изменения оценок, работ, заданий или зачислений.
+    """
     if course_id:
         course = get_object_or_404(Course, id=course_id, teacher=request.user)
         courses = [course]
     else:
-        courses = Course.objects.filter(teacher=request.user)
-    
-    gradebook_data = []
-    for course in courses:
-        students = course.students.select_related('user').all()
-        assignments = course.assignments.all()
-        
-        for student in students:
-            student_grades = []
-            total_points = 0
-            max_points = 0
-            
-            for assignment in assignments:
-                try:
-                    homework = Homework.objects.get(
-                        assignment=assignment,
-                        student=student
-                    )
-                    if homework.grade:
-                        grade = homework.grade.points
-                        total_points += grade
-                        max_points += assignment.max_points
-                        student_grades.append({
-                            'assignment': assignment.title,
-                            'grade': grade,
-                            'max': assignment.max_points,
-                            'status': homework.get_status_display()
-                        })
-                    else:
-                        student_grades.append({
-                            'assignment': assignment.title,
-                            'grade': None,
-                            'max': assignment.max_points,
-                            'status': homework.get_status_display()
-                        })
-                except Homework.DoesNotExist:
-                    student_grades.append({
-                        'assignment': assignment.title,
-                        'grade': None,
-                        'max': assignment.max_points,
-                        'status': 'Не сдано'
-                    })
-            
-            if max_points > 0:
-                progress = (total_points / max_points) * 100
-            else:
-                progress = 0
+        courses = list(Course.objects.filter(teacher=request.user))
+    
+    # Без CSRF-cookie страница выдаст новый токен — такой ответ не кэшируется
+    csrf_secret = request.META.get('CSRF_COOKIE', '')
+    fingerprint = gradebook_fingerprint(request.user.id, courses, course_id, csrf_secret)
+    etag = f'"{fingerprint}"'
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        cache_key = f'accounts:gradebook:{fingerprint}'
+        content = cache.get(cache_key) if csrf_secret else None
+        if content is None:
+            gradebooks = build_gradebooks(courses)
+            gradebook_data = [row for course_gradebook in gradebooks for row in course_gradebook]
             
-            gradebook_data.append({
-                'student': student.user.get_full_name(),
-                'group': student.group.name if student.group else '',
-                'grades': student_grades,
-                'total_points': total_points,
-                'max_points': max_points,
-                'progress': progress,
-                'final_grade': calculate_final_grade(progress)
-            })
-    
-    context = {
-        'courses': courses,
-        'gradebook_data': gradebook_data,
-        'selected_course_id': course_id,
-    }
-    return render(request, 'accounts/gradebook.html', context)
-
-def calculate_final_grade(progress):
-    """Рассчитывает итоговую оценку на основе прогресса"""
-    if progress >= 85:
-        return 5
-    elif progress >= 70:
-        return 4
-    elif progress >= 55:
-        return 3
-    elif progress >= 40:
-        return 2
-    else:
-        return 1
+            context = {
+                'courses': courses,
+                'gradebooks': gradebooks,
+                'gradebook_data': gradebook_data,
+                'selected_course_id': course_id,
+            }
+            content = render_to_string('accounts/gradebook.html', context, request)
+            if csrf_secret:
+                cache.set(cache_key, content, RESPONSE_CACHE_TIMEOUT)
+        response = HttpResponse(content)
+    if csrf_secret:
+        response['ETag'] = etag
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
 
 def home(request):
     return redirect('login')
 
+@require_GET
+def metrics(request):
+    """Метрики в текстовом формате Prometheus: по токену METRICS_TOKEN или для персонала"""
+    # Адрес клиента за nginx всегда локальный, поэтому доступ дает только токен
+    token = getattr(settings, 'METRICS_TOKEN', None)
+    scheme, _, credentials = request.headers.get('Authorization', '').partition(' ')
+    allowed = bool(token) and scheme.lower() == 'bearer' and hmac.compare_digest(credentials.encode(), token.encode())
+    if not allowed and not request.user.is_staff:
+        return HttpResponse(status=403)
+    return HttpResponse(REGISTRY.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
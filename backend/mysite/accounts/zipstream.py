@@ -0,0 +1,350 @@
+"""Потоковая запись ZIP-архивов без буферизации архива в памяти.
+
+Архив отдается по частям: локальный заголовок, данные файла, дескриптор данных
+(CRC и размеры становятся известны только после чтения), затем центральный
+каталог. Большие файлы и архивы записываются в формате ZIP64.
+"""
+import hashlib
+import io
+import os
+import struct
+import time
+import zlib
+
+CHUNK_SIZE = 64 * 1024
+ZIP64_LIMIT = 0xFFFFFFFF
+ZIP_FILECOUNT_LIMIT = 0xFFFF
+
+ZIP_STORED = 0
+ZIP_DEFLATED = 8
+
+# Форматы, которые уже сжаты: повторный deflate только тратит процессор
+STORED_EXTENSIONS = {
+    '.zip', '.rar', '.7z', '.gz', '.bz2', '.xz',
+    '.jpg', '.jpeg', '.png', '.gif', '.webp', '.heic',
+    '.mp3', '.mp4', '.m4a', '.mov', '.avi', '.mkv', '.webm', '.ogg',
+    '.pdf', '.docx', '.xlsx', '.pptx', '.odt', '.ods', '.odp',
+}
+
+FLAG_DATA_DESCRIPTOR = 0x08
+FLAG_UTF8 = 0x800
+
+LOCAL_HEADER = struct.Struct('<IHHHHHIIIHH')
+CENTRAL_HEADER = struct.Struct('<IHHHHHHIIIHHHHHII')
+DATA_DESCRIPTOR = struct.Struct('<IIII')
+DATA_DESCRIPTOR64 = struct.Struct('<IIQQ')
+END_RECORD = struct.Struct('<IHHHHIIH')
+END_RECORD64 = struct.Struct('<IQHHIIQQQQ')
+END_LOCATOR64 = struct.Struct('<IIQI')
+
+
+def dos_datetime(date_time):
+    """Переводит кортеж (год, месяц, день, час, минута, секунда) в формат MS-DOS"""
+    year, month, day, hour, minute, second = date_time[:6]
+    year = max(year, 1980)
+    dos_date = (year - 1980) << 9 | month << 5 | day
+    dos_time = hour << 11 | minute << 5 | second // 2
+    return dos_time, dos_date
+
+
+class ZipEntry:
+    """Файл архива: путь на диске или байты в памяти"""
+    __slots__ = ('arcname', 'path', 'data', 'size', 'mtime_ns', 'date_time', 'compress_type')
+
+    def __init__(self, arcname, path=None, data=None, date_time=None, compress=None):
+        if (path is None) == (data is None):
+            raise ValueError('Нужно указать либо path, либо data')
+        self.arcname = arcname
+        self.path = path
+        if isinstance(data, str):
+            data = data.encode('utf-8')
+        self.data = data
+        if path is not None:
+            stat = os.stat(path)
+            self.size = stat.st_size
+            self.mtime_ns = stat.st_mtime_ns
+            if date_time is None:
+                date_time = time.localtime(stat.st_mtime)
+        else:
+            self.size = len(data)
+            self.mtime_ns = None
+        self.date_time = tuple(date_time or time.localtime())[:6]
+        if compress is None:
+            compress = os.path.splitext(arcname)[1].lower() not in STORED_EXTENSIONS
+        self.compress_type = ZIP_DEFLATED if compress else ZIP_STORED
+
+    @property
+    def zip64(self):
+        # Запас на случай, если deflate увеличит несжимаемые данные
+        return self.size * 1.05 > ZIP64_LIMIT
+
+    def open(self):
+        if self.path is not None:
+            return open(self.path, 'rb')
+        return io.BytesIO(self.data)
+
+
+def local_header(entry, zip64):
+    """Локальный заголовок файла; CRC и размеры записываются в дескриптор после данных"""
+    name = entry.arcname.encode('utf-8')
+    dos_time, dos_date = dos_datetime(entry.date_time)
+    if zip64:
+        extra = struct.pack('<HHQQ', 0x0001, 16, 0, 0)
+        header_sizes = ZIP64_LIMIT
+    else:
+        extra = b''
+        header_sizes = 0
+    return LOCAL_HEADER.pack(
+        0x04034b50, 45 if zip64 else 20, FLAG_DATA_DESCRIPTOR | FLAG_UTF8, entry.compress_type,
+        dos_time, dos_date, 0, header_sizes, header_sizes, len(name), len(extra),
+    ) + name + extra
+
+
+def data_descriptor(crc, compress_size, file_size, zip64):
+    if zip64:
+        return DATA_DESCRIPTOR64.pack(0x08074b50, crc, compress_size, file_size)
+    return DATA_DESCRIPTOR.pack(0x08074b50, crc, compress_size, file_size)
+
+
+def central_directory(records, cd_offset):
+    """Центральный каталог и завершающие записи архива.
+
+    records — кортежи (entry, crc, compress_size, file_size, offset, zip64).
+    """
+    cd_size = 0
+    for entry, crc, compress_size, file_size, offset, zip64 in records:
+        name = entry.arcname.encode('utf-8')
+        dos_time, dos_date = dos_datetime(entry.date_time)
+        extra_values = []
+        if file_size >= ZIP64_LIMIT:
+            extra_values.append(file_size)
+            file_size = ZIP64_LIMIT
+        if compress_size >= ZIP64_LIMIT:
+            extra_values.append(compress_size)
+            compress_size = ZIP64_LIMIT
+        if offset >= ZIP64_LIMIT:
+            extra_values.append(offset)
+            offset = ZIP64_LIMIT
+        extra = b''
+        if extra_values:
+            extra = struct.pack(f'<HH{len(extra_values)}Q', 0x0001, 8 * len(extra_values), *extra_values)
+        version = 45 if zip64 or extra_values else 20
+        record = CENTRAL_HEADER.pack(
+            0x02014b50, version, version, FLAG_DATA_DESCRIPTOR | FLAG_UTF8, entry.compress_type,
+            dos_time, dos_date, crc, compress_size, file_size,
+            len(name), len(extra), 0, 0, 0, 0o100644 << 16, offset,
+        ) + name + extra
+        cd_size += len(record)
+        yield record
+
+    count = len(records)
+    end = b''
+    if count >= ZIP_FILECOUNT_LIMIT or cd_offset >= ZIP64_LIMIT or cd_size >= ZIP64_LIMIT:
+        end += END_RECORD64.pack(
+            0x06064b50, END_RECORD64.size - 12, 45, 45, 0, 0,
+            count, count, cd_size, cd_offset,
+        )
+        end += END_LOCATOR64.pack(0x07064b50, 0, cd_offset + cd_size, 1)
+    end += END_RECORD.pack(
+        0x06054b50, 0, 0,
+        min(count, ZIP_FILECOUNT_LIMIT), min(count, ZIP_FILECOUNT_LIMIT),
+        min(cd_size, ZIP64_LIMIT), min(cd_offset, ZIP64_LIMIT), 0,
+    )
+    yield end
+
+
+class ZipStream:
+    """Итератор по байтам ZIP-архива для StreamingHttpResponse.
+
+    В памяти одновременно находится не больше одного блока чтения
+    и внутренний буфер zlib, независимо от размера архива.
+    """
+
+    def __init__(self, entries, chunk_size=CHUNK_SIZE):
+        self.entries = list(entries)
+        self.chunk_size = chunk_size
+        self.bytes_written = 0
+
+    def __iter__(self):
+        for chunk in self._generate():
+            self.bytes_written += len(chunk)
+            yield chunk
+
+    def _generate(self):
+        offset = 0
+        records = []
+        for entry in self.entries:
+            zip64 = entry.zip64
+            header = local_header(entry, zip64)
+            yield header
+
+            crc = 0
+            file_size = 0
+            compress_size = 0
+            compressor = None
+            if entry.compress_type == ZIP_DEFLATED:
+                compressor = zlib.compressobj(zlib.Z_DEFAULT_COMPRESSION, zlib.DEFLATED, -15)
+            with entry.open() as source:
+                while True:
+                    chunk = source.read(self.chunk_size)
+                    if not chunk:
+                        break
+                    crc = zlib.crc32(chunk, crc)
+                    file_size += len(chunk)
+                    if compressor is not None:
+                        chunk = compressor.compress(chunk)
+                        if not chunk:
+                            continue
+                    compress_size += len(chunk)
+                    yield chunk
+            if compressor is not None:
+                chunk = compressor.flush()
+                compress_size += len(chunk)
+                yield chunk
+
+            if not zip64 and (file_size > ZIP64_LIMIT or compress_size > ZIP64_LIMIT):
+                raise RuntimeError(f'Файл {entry.arcname} изменился во время архивации')
+
+            descriptor = data_descriptor(crc, compress_size, file_size, zip64)
+            yield descriptor
+
+            records.append((entry, crc, compress_size, file_size, offset, zip64))
+            offset += len(header) + compress_size + len(descriptor)
+        yield from central_directory(records, offset)
+
+
+class RangeZipStream:
+    """Архив без сжатия с заранее известной раскладкой.
+
+    Все файлы хранятся без deflate, поэтому размер архива и смещение каждого
+    байта вычисляются до начала передачи. Это позволяет отдать Content-Length
+    и обслужить запрос Range: нужный диапазон собирается из заголовков,
+    фрагментов файлов и центрального каталога без генерации предыдущих байтов.
+    CRC пропущенных файлов берутся из crc_cache или вычисляются чтением файла.
+    """
+
+    def __init__(self, entries, crc_cache=None, chunk_size=CHUNK_SIZE):
+        self.entries = list(entries)
+        self.crc_cache = crc_cache
+        self.chunk_size = chunk_size
+        self.bytes_written = 0
+        self._crcs = {}
+        self._segments = []
+        self._records = []
+
+        offset = 0
+        for index, entry in enumerate(self.entries):
+            entry.compress_type = ZIP_STORED
+            zip64 = entry.size >= ZIP64_LIMIT
+            header = local_header(entry, zip64)
+            self._add_segment(offset, 'bytes', header)
+            self._add_segment(offset + len(header), 'file', index, entry.size)
+            descriptor_size = DATA_DESCRIPTOR64.size if zip64 else DATA_DESCRIPTOR.size
+            self._add_segment(offset + len(header) + entry.size, 'descriptor', index, descriptor_size)
+            self._records.append((offset, zip64))
+            offset += len(header) + entry.size + descriptor_size
+
+        self.cd_offset = offset
+        # Длина центрального каталога не зависит от CRC, считаем ее по нулевым значениям
+        cd_size = sum(len(chunk) for chunk in central_directory(self._central_records(lambda index: 0), offset))
+        self._add_segment(offset, 'central', None, cd_size)
+        self.size = offset + cd_size
+
+    def _add_segment(self, start, kind, payload, length=None):
+        if length is None:
+            length = len(payload)
+        self._segments.append((start, length, kind, payload))
+
+    def _central_records(self, crc_of):
+        return [
+            (entry, crc_of(index), entry.size, entry.size, offset, zip64)
+            for index, (entry, (offset, zip64)) in enumerate(zip(self.entries, self._records))
+        ]
+
+    @property
+    def etag(self):
+        """Строгий ETag: совпадает, только если раскладка архива не изменилась"""
+        digest = hashlib.sha1()
+        for entry in self.entries:
+            digest.update(f'{entry.arcname}\0{entry.size}\0{entry.mtime_ns}\0{entry.date_time}\0'.encode())
+            if entry.data is not None:
+                digest.update(entry.data)
+        return f'"{digest.hexdigest()}"'
+
+    def __iter__(self):
+        return self.iter_range(0, self.size - 1)
+
+    def iter_range(self, start, end):
+        """Байты архива с start по end включительно"""
+        for chunk in self._generate(start, end + 1):
+            self.bytes_written += len(chunk)
+            yield chunk
+
+    def _generate(self, start, stop):
+        for segment_start, length, kind, payload in self._segments:
+            segment_stop = segment_start + length
+            if segment_stop <= start or length == 0:
+                continue
+            if segment_start >= stop:
+                break
+            low = max(start, segment_start) - segment_start
+            high = min(stop, segment_stop) - segment_start
+            if kind == 'bytes':
+                yield payload[low:high]
+            elif kind == 'file':
+                yield from self._read_file(payload, low, high)
+            elif kind == 'descriptor':
+                entry = self.entries[payload]
+                offset, zip64 = self._records[payload]
+                yield data_descriptor(self._crc(payload), entry.size, entry.size, zip64)[low:high]
+            else:
+                directory = b''.join(central_directory(self._central_records(self._crc), self.cd_offset))
+                yield directory[low:high]
+
+    def _read_file(self, index, low, high):
+        entry = self.entries[index]
+        whole = low == 0 and high == entry.size
+        crc = 0
+        with entry.open() as source:
+            source.seek(low)
+            remaining = high - low
+            while remaining > 0:
+                chunk = source.read(min(self.chunk_size, remaining))
+                if not chunk:
+                    raise RuntimeError(f'Файл {entry.arcname} изменился во время архивации')
+                if whole:
+                    crc = zlib.crc32(chunk, crc)
+                remaining -= len(chunk)
+                yield chunk
+        if whole:
+            self._remember_crc(index, crc)
+
+    def _cache_key(self, entry):
+        if entry.path is None:
+            return None
+        raw = f'{entry.path}:{entry.size}:{entry.mtime_ns}'.encode('utf-8')
+        return 'zipstream:crc:' + hashlib.sha1(raw).hexdigest()
+
+    def _remember_crc(self, index, crc):
+        self._crcs[index] = crc
+        key = self._cache_key(self.entries[index])
+        if key and self.crc_cache is not None:
+            self.crc_cache.set(key, crc, None)
+
+    def _crc(self, index):
+        if index in self._crcs:
+            return self._crcs[index]
+        entry = self.entries[index]
+        key = self._cache_key(entry)
+        crc = self.crc_cache.get(key) if key and self.crc_cache is not None else None
+        if crc is None:
+            crc = 0
+            with entry.open() as source:
+                while True:
+                    chunk = source.read(self.chunk_size)
+                    if not chunk:
+                        break
+                    crc = zlib.crc32(chunk, crc)
+            self._remember_crc(index, crc)
+        self._crcs[index] = crc
+        return crc
@@ -3,6 +3,7 @@ Django settings for mysite project.
 """
 
 import os
+import sys
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -14,6 +15,8 @@ FRONTEND_DIR = BASE_DIR.parent.parent / 'frontend'  # Исправлено!
 # Quick-start development settings - unsuitable for production
 SECRET_KEY = 'django-insecure-gfwlyy4tjl8_^)12=0gt^&_)9&ou$52t^g(g=v!nhg96yogqe='
 DEBUG = True
+# Запуск manage.py test
+TESTING = sys.argv[1:2] == ['test']
 ALLOWED_HOSTS = []
 
 # Application definition
@@ -29,6 +32,8 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'accounts.metrics.MetricsMiddleware',
+    'accounts.profiling.RequestProfilingMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -99,6 +104,49 @@ STATICFILES_DIRS = [
 
 STATIC_ROOT = BASE_DIR / 'staticfiles'  # Для сбора статики в продакшене
 
+# Загруженные файлы (вложения домашних работ)
+MEDIA_URL = '/media/'
+MEDIA_ROOT = BASE_DIR / 'media'
+
+# Отдача вложений: 'python' (Django), 'nginx' (X-Accel-Redirect) или 'apache' (X-Sendfile)
+ATTACHMENT_SERVE_BACKEND = 'python'
+# internal-локация nginx, указывающая на MEDIA_ROOT
+ATTACHMENT_ACCEL_PREFIX = '/protected-media/'
+ATTACHMENT_CACHE_MAX_AGE = 3600
+
+# Профилирование запросов: доля профилируемых запросов, порог повторов для N+1
+# и строгий режим для тестов (превышение query_budget — ошибка). Тесты проверяют
+# бюджеты в строгом режиме, а лог каждого запроса им не нужен
+REQUEST_PROFILE_SAMPLE_RATE = 0.0 if TESTING else 1.0 if DEBUG else 0.05
+REQUEST_PROFILE_DUPLICATE_THRESHOLD = 5
+REQUEST_PROFILE_STRICT = False
+
+# Метрики Prometheus: каталог для агрегации между воркерами (None — один процесс),
+# частота сброса значений процесса в файл и токен, с которым endpoint доступен
+# без входа (Authorization: Bearer <токен>); без токена — только персоналу
+METRICS_MULTIPROCESS_DIR = os.environ.get('METRICS_MULTIPROCESS_DIR')
+METRICS_FLUSH_INTERVAL = 1.0
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN')
+
+# Чат: брокер сообщений (реализация accounts.chat.Broker), длина очереди
+# одного подключения, интервал комментариев-пингов в потоке SSE (секунды)
+# и размер страницы истории
+CHAT_BROKER = 'accounts.chat.LocalBroker'
+CHAT_SUBSCRIBER_QUEUE_SIZE = 256
+CHAT_SSE_HEARTBEAT = 15
+CHAT_HISTORY_PAGE_SIZE = 50
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'accounts.profiling': {'handlers': ['console'], 'level': 'INFO', 'propagate': False},
+    },
+}
+
 # Default primary key field type
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
@@ -0,0 +1,95 @@
+// Мост к API SCORM для страниц пакета. Сервер подключает его первым скриптом в каждую
+// HTML-страницу пакета. Страница открыта в песочнице без allow-same-origin и не может
+// обратиться к window.API плеера, поэтому API 1.2 (window.API) и 2004 (window.API_1484_11)
+// создаются в самой странице. Вызовы синхронные: значения хранятся здесь, изменения
+// уходят плееру js/scorm-player.js через postMessage, а при загрузке он присылает данные попытки
+(function() {
+    const values = {};
+    let lastError = '0';
+
+    // Плеер — один из предков страницы, но какой именно, из песочницы не узнать
+    function ancestors() {
+        const result = [];
+        for (let win = window; win !== win.parent; win = win.parent) {
+            result.push(win.parent);
+        }
+        return result;
+    }
+
+    function send(message) {
+        ancestors().forEach(function(win) {
+            win.postMessage(message, '*');
+        });
+    }
+
+    window.addEventListener('message', function(event) {
+        const data = event.data;
+        if (!data || data.scorm !== 'state' || ancestors().indexOf(event.source) === -1) {
+            return;
+        }
+        // Значения, записанные страницей до ответа плеера, новее присланных
+        Object.keys(data.values || {}).forEach(function(element) {
+            if (!(element in values)) {
+                values[element] = data.values[element];
+            }
+        });
+    });
+
+    function success() {
+        lastError = '0';
+        return 'true';
+    }
+
+    function getValue(element) {
+        lastError = '0';
+        return element in values ? values[element] : '';
+    }
+
+    function setValue(element, value) {
+        values[element] = String(value);
+        send({ scorm: 'set', element: String(element), value: String(value) });
+        return success();
+    }
+
+    function commit() {
+        send({ scorm: 'commit' });
+        return success();
+    }
+
+    function finish() {
+        send({ scorm: 'finish' });
+        return success();
+    }
+
+    function getLastError() {
+        return lastError;
+    }
+
+    function getErrorString() {
+        return '';
+    }
+
+    window.API = {
+        LMSInitialize: success,
+        LMSFinish: finish,
+        LMSGetValue: getValue,
+        LMSSetValue: setValue,
+        LMSCommit: commit,
+        LMSGetLastError: getLastError,
+        LMSGetErrorString: getErrorString,
+        LMSGetDiagnostic: getErrorString
+    };
+
+    window.API_1484_11 = {
+        Initialize: success,
+        Terminate: finish,
+        GetValue: getValue,
+        SetValue: setValue,
+        Commit: commit,
+        GetLastError: getLastError,
+        GetErrorString: getErrorString,
+        GetDiagnostic: getErrorString
+    };
+
+    send({ scorm: 'ready' });
+})();
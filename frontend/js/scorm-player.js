@@ -0,0 +1,73 @@
+// Плеер SCORM: хранит данные попытки и отвечает мосту js/scorm-api.js в страницах пакета.
+// Пакет открыт в песочнице с непрозрачным источником и не видит window.API плеера,
+// поэтому все вызовы приходят сюда через postMessage
+(function() {
+    const frame = document.getElementById('scormFrame');
+    if (!frame) {
+        return;
+    }
+
+    const storageKey = 'scorm:' + frame.dataset.package;
+    const defaults = {
+        'cmi.core.lesson_status': 'not attempted',
+        'cmi.core.entry': 'ab-initio',
+        'cmi.completion_status': 'unknown',
+        'cmi.success_status': 'unknown',
+        'cmi.entry': 'ab-initio'
+    };
+    const learner = {
+        'cmi.core.student_id': frame.dataset.learnerId,
+        'cmi.core.student_name': frame.dataset.learnerName,
+        'cmi.learner_id': frame.dataset.learnerId,
+        'cmi.learner_name': frame.dataset.learnerName
+    };
+
+    // Данные попытки живут до закрытия вкладки: переходы между страницами пакета их не сбрасывают
+    let values = {};
+    try {
+        values = JSON.parse(sessionStorage.getItem(storageKey)) || {};
+    } catch (e) {
+        values = {};
+    }
+
+    function save() {
+        try {
+            sessionStorage.setItem(storageKey, JSON.stringify(values));
+        } catch (e) {
+            console.warn('Не удалось сохранить данные SCORM:', e);
+        }
+    }
+
+    // Страница пакета или вложенный в нее фрейм: parent доступен и у окна с чужим источником
+    function fromPackage(source) {
+        for (let win = source; win; win = win.parent) {
+            if (win === frame.contentWindow) {
+                return true;
+            }
+            if (win === win.parent) {
+                return false;
+            }
+        }
+        return false;
+    }
+
+    window.addEventListener('message', function(event) {
+        const data = event.data;
+        if (!data || typeof data.scorm !== 'string' || !fromPackage(event.source)) {
+            return;
+        }
+
+        if (data.scorm === 'ready') {
+            event.source.postMessage({
+                scorm: 'state',
+                values: Object.assign({}, defaults, values, learner)
+            }, '*');
+        } else if (data.scorm === 'set' && typeof data.element === 'string') {
+            if (!(data.element in learner)) {
+                values[data.element] = String(data.value);
+            }
+        } else if (data.scorm === 'commit' || data.scorm === 'finish') {
+            save();
+        }
+    });
+})();